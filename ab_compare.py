@@ -0,0 +1,311 @@
+#!/usr/bin/python
+
+'''
+Compares two variants of an experiment by interleaving them.  Running
+all of one variant and then all of the other lets drift between the two
+batches (cpu temperature, noisy neighbours on shared hosts) pass for a
+difference between them.  Instead, each block runs one short run of
+each variant, in random order, on the same warm infrastructure, and the
+comparison is made on the per-block differences (b - a): drift that is
+slow next to a block cancels out of every pair.
+
+After each block, a t interval for the mean difference decides whether
+to go on:
+
+    significant  --- the interval excludes 0
+    equivalent   --- the interval lies within +-margin of 0, where
+                     margin is a fraction of variant a's mean
+    inconclusive --- neither, after max_blocks blocks
+
+Since the interval is looked at after every block, each look uses
+confidence Bonferroni-adjusted for the number of looks the comparison
+could make, so that stopping early keeps the overall error rate.
+
+Standard library only (plus experiments.py for the local comparisons),
+so that dist/ scripts can compare too.
+'''
+
+import os
+import random
+
+import convergence
+import stat_util
+
+A, B = 'a', 'b'
+SIGNIFICANT, EQUIVALENT, INCONCLUSIVE = (
+    'significant', 'equivalent', 'inconclusive')
+
+DEFAULT_CONFIDENCE = .95
+DEFAULT_MIN_BLOCKS = 3
+DEFAULT_MAX_BLOCKS = 20
+# differences smaller than this fraction of variant a's mean are too
+# small to matter
+DEFAULT_EQUIVALENCE_MARGIN = .02
+NANOSECONDS_PER_SECOND = 1e9
+
+
+def row_throughputs(csv_fname):
+    '''
+    @returns {list} --- Operations per second of each row of a result
+    file of per-operation latencies in ns, without warmup the run
+    recorded.  @see analysis.row_throughputs
+    '''
+    with open(csv_fname, 'r') as fd:
+        rows = [stat_util.parse_samples(line.strip().strip(','))
+                for line in fd]
+    rows = convergence.drop_row_warmup(
+        [row for row in rows if len(row) != 0],
+        convergence.read_row_warmup(csv_fname))
+    to_return = []
+    for samples in rows:
+        if (len(samples) != 0) and (sum(samples) > 0):
+            to_return.append(
+                len(samples) * NANOSECONDS_PER_SECOND / sum(samples))
+    return to_return
+
+
+def throughput_metric(csv_fname):
+    return sum(row_throughputs(csv_fname))
+
+
+def fairness_metric(csv_fname):
+    '''
+    @returns {float} --- Jain's fairness index of the rows' throughputs.
+    @see analysis.jain_fairness
+    '''
+    x = row_throughputs(csv_fname)
+    if len(x) == 0:
+        return float('nan')
+    return sum(x) ** 2 / (len(x) * sum(value ** 2 for value in x))
+
+
+def look_confidence(confidence, min_blocks, max_blocks):
+    '''
+    @returns {float} --- Confidence each look at the interval needs for
+    the whole comparison to have confidence.
+    '''
+    num_looks = max(max_blocks - min_blocks + 1, 1)
+    return 1 - (1 - confidence) / float(num_looks)
+
+
+def decide(differences, margin, confidence):
+    '''
+    @param {list} differences --- Per-block b - a; at least two.
+
+    @param {float} margin --- Absolute equivalence margin.
+
+    @returns {tuple} --- (decision, mean, low, high); decision is
+    INCONCLUSIVE if the interval decides neither way.
+    '''
+    m, low, high = stat_util.paired_t_interval(differences, confidence)
+    if (low > 0) or (high < 0):
+        return SIGNIFICANT, m, low, high
+    if (-margin < low) and (high < margin):
+        return EQUIVALENT, m, low, high
+    return INCONCLUSIVE, m, low, high
+
+
+class ABResult(object):
+    def __init__(self, label_a, label_b, confidence):
+        self.label_a = label_a
+        self.label_b = label_b
+        self.confidence = confidence
+        # each element is a dict describing one block that ran
+        self.blocks = []
+        self.decision = INCONCLUSIVE
+        self.mean = self.low = self.high = float('nan')
+
+    def paired(self):
+        return [block for block in self.blocks if block['difference'] is not None]
+
+    def differences(self):
+        return [block['difference'] for block in self.paired()]
+
+    def variant_mean(self, variant):
+        values = [block[variant] for block in self.paired()]
+        if len(values) == 0:
+            return float('nan')
+        return stat_util.mean(values)
+
+    def report(self):
+        print '\n%s (a) vs %s (b): %s after %i paired blocks (%i run)' % (
+            self.label_a, self.label_b, self.decision, len(self.paired()),
+            len(self.blocks))
+        print '  mean a %16.4f' % self.variant_mean(A)
+        print '  mean b %16.4f' % self.variant_mean(B)
+        print '  b - a  %16.4f  [%.4f, %.4f] at %.4f per look\n' % (
+            self.mean, self.low, self.high, self.confidence)
+
+    def write(self, fname):
+        '''
+        One row per block, then the decision.  @see sidecar_fname
+        '''
+        def field(value):
+            if value is None:
+                return ''
+            return str(value)
+        with open(fname, 'w') as fd:
+            fd.write('block,first,a,b,difference\n')
+            for block in self.blocks:
+                fd.write(','.join(field(block[key]) for key in (
+                    'block', 'first', A, B, 'difference')) + '\n')
+            fd.write('# %s vs %s: %s, b - a %s [%s, %s] at %s\n' % (
+                self.label_a, self.label_b, self.decision, self.mean,
+                self.low, self.high, self.confidence))
+
+
+def ab_compare(run_a, run_b, metric, label_a=A, label_b=B,
+               confidence=DEFAULT_CONFIDENCE, min_blocks=DEFAULT_MIN_BLOCKS,
+               max_blocks=DEFAULT_MAX_BLOCKS,
+               margin=DEFAULT_EQUIVALENCE_MARGIN, seed=None):
+    '''
+    @param {function} run_a --- Takes a block number, runs variant a
+    once, and returns its result file, or None if the run failed.
+
+    @param {function} run_b --- Likewise for variant b.
+
+    @param {function} metric --- Takes a result file and returns the
+    run's result as a float.
+
+    @param {int} min_blocks --- Paired blocks to run before deciding
+    anything.
+
+    @param {int} max_blocks --- Blocks to run at most, counting blocks
+    where a run failed (those are dropped, not retried).
+
+    @param {float} margin --- Equivalence margin as a fraction of
+    variant a's mean.
+
+    @param {int or None} seed --- For the order within blocks.
+
+    @returns {ABResult}
+    '''
+    rand = random.Random(seed)
+    min_blocks = max(min_blocks, 2)
+    per_look = look_confidence(confidence, min_blocks, max_blocks)
+    result = ABResult(label_a, label_b, per_look)
+    runners = {A: run_a, B: run_b}
+
+    for block_num in range(max_blocks):
+        order = [A, B]
+        rand.shuffle(order)
+        block = {'block': block_num, 'first': order[0], A: None, B: None,
+                 'difference': None}
+        for variant in order:
+            print '\nBlock %i: running %s\n' % (
+                block_num, label_a if variant == A else label_b)
+            fname = runners[variant](block_num)
+            if fname is None:
+                break
+            try:
+                value = metric(fname)
+            except (IOError, OSError, ValueError) as ex:
+                print '\nNo result for %s: %s\n' % (fname, ex)
+                break
+            # nan if the file had no samples
+            if value != value:
+                break
+            block[variant] = value
+        if (block[A] is not None) and (block[B] is not None):
+            block['difference'] = block[B] - block[A]
+        result.blocks.append(block)
+
+        differences = result.differences()
+        if len(differences) < min_blocks:
+            continue
+        result.decision, result.mean, result.low, result.high = decide(
+            differences, margin * abs(result.variant_mean(A)), per_look)
+        if result.decision != INCONCLUSIVE:
+            break
+
+    result.report()
+    return result
+
+
+def experiment_runner(make_experiment, fabric):
+    '''
+    @param {function} make_experiment --- Takes no arguments and returns
+    the variant's Experiment.
+
+    @returns {function} --- Runs a fresh experiment on fabric each time,
+    with the block number added to its result file's name.  @see
+    ab_compare
+    '''
+    def run(block_num):
+        exp = make_experiment()
+        base, ext = os.path.splitext(exp.output_file)
+        exp.rename_output('%s-block%i%s' % (base, block_num, ext))
+        exp.run(fabric)
+        if not exp.produced_results():
+            return None
+        return exp.output_file
+    return run
+
+
+def compare_experiments(task, make_a, make_b, metric, label_a=A, label_b=B,
+                        **kwargs):
+    '''
+    Compare two Experiments on one Fabric.  The catalog is ignored while
+    comparing: every block reruns points it may already have.  The
+    blocks are written to a .comparison file in task's data directory.
+
+    @param kwargs --- @see ab_compare
+
+    @returns {ABResult}
+    '''
+    # needs mininet; dist comparisons do not
+    import experiments
+    catalog = experiments.CATALOG
+    experiments.CATALOG = None
+    try:
+        with experiments.Fabric() as fabric:
+            result = ab_compare(
+                experiment_runner(make_a, fabric),
+                experiment_runner(make_b, fabric),
+                metric, label_a, label_b, **kwargs)
+    finally:
+        experiments.CATALOG = catalog
+    result.write(experiments.sidecar_fname(
+        experiments.output_data_fname(task, '%s-vs-%s' % (label_a, label_b)),
+        'comparison'))
+    return result
+
+
+# Blocks are short: many short interleaved runs beat a few long ones
+AB_FAIRNESS_NUM_OPS = 5000
+def compare_fairness(**kwargs):
+    from experiments import FairnessExperiment
+    task = 'FairnessComparison'
+    return compare_experiments(
+        task,
+        lambda: FairnessExperiment(task,AB_FAIRNESS_NUM_OPS,False),
+        lambda: FairnessExperiment(task,AB_FAIRNESS_NUM_OPS,True),
+        fairness_metric, 'ralph', 'wound_wait', **kwargs)
+
+
+AB_THROUGHPUT_NUM_SWITCHES = 10
+AB_THROUGHPUT_NUM_OPS_PER_THREAD = 5000
+AB_THROUGHPUT_NUM_WARMUP_OPS_PER_THREAD = 5000
+def compare_coarse_lock(num_switches=AB_THROUGHPUT_NUM_SWITCHES, **kwargs):
+    from experiments import ThroughputExperiment
+    from experiments import output_data_fname
+    task = 'CoarseLockComparison'
+    def make(coarse_locking, label):
+        def make_experiment():
+            exp = ThroughputExperiment(
+                num_switches,task,coarse_locking,
+                1,AB_THROUGHPUT_NUM_OPS_PER_THREAD,
+                AB_THROUGHPUT_NUM_WARMUP_OPS_PER_THREAD)
+            # both variants would otherwise be named by num_switches
+            exp.rename_output(output_data_fname(
+                task, '%s-%i' % (label, num_switches)))
+            return exp
+        return make_experiment
+    return compare_experiments(
+        task, make(False, 'fine_lock'), make(True, 'coarse_lock'),
+        throughput_metric, 'fine_lock', 'coarse_lock', **kwargs)
+
+
+if __name__ == '__main__':
+    compare_fairness()
+    compare_coarse_lock()
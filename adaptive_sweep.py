@@ -0,0 +1,236 @@
+#!/usr/bin/python
+
+'''
+Sweeps that choose their own points.  Instead of running every value of
+a parameter, an adaptive sweep runs the ends and the middle of the
+range, then keeps splitting whichever interval the curve bends most
+around: where throughput saturates or latency inflects, straight-line
+interpolation between measured points is worst.  It stops once every
+measured point lies within tolerance of the line through its
+neighbours, so flat stretches get few runs.
+
+    points = adaptive_sweep(
+        lambda threads: LatencyExperiment(
+            'adaptive_latency_contention', 2, 30000, 0, threads),
+        range(1, 33), latency_metric(99), tolerance=.05)
+
+Noise between runs of one point bounds how small a useful tolerance
+is; below it, the sweep refines noise.
+'''
+
+import analysis
+import experiments
+from experiments import Fabric, LatencyExperiment, ThroughputExperiment
+from experiments import ReadOnlyThroughputExperiment, warmup_ops
+from experiments import DEFAULT_NUM_OPERATIONS_PER_THREAD
+from experiments import DEFAULT_WARMUP_OPERATIONS_PER_THREAD
+from experiments import READ_ONLY_THROUGHPUT_NUM_OPS
+from experiments import READ_ONLY_THROUGHPUT_NUM_WARMUP_OPS
+
+DEFAULT_TOLERANCE = .05
+# points an adaptive sweep starts from: both ends and the middle
+NUM_INITIAL_POINTS = 3
+
+
+def throughput_metric(csv_fname):
+    '''
+    @returns {float} --- Total operations per second in a result file.
+    '''
+    values, offsets = analysis.load(csv_fname)
+    return float(analysis.throughput(values, offsets))
+
+
+def latency_metric(percentile=50):
+    '''
+    @returns {function} --- Takes a result file and returns the given
+    percentile of its per-operation latencies, in ns.
+    '''
+    def metric(csv_fname):
+        values, offsets = analysis.load(csv_fname)
+        return float(analysis.percentiles(values, [percentile])[0])
+    return metric
+
+
+def interpolation_errors(points):
+    '''
+    @param {list} points --- (index, metric) tuples sorted by index.
+
+    @returns {list} --- Element k is how far point k's metric is from
+    the line through points k - 1 and k + 1, as a fraction of the
+    largest metric.  Ends get 0.
+    '''
+    scale = max(abs(y) for x, y in points) or 1.
+    errors = [0.] * len(points)
+    for k in range(1, len(points) - 1):
+        (x0, y0), (x, y), (x1, y1) = points[k - 1], points[k], points[k + 1]
+        expected = y0 + (y1 - y0) * float(x - x0) / (x1 - x0)
+        errors[k] = abs(y - expected) / scale
+    return errors
+
+
+def next_index(points, tolerance):
+    '''
+    @returns {int or None} --- Index of the value to run next: the
+    middle of the interval with the largest interpolation error at
+    either end, among intervals that still have unmeasured values.
+    None if every such interval is within tolerance.
+    '''
+    errors = interpolation_errors(points)
+    best = None
+    for k in range(len(points) - 1):
+        left, right = points[k][0], points[k + 1][0]
+        if right - left < 2:
+            continue
+        # fewer than three points say nothing about curvature
+        score = max(errors[k], errors[k + 1])
+        if len(points) < NUM_INITIAL_POINTS:
+            score = float('inf')
+        if score <= tolerance:
+            continue
+        candidate = (score, right - left, (left + right) / 2)
+        if (best is None) or (candidate > best):
+            best = candidate
+    if best is None:
+        return None
+    return best[2]
+
+
+def adaptive_sweep(make_experiment, values, metric,
+                   tolerance=DEFAULT_TOLERANCE, max_runs=None, fabric=None):
+    '''
+    @param {function} make_experiment --- Takes one of values and
+    returns the Experiment for that point.
+
+    @param {list} values --- Candidate parameter values, in order.
+
+    @param {function} metric --- Takes a result file and returns the
+    point's result as a float.  Points the catalog skips are measured
+    from their earlier result file.
+
+    @param {float} tolerance --- Stop once interpolating between
+    neighbouring measured points is off by at most this fraction of the
+    curve's largest value.
+
+    @param {int or None} max_runs --- If non-None, stop after this many
+    runs even if the curve is not resolved.
+
+    @param {Fabric or None} fabric --- If non-None, run on this fabric
+    and leave it up.  Otherwise, use one fabric for the whole sweep.
+
+    @returns {list} --- (value, metric) for every point that ran and
+    produced results, in value order.
+    '''
+    if fabric is None:
+        with Fabric() as fabric:
+            return adaptive_sweep(
+                make_experiment, values, metric, tolerance, max_runs, fabric)
+
+    values = list(values)
+    # index into values -> metric; None if the run failed
+    measured = {}
+
+    def run(index):
+        exp = make_experiment(values[index])
+        print '\nRunning %s (adaptive point %i)\n' % (
+            exp.output_file, len(measured) + 1)
+        exp.run(fabric)
+        csv_fname = exp.output_file
+        if experiments.CATALOG is not None:
+            csv_fname = experiments.CATALOG.lookup(exp) or csv_fname
+        measured[index] = None
+        try:
+            y = metric(csv_fname)
+        except (IOError, OSError, ValueError) as ex:
+            print '\nNo result for %s: %s\n' % (csv_fname, ex)
+            return
+        # nan if the file had no samples
+        if y == y:
+            measured[index] = y
+
+    last = len(values) - 1
+    for index in sorted(set([0, last / 2, last])):
+        run(index)
+    while (max_runs is None) or (len(measured) < max_runs):
+        points = sorted(
+            (index, y) for index, y in measured.items() if y is not None)
+        if len(points) == 0:
+            break
+        index = next_index(points, tolerance)
+        if index is None:
+            break
+        if index in measured:
+            # the midpoint failed before; split on either side of it
+            # instead of retrying
+            unmeasured = [
+                i for i in range(len(values)) if i not in measured]
+            if len(unmeasured) == 0:
+                break
+            index = min(unmeasured, key=lambda i: abs(i - index))
+        run(index)
+
+    return [
+        (values[index], y) for index, y in sorted(measured.items())
+        if y is not None]
+
+
+def print_points(name, points):
+    print '\n%s: %i runs' % (name, len(points))
+    for value, y in points:
+        print '%10s %16.3f' % (value, y)
+
+
+ADAPTIVE_MAX_THREADS = 32
+def adaptive_latency_contention(tolerance=DEFAULT_TOLERANCE):
+    points = adaptive_sweep(
+        lambda threads: LatencyExperiment(
+            'adaptive_latency_contention',
+            2,DEFAULT_NUM_OPERATIONS_PER_THREAD,
+            warmup_ops(DEFAULT_WARMUP_OPERATIONS_PER_THREAD),threads,
+            convergence_rule=experiments.CONVERGENCE_RULE),
+        range(1, ADAPTIVE_MAX_THREADS + 1), latency_metric(99), tolerance)
+    print_points('p99 latency (ns) by threads', points)
+    return points
+
+
+def adaptive_throughput_contention(tolerance=DEFAULT_TOLERANCE):
+    points = adaptive_sweep(
+        lambda num_threads: ThroughputExperiment(
+            1,'AdaptiveContentionThroughput',False,
+            num_threads,DEFAULT_NUM_OPERATIONS_PER_THREAD,
+            warmup_ops(DEFAULT_WARMUP_OPERATIONS_PER_THREAD),
+            num_threads,convergence_rule=experiments.CONVERGENCE_RULE),
+        range(1, ADAPTIVE_MAX_THREADS + 1), throughput_metric, tolerance)
+    print_points('throughput (ops/s) by threads', points)
+    return points
+
+
+ADAPTIVE_READ_ONLY_MAX_SWITCHES = 6
+ADAPTIVE_READ_ONLY_MAX_THREADS = 16
+def adaptive_read_only_throughput(tolerance=DEFAULT_TOLERANCE):
+    '''
+    One adaptive sweep over threads per switch count, in place of
+    read_only_throughput's full grid.
+
+    @returns {dict} --- Number of switches -> points.
+    '''
+    to_return = {}
+    with Fabric() as fabric:
+        for num_switches in range(1, ADAPTIVE_READ_ONLY_MAX_SWITCHES + 1):
+            to_return[num_switches] = adaptive_sweep(
+                lambda num_threads: ReadOnlyThroughputExperiment(
+                    'AdaptiveReadOnlyThroughput',num_switches,
+                    READ_ONLY_THROUGHPUT_NUM_OPS,
+                    warmup_ops(READ_ONLY_THROUGHPUT_NUM_WARMUP_OPS),
+                    num_threads,convergence_rule=experiments.CONVERGENCE_RULE),
+                range(1, ADAPTIVE_READ_ONLY_MAX_THREADS + 1),
+                throughput_metric, tolerance, fabric=fabric)
+            print_points(
+                'throughput (ops/s) by threads, %i switches' % num_switches,
+                to_return[num_switches])
+    return to_return
+
+
+if __name__ == '__main__':
+    adaptive_throughput_contention()
+    adaptive_latency_contention()
+    adaptive_read_only_throughput()
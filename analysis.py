@@ -0,0 +1,287 @@
+#!/usr/bin/python
+
+'''
+Vectorized analysis of experiment result csvs.
+
+Each result file is parsed once into two NumPy arrays, which are cached
+in binary sidecars next to the csv and memory-mapped on every later
+load:
+
+    <name>.values.npy --- every numeric field of every row, in order
+    <name>.rows.npy --- offsets into values; row i is
+                        values[rows[i]:rows[i + 1]]
+
+A row holds one thread's (or switch's) samples.  Unless noted, samples
+are per-operation latencies in nanoseconds.  Runs with a convergence
+rule keep their warmup in the csv; it is dropped here (see
+convergence.py).
+
+    python analysis.py <task data dir or task name> ...
+'''
+
+import glob
+import os
+import sys
+
+import numpy as np
+
+from paths import PAPER_DATA
+import stat_util
+import convergence
+
+DEFAULT_PERCENTILES = (50, 90, 99, 99.9)
+NANOSECONDS_PER_SECOND = 1e9
+
+
+def cache_fname(csv_fname, kind):
+    return '%s.%s.npy' % (os.path.splitext(csv_fname)[0], kind)
+
+
+def parse(csv_fname):
+    '''
+    @returns {tuple} --- (values, row offsets) parsed from the text of
+    csv_fname.  Rows without any numeric field (eg., headers) are
+    dropped, and so is each row's warmup, if the run recorded any.
+    '''
+    with open(csv_fname, 'r') as fd:
+        lines = [line.strip() for line in fd.read().splitlines()]
+    lines = [line.strip(',') for line in lines if len(line) != 0]
+
+    # fast path: every field is numeric, so numpy can parse the whole
+    # file in one call.
+    if (len(lines) != 0) and (len(stat_util.parse_samples(lines[0])) == 0):
+        lines = lines[1:]
+    counts = np.array([line.count(',') + 1 for line in lines], dtype=np.int64)
+    values = np.fromstring(','.join(lines), dtype=np.float64, sep=',')
+    if len(values) != counts.sum():
+        rows = [stat_util.parse_samples(line) for line in lines]
+        rows = [row for row in rows if len(row) != 0]
+        counts = np.array([len(row) for row in rows], dtype=np.int64)
+        values = np.array(
+            [sample for row in rows for sample in row], dtype=np.float64)
+
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    row_warmup = convergence.read_row_warmup(csv_fname)
+    if row_warmup is not None:
+        values, offsets = drop_row_warmup(values, offsets, row_warmup)
+    return values, offsets
+
+
+def drop_row_warmup(values, offsets, row_warmup):
+    '''
+    @param {list} row_warmup --- @see convergence.read_row_warmup
+
+    @returns {tuple} --- (values, row offsets) without the first
+    row_warmup[i] samples of each row i.
+    '''
+    counts = np.diff(offsets)
+    warmup = np.zeros(len(counts), dtype=np.int64)
+    num_rows = min(len(row_warmup), len(counts))
+    warmup[:num_rows] = np.minimum(row_warmup[:num_rows], counts[:num_rows])
+    keep = np.ones(len(values), dtype=bool)
+    for i in np.nonzero(warmup)[0]:
+        keep[offsets[i]:offsets[i] + warmup[i]] = False
+    trimmed = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts - warmup, out=trimmed[1:])
+    return values[keep], trimmed
+
+
+def load(csv_fname):
+    '''
+    @returns {tuple} --- (values, row offsets) for csv_fname,
+    memory-mapped from its binary sidecars.  Parses the csv (and writes
+    the sidecars) only if they are missing or older than the csv or its
+    .convergence sidecar.
+    '''
+    values_fname = cache_fname(csv_fname, 'values')
+    rows_fname = cache_fname(csv_fname, 'rows')
+    csv_mtime = os.path.getmtime(csv_fname)
+    convergence_fname = '%s.%s' % (
+        os.path.splitext(csv_fname)[0], convergence.SIDECAR_KIND)
+    if os.path.exists(convergence_fname):
+        csv_mtime = max(csv_mtime, os.path.getmtime(convergence_fname))
+    fresh = (
+        os.path.exists(values_fname) and os.path.exists(rows_fname) and
+        (os.path.getmtime(values_fname) >= csv_mtime) and
+        (os.path.getmtime(rows_fname) >= csv_mtime))
+
+    if not fresh:
+        values, offsets = parse(csv_fname)
+        np.save(values_fname, values)
+        np.save(rows_fname, offsets)
+    return (np.load(values_fname, mmap_mode='r'),
+            np.load(rows_fname, mmap_mode='r'))
+
+
+def task_dirs(task, data_root=PAPER_DATA):
+    '''
+    @param {String} task --- Either a directory holding results (eg.,
+    what experiments.data_dir returned) or a task name, in which case
+    every <data_root>/<task>-<start time> directory matches.
+
+    @returns {list} --- Matching directories, oldest first.
+    '''
+    if os.path.isdir(task):
+        return [task]
+    return sorted(
+        glob.glob(os.path.join(data_root, '%s-*' % task)),
+        key=lambda dirname: int(dirname.rsplit('-', 1)[1]))
+
+
+def load_task(task, data_root=PAPER_DATA):
+    '''
+    @returns {dict} --- Result file basename (without .csv) -> (values,
+    row offsets), for the newest directory of task.
+    '''
+    dirs = task_dirs(task, data_root)
+    if len(dirs) == 0:
+        return {}
+    to_return = {}
+    for csv_fname in sorted(glob.glob(os.path.join(dirs[-1], '*.csv'))):
+        label = os.path.splitext(os.path.basename(csv_fname))[0]
+        to_return[label] = load(csv_fname)
+    return to_return
+
+
+def percentiles(values, which=DEFAULT_PERCENTILES):
+    if len(values) == 0:
+        return np.full(len(which), np.nan)
+    return np.percentile(values, which)
+
+
+def row_sums(values, offsets):
+    '''
+    @returns {ndarray} --- Sum of each row.  Rows are never empty.
+    '''
+    if len(values) == 0:
+        return np.zeros(0)
+    return np.add.reduceat(values, offsets[:-1])
+
+
+def row_throughputs(values, offsets,
+                    units_per_second=NANOSECONDS_PER_SECOND):
+    '''
+    Each thread runs its operations back to back, so its throughput is
+    its number of operations over the sum of their latencies.
+
+    @returns {ndarray} --- Operations per second of each row.
+    '''
+    counts = np.diff(offsets)
+    return counts * units_per_second / row_sums(values, offsets)
+
+
+def throughput(values, offsets, units_per_second=NANOSECONDS_PER_SECOND):
+    '''
+    @returns {float} --- Total operations per second across all rows.
+    '''
+    return row_throughputs(values, offsets, units_per_second).sum()
+
+
+def jain_fairness(values, offsets, units_per_second=NANOSECONDS_PER_SECOND):
+    '''
+    Jain's fairness index of the rows' throughputs: 1 when every row
+    gets the same throughput, 1/n when one row gets all of it.
+    '''
+    x = row_throughputs(values, offsets, units_per_second)
+    if len(x) == 0:
+        return np.nan
+    return x.sum() ** 2 / (len(x) * (x ** 2).sum())
+
+
+def error_rate(values, is_failure):
+    '''
+    The jars record only each operation's latency, not whether it
+    failed, so there is no default way to tell failures apart.
+
+    @param {function} is_failure --- Takes the values array and returns
+    a boolean array marking failed operations.
+
+    @returns {float} --- Fraction of operations that failed.
+    '''
+    if len(values) == 0:
+        return np.nan
+    return np.count_nonzero(is_failure(values)) / float(len(values))
+
+
+def label_key(label):
+    '''
+    Sort key that orders labels like '5' < '10' and
+    'read_only_throughput-2-10' < 'read_only_throughput-10-1'.
+    '''
+    key = []
+    for part in label.replace('_', '-').split('-'):
+        try:
+            key.append((0, float(part), ''))
+        except ValueError:
+            key.append((1, 0, part))
+    return key
+
+
+def throughput_curve(task, data_root=PAPER_DATA,
+                     units_per_second=NANOSECONDS_PER_SECOND):
+    '''
+    @returns {list} --- (label, operations per second) for each result
+    file of task, in label order (eg., by number of switches).
+    '''
+    results = load_task(task, data_root)
+    return [
+        (label, throughput(values, offsets, units_per_second))
+        for label, (values, offsets) in sorted(
+            results.items(), key=lambda item: label_key(item[0]))]
+
+
+def latency_table(task, data_root=PAPER_DATA, which=DEFAULT_PERCENTILES):
+    '''
+    @returns {list} --- (label, array of percentiles) for each result
+    file of task, in label order (eg., by rtt and thread count).
+    '''
+    results = load_task(task, data_root)
+    return [
+        (label, percentiles(values, which))
+        for label, (values, offsets) in sorted(
+            results.items(), key=lambda item: label_key(item[0]))]
+
+
+def fairness_table(task, data_root=PAPER_DATA):
+    '''
+    @returns {list} --- (label, Jain's index) for each result file of
+    task; for FairnessExperiment, the labels are the wound_wait values.
+    '''
+    results = load_task(task, data_root)
+    return [
+        (label, jain_fairness(values, offsets))
+        for label, (values, offsets) in sorted(results.items())]
+
+
+def error_table(task, is_failure, data_root=PAPER_DATA):
+    '''
+    @param {function} is_failure --- As for error_rate.
+
+    @returns {list} --- (label, error rate) for each result file of
+    task; for ErrorExperiment, labels include the failure probability.
+    '''
+    results = load_task(task, data_root)
+    return [
+        (label, error_rate(values, is_failure))
+        for label, (values, offsets) in sorted(
+            results.items(), key=lambda item: label_key(item[0]))]
+
+
+def print_summary(task):
+    print '\n%s' % task
+    header = ' '.join('p%g' % p for p in DEFAULT_PERCENTILES)
+    print 'label,samples,ops/s,%s' % header.replace(' ', ',')
+    results = load_task(task)
+    for label, (values, offsets) in sorted(
+        results.items(), key=lambda item: label_key(item[0])):
+        print '%s,%i,%f,%s' % (
+            label, len(values), throughput(values, offsets),
+            ','.join('%f' % p for p in percentiles(values)))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print '\nUsage: analysis.py <task data dir or task name> ...\n'
+    for task in sys.argv[1:]:
+        print_summary(task)
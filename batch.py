@@ -0,0 +1,314 @@
+#!/usr/bin/python
+
+'''
+Describes a whole sweep in one manifest, so that a host can be handed
+many experiments in a single ssh session and run them on one shared
+Fabric.  A manifest is json:
+
+    {
+      "version": 1,
+      "convergence": {"sample_column": "every", "tolerance": 0.02},
+      "sweeps": [
+        {
+          "experiment": "LatencyExperiment",
+          "task": "single_controller_latency_contention",
+          "parameters": {"rtt": 2, "num_ops_per_thread": 30000,
+                         "num_warmup_ops_per_thread": 0},
+          "grid": {"num_threads": [1, 2, 4, 6, 8, 10]},
+          "output": "rtt{rtt}-{num_threads}threads"
+        }
+      ]
+    }
+
+experiment names an Experiment subclass in experiments.py.  Every
+combination of the grid's values, together with parameters, is passed
+to it as keyword arguments, with task as task_name.  output is optional:
+a format string over a point's arguments naming its result file in
+task's data directory; without it, the class names the file.
+convergence is optional: ConvergenceRule arguments, passed to every
+class that takes a convergence_rule.
+
+On the host, manage-host.py batch runs a manifest and writes one json
+line to stdout as each point finishes, carrying the point's result file
+and sidecars.  submit (or fab batch) sends a manifest to a host and
+saves those files locally as they arrive:
+
+    python batch.py submit manifest.json <local dir> ubuntu@host [ssh options]
+'''
+
+import base64
+import glob
+import itertools
+import json
+import os
+import subprocess
+import sys
+import zlib
+
+MANIFEST_VERSION = 1
+REMOTE_MANAGE_HOST = '/home/ubuntu/experiments/manage-host.py'
+# types of the json lines a batch writes: one START, a RESULT per point,
+# then DONE
+START, RESULT, DONE = 'start', 'result', 'done'
+OK, FAILED = 'ok', 'failed'
+
+
+class ManifestError(Exception):
+    pass
+
+
+def load_manifest(text):
+    '''
+    @returns {dict} --- The parsed manifest.
+
+    @throws {ManifestError} --- If text is not a manifest this version
+    can run.
+    '''
+    try:
+        manifest = json.loads(text)
+    except ValueError as ex:
+        raise ManifestError('Manifest is not json: %s' % ex)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ManifestError(
+            'Manifest version %s; can only run version %i' % (
+                manifest.get('version'), MANIFEST_VERSION))
+    for sweep in manifest.get('sweeps', []):
+        for field in ('experiment', 'task'):
+            if field not in sweep:
+                raise ManifestError('Sweep without %s: %s' % (field, sweep))
+    return manifest
+
+
+def expand(sweep):
+    '''
+    @returns {list} --- Keyword arguments of each point of sweep, in
+    grid order (last grid key varies fastest).
+    '''
+    grid = sweep.get('grid', {})
+    keys = sorted(grid.keys())
+    points = []
+    for values in itertools.product(*[grid[key] for key in keys]):
+        point = dict(sweep.get('parameters', {}))
+        point.update(zip(keys, values))
+        points.append(point)
+    return points
+
+
+def build_experiments(manifest):
+    '''
+    @returns {list} --- An Experiment for every point of every sweep.
+    '''
+    # needs mininet; submitting a manifest does not
+    import inspect
+    import experiments
+    from convergence import ConvergenceRule
+
+    rule = None
+    if manifest.get('convergence') is not None:
+        try:
+            rule = ConvergenceRule(**manifest['convergence'])
+        except (TypeError, ValueError) as ex:
+            raise ManifestError('Bad convergence rule: %s' % ex)
+
+    to_return = []
+    for sweep in manifest.get('sweeps', []):
+        cls = getattr(experiments, sweep['experiment'], None)
+        if not (inspect.isclass(cls) and issubclass(cls, experiments.Experiment)):
+            raise ManifestError('Unknown experiment %s' % sweep['experiment'])
+        takes_rule = 'convergence_rule' in inspect.getargspec(cls.__init__)[0]
+        for point in expand(sweep):
+            kwargs = dict(point)
+            kwargs['task_name'] = sweep['task']
+            if takes_rule and (rule is not None):
+                kwargs['convergence_rule'] = rule
+            try:
+                exp = cls(**kwargs)
+            except TypeError as ex:
+                raise ManifestError(
+                    'Bad arguments for %s: %s' % (sweep['experiment'], ex))
+            if 'output' in sweep:
+                exp.rename_output(experiments.output_data_fname(
+                    sweep['task'], sweep['output'].format(**point)))
+            to_return.append(exp)
+    return to_return
+
+
+def result_files(exp):
+    '''
+    @returns {list} --- exp's result file and sidecars that exist.
+    '''
+    base = os.path.splitext(exp.output_file)[0]
+    fnames = [exp.output_file] + sorted(glob.glob(base + '.*'))
+    return [
+        fname for fname in sorted(set(fnames)) if os.path.isfile(fname)]
+
+
+def encode_file(fname):
+    with open(fname, 'rb') as fd:
+        return base64.b64encode(zlib.compress(fd.read()))
+
+
+def encode_files(fnames, root):
+    '''
+    @returns {dict} --- Path relative to root -> encoded contents, for
+    each of fnames.  @see save_files
+    '''
+    return dict(
+        (os.path.relpath(fname, root), encode_file(fname)) for fname in fnames)
+
+
+def write_record(out, record):
+    out.write(json.dumps(record) + '\n')
+    out.flush()
+
+
+def run_batch(manifest, out, fabric=None):
+    '''
+    Run every point of manifest on one Fabric, writing a json line to
+    out as each finishes.  Points that fail are reported and skipped.
+
+    @param {Fabric or None} fabric --- If non-None, run on this fabric
+    and leave it up afterwards.  Otherwise, use one for this batch
+    only.
+
+    @returns {int} --- Number of failed points.
+    '''
+    import experiments
+    if fabric is None:
+        with experiments.Fabric() as fabric:
+            return run_batch(manifest, out, fabric)
+
+    exps = experiments.order_for_fabric(build_experiments(manifest))
+    write_record(out, {
+        'type': START, 'version': MANIFEST_VERSION, 'points': len(exps)})
+    num_failed = 0
+    for i, exp in enumerate(exps):
+        print '\nRunning %s\n' % exp.output_file
+        status = OK
+        error = None
+        try:
+            exp.run(fabric)
+            if not exp.produced_results():
+                status = FAILED
+        except Exception as ex:
+            status = FAILED
+            error = '%s: %s' % (ex.__class__.__name__, ex)
+        if status == FAILED:
+            num_failed += 1
+        write_record(out, {
+            'type': RESULT, 'index': i, 'status': status,
+            'error': error,
+            'output_file': os.path.relpath(
+                exp.output_file, experiments.PAPER_DATA),
+            'files': encode_files(result_files(exp), experiments.PAPER_DATA)})
+    write_record(out, {'type': DONE, 'failed': num_failed})
+    return num_failed
+
+
+def protocol_stream():
+    '''
+    @returns {file} --- This process's original stdout, for run_batch
+    to write to.  Everything else printed from now on (including the
+    controllers' echoed output) goes to stderr instead, so that it
+    cannot corrupt the stream.
+    '''
+    out = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    return out
+
+
+def save_files(record, local_dir):
+    '''
+    Write out the files of a record made with encode_files.
+    '''
+    for relpath, data in record['files'].items():
+        relpath = os.path.normpath(relpath)
+        if os.path.isabs(relpath) or relpath.startswith(os.pardir):
+            raise ManifestError('Result file outside data directory: %s' % relpath)
+        fname = os.path.join(local_dir, relpath)
+        dirname = os.path.dirname(fname)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(fname, 'wb') as fd:
+            fd.write(zlib.decompress(base64.b64decode(data)))
+
+
+def submit(ssh_cmd_vec, manifest_text, local_dir,
+           manage_host=REMOTE_MANAGE_HOST):
+    '''
+    Run a manifest on a host, saving each point's files under local_dir
+    (with the same layout as the host's data directory) as soon as the
+    point finishes.
+
+    @param {list} ssh_cmd_vec --- Command vector that opens an ssh
+    session to the host; the remote command is appended to it.
+
+    @returns {list} --- Each element is the record (without file
+    contents) of a point that failed, or did not report back before
+    the session ended.
+    '''
+    manifest = load_manifest(manifest_text)
+    num_points = sum(len(expand(sweep)) for sweep in manifest['sweeps'])
+    proc = subprocess.Popen(
+        ssh_cmd_vec + ['sudo %s batch -' % manage_host],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    proc.stdin.write(manifest_text)
+    proc.stdin.close()
+
+    reported = set()
+    failed = []
+    for line in iter(proc.stdout.readline, ''):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get('type') != RESULT:
+            continue
+        save_files(record, local_dir)
+        del record['files']
+        reported.add(record['index'])
+        print '%i/%i %s: %s' % (
+            len(reported), num_points, record['status'],
+            record['output_file'])
+        sys.stdout.flush()
+        if record['status'] != OK:
+            failed.append(record)
+    proc.wait()
+    for i in range(num_points):
+        if i not in reported:
+            failed.append({'index': i, 'status': FAILED, 'error': 'no result'})
+    return failed
+
+
+def print_usage():
+    print ('''
+
+  python batch.py submit <manifest> <local dir> <ssh destination> [ssh options]
+  python batch.py points <manifest>
+
+submit runs manifest on the host and saves results under local dir as
+they arrive.  points lists the points manifest expands to.
+
+''')
+
+
+if __name__ == '__main__':
+    if (len(sys.argv) >= 5) and (sys.argv[1] == 'submit'):
+        with open(sys.argv[2], 'r') as fd:
+            manifest_text = fd.read()
+        failed = submit(
+            ['ssh'] + sys.argv[5:] + [sys.argv[4]], manifest_text,
+            sys.argv[3])
+        if len(failed) != 0:
+            print '\n%i points failed\n' % len(failed)
+            sys.exit(1)
+    elif (len(sys.argv) == 3) and (sys.argv[1] == 'points'):
+        with open(sys.argv[2], 'r') as fd:
+            manifest = load_manifest(fd.read())
+        for sweep in manifest['sweeps']:
+            for point in expand(sweep):
+                print sweep['experiment'], sweep['task'], json.dumps(
+                    point, sort_keys=True)
+    else:
+        print_usage()
@@ -0,0 +1,133 @@
+#!/usr/bin/python
+
+'''
+Local catalog of finished experiment runs, so that a campaign can skip
+points it has already run and resume after a crash.
+
+A run is keyed by its experiment class, its full argument set
+(including its task and output name), the content hash of its jar and
+a profile of the host it ran on.  The
+catalog maps that key to the result file the run produced.
+'''
+
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from paths import PAPER_DATA
+
+DEFAULT_CATALOG_FNAME = os.path.join(PAPER_DATA, 'catalog.sqlite')
+# seconds to wait on another process's write lock
+SQLITE_TIMEOUT_SECONDS = 30
+HASH_CHUNK_SIZE = 1 << 20
+
+# (path, mtime, size) -> sha1 hex digest
+_file_hash_cache = {}
+
+
+def file_hash(fname):
+    '''
+    @returns {String} --- sha1 hex digest of fname's contents.  Cached
+    for as long as the file's mtime and size do not change.
+    '''
+    stat = os.stat(fname)
+    cache_key = (fname, stat.st_mtime, stat.st_size)
+    if cache_key not in _file_hash_cache:
+        digest = hashlib.sha1()
+        with open(fname, 'rb') as fd:
+            for chunk in iter(lambda: fd.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        _file_hash_cache[cache_key] = digest.hexdigest()
+    return _file_hash_cache[cache_key]
+
+
+def cpu_model():
+    try:
+        with open('/proc/cpuinfo', 'r') as fd:
+            for line in fd:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except IOError:
+        pass
+    return 'unknown'
+
+
+def host_profile():
+    '''
+    @returns {dict} --- What about this host could change results.
+    '''
+    return {
+        'hostname': socket.gethostname(),
+        'cpu_model': cpu_model(),
+        'num_cpus': os.sysconf('SC_NPROCESSORS_ONLN'),
+        'kernel': os.uname()[2],
+    }
+
+
+class Catalog(object):
+    def __init__(self, fname=DEFAULT_CATALOG_FNAME):
+        self.fname = fname
+        self.profile = host_profile()
+        dirname = os.path.dirname(fname)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with self.transaction() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS runs ('
+                'key TEXT PRIMARY KEY, experiment_class TEXT, '
+                'arguments TEXT, jar_hash TEXT, host_profile TEXT, '
+                'output_file TEXT, finished_at REAL)')
+
+    @contextmanager
+    def transaction(self):
+        '''
+        Yields a connection that is committed (or rolled back) and
+        closed when the with block ends.  A connection per operation
+        keeps the catalog safe to use from forked processes (see
+        parallel_experiments).
+        '''
+        conn = sqlite3.connect(self.fname, timeout=SQLITE_TIMEOUT_SECONDS)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def key_fields(self, exp):
+        return (
+            exp.__class__.__name__,
+            json.dumps(exp.catalog_arguments(), sort_keys=True),
+            file_hash(exp.fq_jar),
+            json.dumps(self.profile, sort_keys=True))
+
+    def key(self, exp):
+        return hashlib.sha1('\0'.join(self.key_fields(exp))).hexdigest()
+
+    def lookup(self, exp):
+        '''
+        @returns {String or None} --- Result file of an earlier run with
+        the same key as exp, if it still holds results.
+        '''
+        with self.transaction() as conn:
+            row = conn.execute(
+                'SELECT output_file FROM runs WHERE key = ?',
+                (self.key(exp),)).fetchone()
+        if row is None:
+            return None
+        output_file = row[0]
+        if (not os.path.exists(output_file)) or \
+           (os.path.getsize(output_file) == 0):
+            return None
+        return output_file
+
+    def record(self, exp):
+        experiment_class, arguments, jar_hash, profile = self.key_fields(exp)
+        with self.transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (self.key(exp), experiment_class, arguments, jar_hash,
+                 profile, exp.output_file, time.time()))
@@ -0,0 +1,197 @@
+#!/usr/bin/python
+
+'''
+Optional early stopping for experiments whose output is a stream of
+per-operation samples.  A ConvergenceMonitor watches samples as the
+controller writes them, finds the end of warmup from the samples
+themselves (MSER-5) and declares the run converged once the confidence
+intervals of the median and the p99 are tight enough.
+
+With a rule set, experiments run no separate warmup operations.  For
+the jars' result files (EVERY_FIELD), each row is one thread's
+operations in order, so warmup is found per row, at the row's start.
+The result file keeps every sample; the number of warmup samples of
+each row is written to the .convergence sidecar, and analysis.load,
+histogram.summarize (given read_row_warmup) and ab_compare drop them.
+
+The jars write a row only once its thread has finished, so the monitor
+sees nothing of a thread until then.  Early stopping can therefore
+only cut a run short between threads finishing: it helps runs of many
+threads, and never stops a single-threaded run early.
+'''
+
+import os
+
+import stat_util
+
+# sample_column of result files whose every numeric field is one
+# operation's latency, as the experiment jars write them
+EVERY_FIELD = 'every'
+SIDECAR_KIND = 'convergence'
+
+DEFAULT_TOLERANCE = .02
+DEFAULT_MIN_SAMPLES = 2000
+DEFAULT_CHECK_EVERY = 1000
+MEDIAN = .5
+P99 = .99
+
+
+class ConvergenceRule(object):
+    def __init__(self, sample_column, tolerance=DEFAULT_TOLERANCE,
+                 min_samples=DEFAULT_MIN_SAMPLES,
+                 check_every=DEFAULT_CHECK_EVERY,
+                 z=stat_util.DEFAULT_Z):
+        '''
+        @param {int or String} sample_column --- Index of the field of
+        each row that is a sample, or EVERY_FIELD if every numeric field
+        is.  Required, so that a file with numeric labels or counters is
+        not silently read as samples.
+
+        @param {float} tolerance --- Stop once both the median's and
+        the p99's confidence intervals have a half-width no larger than
+        this fraction of their estimates.
+
+        @param {int} min_samples --- Never stop with fewer post-warmup
+        samples than this.
+
+        @param {int} check_every --- Re-evaluate after this many new
+        samples.
+        '''
+        if (sample_column != EVERY_FIELD) and (
+                (not isinstance(sample_column, int)) or (sample_column < 0)):
+            raise ValueError(
+                'sample_column must be a field index or %s, not %r' % (
+                    EVERY_FIELD, sample_column))
+        self.tolerance = tolerance
+        self.min_samples = min_samples
+        self.check_every = check_every
+        self.sample_column = sample_column
+        self.z = z
+
+
+class ConvergenceMonitor(object):
+    def __init__(self, rule):
+        self.rule = rule
+        self.num_samples = 0
+        # EVERY_FIELD: post-warmup samples of every row so far, and the
+        # warmup samples dropped from the start of each row
+        self.steady = []
+        self.row_warmup = []
+        # otherwise: the column's samples, one series down the rows
+        self.series = []
+        self.next_check = rule.min_samples
+        self.converged = False
+        # filled in by each evaluation
+        self.warmup_samples = 0
+        self.median = None
+        self.median_ci = None
+        self.p99 = None
+        self.p99_ci = None
+
+    def add_row(self, row):
+        '''
+        Pass as an OutputFollower's on_row.
+        '''
+        if self.rule.sample_column == EVERY_FIELD:
+            samples = stat_util.parse_samples(row)
+            if len(samples) == 0:
+                # header
+                return
+            warmup = stat_util.mser_truncation(samples)
+            self.row_warmup.append(warmup)
+            self.steady.extend(samples[warmup:])
+        else:
+            samples = stat_util.parse_samples(row, self.rule.sample_column)
+            self.series.extend(samples)
+        self.num_samples += len(samples)
+        if (not self.converged) and (self.num_samples >= self.next_check):
+            self.next_check = self.num_samples + self.rule.check_every
+            self.evaluate()
+
+    def evaluate(self):
+        '''
+        Recompute warmup, estimates and confidence intervals from all
+        samples so far.
+
+        @returns {boolean} --- True if converged.
+        '''
+        if self.rule.sample_column == EVERY_FIELD:
+            self.warmup_samples = sum(self.row_warmup)
+            steady = sorted(self.steady)
+        else:
+            self.warmup_samples = stat_util.mser_truncation(self.series)
+            steady = sorted(self.series[self.warmup_samples:])
+        if len(steady) == 0:
+            return False
+
+        z = self.rule.z
+        self.median = stat_util.quantile(steady, MEDIAN)
+        self.median_ci = stat_util.quantile_ci(steady, MEDIAN, z)
+        self.p99 = stat_util.quantile(steady, P99)
+        self.p99_ci = stat_util.quantile_ci(steady, P99, z)
+
+        if len(steady) < self.rule.min_samples:
+            return False
+        tolerance = self.rule.tolerance
+        self.converged = (
+            (stat_util.relative_half_width(
+                self.median_ci[0], self.median_ci[1], self.median)
+             <= tolerance) and
+            (stat_util.relative_half_width(
+                self.p99_ci[0], self.p99_ci[1], self.p99)
+             <= tolerance))
+        return self.converged
+
+    def write(self, fname, stop_reason):
+        '''
+        @param {String} stop_reason --- Why the run ended, eg.
+        'converged' or 'completed'.
+        '''
+        self.evaluate()
+        with open(fname, 'w') as fd:
+            fd.write('key,value\n')
+            fd.write('stop_reason,%s\n' % stop_reason)
+            fd.write('samples,%i\n' % self.num_samples)
+            fd.write('warmup_samples,%i\n' % self.warmup_samples)
+            if self.rule.sample_column == EVERY_FIELD:
+                fd.write('row_warmup_samples,%s\n' % ' '.join(
+                    str(warmup) for warmup in self.row_warmup))
+            if self.median is not None:
+                fd.write('median,%f\n' % self.median)
+                fd.write('median_ci_low,%f\n' % self.median_ci[0])
+                fd.write('median_ci_high,%f\n' % self.median_ci[1])
+                fd.write('p99,%f\n' % self.p99)
+                fd.write('p99_ci_low,%f\n' % self.p99_ci[0])
+                fd.write('p99_ci_high,%f\n' % self.p99_ci[1])
+
+
+def read_row_warmup(result_fname):
+    '''
+    @returns {list or None} --- Warmup samples at the start of each row
+    (rows without samples not counted) of a result file, from its
+    .convergence sidecar; None if the run had no convergence rule.
+    '''
+    fname = '%s.%s' % (os.path.splitext(result_fname)[0], SIDECAR_KIND)
+    if not os.path.exists(fname):
+        return None
+    with open(fname, 'r') as fd:
+        for line in fd:
+            key, _, value = line.strip().partition(',')
+            if key == 'row_warmup_samples':
+                return [int(warmup) for warmup in value.split()]
+    return None
+
+
+def drop_row_warmup(rows, row_warmup):
+    '''
+    @param {list} rows --- Each element is a list of one row's samples.
+
+    @param {list or None} row_warmup --- @see read_row_warmup
+
+    @returns {list} --- rows without their warmup samples.  Rows past
+    the end of row_warmup are kept whole.
+    '''
+    if row_warmup is None:
+        return rows
+    return ([row[warmup:] for row, warmup in zip(rows, row_warmup)] +
+            rows[len(row_warmup):])
@@ -0,0 +1,230 @@
+#!/usr/bin/python
+
+'''
+Plans which cpus each part of a run may use, so that the controller jvm
+does not share cores with ovs-vswitchd, mininet or the harness itself,
+and fixes the cpu frequency governor while the run lasts.  Each run
+records its placement in a .placement sidecar.
+
+Cores are split along physical cores (hyperthread siblings stay
+together):
+
+    housekeeping --- the harness, mininet and anything they start; the
+                     first cores, which also take most interrupts
+    ovs          --- ovs-vswitchd and ovsdb-server
+    controller   --- every remaining core
+
+Everything runs through a shell function (local_shell, or host_shell
+for a dist HostEntry), so planning and applying work the same way on
+this host and on remote ones.  Packets on a kernel datapath are
+switched in softirq on whichever core sends them; taskset cannot move
+that work.
+'''
+
+import pipes
+import subprocess
+
+CPU_SYSFS_DIR = '/sys/devices/system/cpu'
+DEFAULT_GOVERNOR = 'performance'
+DEFAULT_HOUSEKEEPING_CORES = 1
+DEFAULT_OVS_CORES = 1
+OVS_PROCESSES = ('ovs-vswitchd', 'ovsdb-server')
+
+HOUSEKEEPING, OVS, CONTROLLER = 'housekeeping', 'ovs', 'controller'
+COMPONENTS = (HOUSEKEEPING, OVS, CONTROLLER)
+
+# prints "<cpu> <package> <core>" for every online cpu
+TOPOLOGY_CMD = (
+    'for d in %s/cpu[0-9]*; do '
+    '[ "$(cat $d/online 2>/dev/null)" = 0 ] && continue; '
+    'echo ${d##*/cpu} '
+    '$(cat $d/topology/physical_package_id 2>/dev/null || echo 0) '
+    '$(cat $d/topology/core_id 2>/dev/null || echo ${d##*/cpu}); '
+    'done') % CPU_SYSFS_DIR
+GOVERNOR_FNAMES = CPU_SYSFS_DIR + '/cpu[0-9]*/cpufreq/scaling_governor'
+
+
+class CpuPlanError(Exception):
+    pass
+
+
+def local_shell(cmd):
+    '''
+    @returns {tuple} --- (exit code, combined stdout and stderr) of
+    running cmd with sh on this host.
+    '''
+    proc = subprocess.Popen(
+        cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = proc.communicate()[0]
+    return proc.returncode, output
+
+
+def host_shell(host_entry):
+    '''
+    @returns {function} --- Like local_shell, but runs as root on a
+    dist HostEntry.
+    '''
+    def shell(cmd):
+        return host_entry.run_async('sudo sh -c %s' % pipes.quote(cmd)).result()
+    return shell
+
+
+def cpu_list(cpus):
+    return ','.join(str(cpu) for cpu in cpus)
+
+
+def read_cores(shell):
+    '''
+    @returns {list} --- Each element is a list of the online cpus that
+    share one physical core, ordered by lowest cpu.
+    '''
+    returncode, output = shell(TOPOLOGY_CMD)
+    if returncode != 0:
+        raise CpuPlanError('Could not read cpu topology:\n%s' % output)
+    cores = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if (len(fields) != 3) or (not all(f.isdigit() for f in fields)):
+            continue
+        cpu, package, core = map(int, fields)
+        cores.setdefault((package, core), []).append(cpu)
+    return sorted(sorted(cpus) for cpus in cores.values())
+
+
+def plan(cores, housekeeping_cores=DEFAULT_HOUSEKEEPING_CORES,
+         ovs_cores=DEFAULT_OVS_CORES, governor=DEFAULT_GOVERNOR):
+    '''
+    @param {list} cores --- @see read_cores
+
+    @param {String or None} governor --- cpufreq governor to hold while
+    a run lasts; None to leave it alone.
+
+    @returns {CpuPlacement}
+
+    @throws {CpuPlanError} --- If there are not enough cores to leave
+    the controller at least one.
+    '''
+    if len(cores) < housekeeping_cores + ovs_cores + 1:
+        raise CpuPlanError(
+            '%i cores cannot hold %i housekeeping, %i ovs and a '
+            'controller core' % (len(cores), housekeeping_cores, ovs_cores))
+
+    def flatten(core_lists):
+        return sorted(cpu for cpus in core_lists for cpu in cpus)
+    ovs_end = housekeeping_cores + ovs_cores
+    return CpuPlacement(
+        {HOUSEKEEPING: flatten(cores[:housekeeping_cores]),
+         OVS: flatten(cores[housekeeping_cores:ovs_end]),
+         CONTROLLER: flatten(cores[ovs_end:])},
+        governor)
+
+
+class CpuPlacement(object):
+    def __init__(self, cpus, governor=DEFAULT_GOVERNOR):
+        '''
+        @param {dict} cpus --- Component (one of COMPONENTS) -> list of
+        cpus it may run on.
+        '''
+        self.cpus = cpus
+        self.governor = governor
+        self.all_cpus = sorted(
+            cpu for component_cpus in cpus.values() for cpu in component_cpus)
+        # set by apply: governor file -> (governor before, governor
+        # after) for every cpu with cpufreq
+        self.governors = {}
+
+    def prefix(self, component):
+        '''
+        @returns {list} --- Command vector prefix that runs a command on
+        component's cpus.
+        '''
+        return ['taskset', '-c', cpu_list(self.cpus[component])]
+
+    def shell_prefix(self, component):
+        return ' '.join(self.prefix(component)) + ' '
+
+    def pin_cmd(self, cpus, ovs=True, pids=None):
+        '''
+        @returns {String} --- Shell command that moves every thread of
+        ovs's processes (if ovs) and of pids onto cpus.
+        '''
+        pid_words = []
+        if ovs:
+            pid_words.extend('$(pgrep -x %s)' % name for name in OVS_PROCESSES)
+        if pids is not None:
+            pid_words.extend(str(pid) for pid in pids)
+        return 'for pid in %s; do taskset -a -p -c %s $pid; done >/dev/null' % (
+            ' '.join(pid_words), cpu_list(cpus))
+
+    def apply(self, shell, housekeeping_pids=None):
+        '''
+        Pin ovs (and housekeeping_pids, eg. the harness itself, whose
+        children inherit its cpus) and set the governor.  Call restore
+        once the run is over.
+        '''
+        for what, cmd in [
+            ('ovs', self.pin_cmd(self.cpus[OVS])),
+            ('housekeeping', self.pin_cmd(
+                self.cpus[HOUSEKEEPING], False, housekeeping_pids))]:
+            returncode, output = shell(cmd)
+            if returncode != 0:
+                raise CpuPlanError('Could not pin %s:\n%s' % (what, output))
+
+        self.governors = {}
+        if self.governor is None:
+            return
+        # one round trip: print each file's governor before and after
+        returncode, output = shell(
+            'for f in %s; do [ -e "$f" ] || continue; old=$(cat $f); '
+            'echo %s > $f 2>/dev/null; echo "$f $old $(cat $f)"; done' % (
+                GOVERNOR_FNAMES, pipes.quote(self.governor)))
+        for line in output.splitlines():
+            fields = line.split()
+            if len(fields) == 3:
+                self.governors[fields[0]] = (fields[1], fields[2])
+
+    def restore(self, shell, housekeeping_pids=None):
+        '''
+        Let ovs and housekeeping_pids use every planned cpu again, and
+        put back the governors apply replaced.
+        '''
+        shell(self.pin_cmd(self.all_cpus, True, housekeeping_pids))
+        changed = [
+            'echo %s > %s' % (pipes.quote(before), fname)
+            for fname, (before, after) in sorted(self.governors.items())
+            if before != after]
+        if len(changed) != 0:
+            shell('; '.join(changed))
+
+    def applied_governor(self):
+        '''
+        @returns {String} --- Governor the run actually had, 'mixed' if
+        cpus differed, or 'unavailable' if there is no cpufreq.
+        '''
+        afters = set(after for before, after in self.governors.values())
+        if len(afters) == 0:
+            return 'unavailable'
+        if len(afters) > 1:
+            return 'mixed'
+        return afters.pop()
+
+    def write(self, fname):
+        with open(fname, 'w') as fd:
+            fd.write('key,value\n')
+            for component in COMPONENTS:
+                fd.write('%s,%s\n' % (
+                    component, ' '.join(map(str, self.cpus[component]))))
+            fd.write('governor,%s\n' % (self.governor or ''))
+            fd.write('governor_applied,%s\n' % self.applied_governor())
+
+
+def plan_local(housekeeping_cores=DEFAULT_HOUSEKEEPING_CORES,
+               ovs_cores=DEFAULT_OVS_CORES, governor=DEFAULT_GOVERNOR):
+    return plan(read_cores(local_shell), housekeeping_cores, ovs_cores,
+                governor)
+
+
+if __name__ == '__main__':
+    placement = plan_local()
+    for component in COMPONENTS:
+        print '%-13s %s' % (component, cpu_list(placement.cpus[component]))
@@ -1,30 +1,289 @@
 #!/usr/bin/env python
 
+import hashlib
+import os
+import pipes
+import subprocess
 import sys
-from dist_util import read_conf_file,DEFAULT_JAR_DIRECTORY
+from dist_util import read_conf_file,connect_all,DEFAULT_JAR_DIRECTORY
+
+# Every deploy is a release directory named after the hash of its
+# manifest; DEFAULT_JAR_DIRECTORY is a symlink to the current release.
+RELEASES_DIRECTORY = DEFAULT_JAR_DIRECTORY + '.releases'
+MANIFEST_FILENAME = '.manifest'
+RELEASE_ID_LENGTH = 16
+# number of old releases to keep on each host, besides the current one
+NUM_OLD_RELEASES_TO_KEEP = 1
+HAVE_RELEASE_MARKER = '__have_release__'
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def build_manifest(local_folder_name):
+    '''
+    @returns {list} --- Sorted (relative path, sha1) tuples for every
+    regular file under local_folder_name.  Paths start with ./ to match
+    what find prints on the remote side.
+    '''
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(local_folder_name):
+        for filename in filenames:
+            full_path = os.path.join(dirpath,filename)
+            if (filename == MANIFEST_FILENAME) or os.path.islink(full_path):
+                continue
+            digest = hashlib.sha1()
+            with open(full_path,'rb') as fd:
+                for chunk in iter(lambda: fd.read(HASH_CHUNK_SIZE),''):
+                    digest.update(chunk)
+            rel_path = './' + os.path.relpath(full_path,local_folder_name)
+            entries.append((rel_path,digest.hexdigest()))
+    return sorted(entries)
+
+
+def manifest_text(manifest):
+    # same format as sha1sum, so hosts can rebuild and check it
+    return ''.join('%s  %s\n' % (sha1,path) for path,sha1 in manifest)
+
+
+def parse_manifest_text(text):
+    '''
+    @returns {dict} --- relative path -> sha1
+    '''
+    to_return = {}
+    for line in text.splitlines():
+        if line == HAVE_RELEASE_MARKER:
+            continue
+        fields = line.split('  ',1)
+        if len(fields) == 2:
+            to_return[fields[1]] = fields[0]
+    return to_return
+
+
+def quote_all(args):
+    return ' '.join(pipes.quote(arg) for arg in args)
+
+
+def assemble_script(release_id,unchanged_files):
+    '''
+    @returns {String} --- Shell commands for a host that read a tar.gz
+    of changed files on stdin and turn it into release release_id:
+    hard-link unchanged files from the current release, unpack the
+    changed ones, check the result against release_id, and only then
+    atomically repoint DEFAULT_JAR_DIRECTORY at it.  Any failure leaves
+    the current release in place.
+    '''
+    release_dir = '%s/%s' % (RELEASES_DIRECTORY,release_id)
+    tmp_dir = release_dir + '.tmp'
+    link_unchanged = 'true'
+    if len(unchanged_files) != 0:
+        link_unchanged = '(cd %s && cp -al --parents %s ~/%s/)' % (
+            DEFAULT_JAR_DIRECTORY,quote_all(unchanged_files),tmp_dir)
+
+    return ' && '.join([
+        'cd ~',
+        'mkdir -p %s' % RELEASES_DIRECTORY,
+        # hosts deployed before releases existed have a plain directory
+        ('if [ -d %(d)s ] && [ ! -L %(d)s ]; then '
+         'rm -rf %(r)s/legacy && mv %(d)s %(r)s/legacy && '
+         'ln -s %(r)s/legacy %(d)s; fi') %
+        {'d': DEFAULT_JAR_DIRECTORY,'r': RELEASES_DIRECTORY},
+        'rm -rf %s' % tmp_dir,
+        'mkdir %s' % tmp_dir,
+        link_unchanged,
+        'tar xzf - -C %s' % tmp_dir,
+        ('(cd %s && find . -type f ! -name %s -print0 | LC_ALL=C sort -z | '
+         'xargs -0 -r sha1sum > %s)') % (
+            tmp_dir,MANIFEST_FILENAME,MANIFEST_FILENAME),
+        'test "$(sha1sum < %s/%s | cut -c1-%i)" = %s' % (
+            tmp_dir,MANIFEST_FILENAME,RELEASE_ID_LENGTH,release_id),
+        'rm -rf %s' % release_dir,
+        'mv %s %s' % (tmp_dir,release_dir),
+        swap_script(release_id)])
+
+
+def swap_script(release_id):
+    '''
+    @returns {String} --- Shell commands that atomically point
+    DEFAULT_JAR_DIRECTORY at release_id, then prune old releases.
+    '''
+    return ' && '.join([
+        'cd ~',
+        'ln -sfn %s/%s %s.new' % (
+            RELEASES_DIRECTORY,release_id,DEFAULT_JAR_DIRECTORY),
+        'mv -T %s.new %s' % (DEFAULT_JAR_DIRECTORY,DEFAULT_JAR_DIRECTORY),
+        ('(cd %s && ls -1t | grep -v -x -e %s -e %s.tmp | tail -n +%i | '
+         'xargs -r sudo rm -rf)') % (
+            RELEASES_DIRECTORY,release_id,release_id,
+            NUM_OLD_RELEASES_TO_KEEP + 1)])
+
+
+def query_hosts(host_entry_list,release_id):
+    '''
+    @returns {list} --- For each host, a (has release_id already,
+    manifest of its current release) tuple.
+    '''
+    query = (
+        'cd ~; if [ -d %s/%s ]; then echo %s; fi; cat %s/%s 2>/dev/null; true' %
+        (RELEASES_DIRECTORY,release_id,HAVE_RELEASE_MARKER,
+         DEFAULT_JAR_DIRECTORY,MANIFEST_FILENAME))
+    futures = [host_entry.run_async(query) for host_entry in host_entry_list]
+    to_return = []
+    for future in futures:
+        returncode, output = future.result()
+        to_return.append(
+            (HAVE_RELEASE_MARKER in output.splitlines(),
+             parse_manifest_text(output)))
+    return to_return
+
+
+def split_changed(manifest,host_manifest):
+    '''
+    @returns {tuple} --- (changed, unchanged) relative paths of
+    manifest, compared with what a host already has.
+    '''
+    changed = []
+    unchanged = []
+    for path,sha1 in manifest:
+        if host_manifest.get(path) == sha1:
+            unchanged.append(path)
+        else:
+            changed.append(path)
+    return changed,unchanged
+
+
+def tar_args(files):
+    if len(files) == 0:
+        return ['-T','/dev/null']
+    return ['--'] + files
+
+
+def send_from_local(local_folder_name,host_entry,release_id,
+                    changed,unchanged):
+    '''
+    @returns {Popen} --- The ssh end of a local tar | ssh pipeline.
+    '''
+    tar_proc = subprocess.Popen(
+        ['tar','czf','-','-C',local_folder_name] + tar_args(changed),
+        stdout=subprocess.PIPE)
+    ssh_proc = subprocess.Popen(
+        host_entry.ssh_cmd_vec() + [assemble_script(release_id,unchanged)],
+        stdin=tar_proc.stdout)
+    # only ssh should hold the read end, so tar sees a broken pipe if
+    # ssh dies.
+    tar_proc.stdout.close()
+    return ssh_proc
+
+
+def agent_loaded():
+    '''
+    @returns {boolean} --- True if this machine has an ssh agent holding
+    at least one key, which relays need to forward.
+    '''
+    with open(os.devnull,'w') as devnull:
+        return subprocess.call(
+            ['ssh-add','-l'],stdout=devnull,stderr=devnull) == 0
+
+
+def send_from_host(source,target,release_id,changed,unchanged):
+    '''
+    Have source, which already has release_id, relay the changed files
+    straight to target.  This machine's ssh agent is forwarded to source
+    so that it can log in to target; @see agent_loaded
+
+    @returns {CommandFuture}
+    '''
+    inner_ssh = quote_all(
+        ['ssh','-o','StrictHostKeyChecking=no','-o','BatchMode=yes',
+         '%s@%s' % (target.username,target.hostname),
+         assemble_script(release_id,unchanged)])
+    relay_cmd = 'cd ~/%s/%s && tar czf - %s | %s' % (
+        RELEASES_DIRECTORY,release_id,quote_all(tar_args(changed)),inner_ssh)
+    return source.run_async(relay_cmd,forward_agent=True)
+
 
 def run(local_folder_name):
+    '''
+    Deploy local_folder_name to every host, sending each host only the
+    files it does not already have, compressed.  Hosts that have the
+    new release relay it to hosts that do not, so the number of hosts
+    with the release roughly doubles every round.  Without an ssh agent
+    to forward, every host is sent its files from here instead.
+
+    @returns {list} --- HostEntry objects the deploy failed on.  These
+    keep their previous release.
+    '''
     host_entry_list = read_conf_file()
+    connect_all(host_entry_list)
 
-    # first remove all existing directories, if they exist
-    waiting_procs = []
-    ssh_cmd = 'sudo rm -rf %s ' % DEFAULT_JAR_DIRECTORY
-    for host_entry in host_entry_list:
-        waiting_procs.append(host_entry.issue_ssh(ssh_cmd))
+    manifest = build_manifest(local_folder_name)
+    release_id = hashlib.sha1(
+        manifest_text(manifest)).hexdigest()[:RELEASE_ID_LENGTH]
+    print '\nDeploying release %s (%i files)\n' % (release_id,len(manifest))
 
-    for proc in waiting_procs:
-        proc.wait()
-        
+    host_state = dict(
+        zip(host_entry_list,query_hosts(host_entry_list,release_id)))
 
-    # second copy new one
-    waiting_procs = []
-    for host_entry in host_entry_list:
-        waiting_procs.append(host_entry.scp_to_foreign(
-                local_folder_name,DEFAULT_JAR_DIRECTORY,True))
+    # without an agent to forward, hosts cannot log in to each other,
+    # so this machine sends to every host at once
+    relay = agent_loaded()
+    if not relay:
+        print '\nNo ssh agent with keys loaded; not relaying between hosts\n'
 
-    for proc in waiting_procs:
+    # hosts that already have the release only need to switch to it
+    sources = []
+    needing = []
+    for host_entry in host_entry_list:
+        if host_state[host_entry][0]:
+            sources.append(host_entry)
+        else:
+            needing.append(host_entry)
+    for proc in [host_entry.issue_ssh(swap_script(release_id))
+                 for host_entry in sources]:
         proc.wait()
 
+    failed = []
+    # hosts a relay to failed; only send to these from here
+    direct_only = set()
+    while len(needing) != 0:
+        # None stands for this machine
+        if relay:
+            senders = [None] + sources
+        else:
+            senders = [None] * len(needing)
+        round_transfers = []
+        for target in list(needing):
+            if len(senders) == 0:
+                break
+            if target in direct_only:
+                if None not in senders:
+                    continue
+                sender = None
+            else:
+                sender = senders[-1]
+            senders.remove(sender)
+            needing.remove(target)
+
+            changed,unchanged = split_changed(
+                manifest,host_state[target][1])
+            if sender is None:
+                transfer = send_from_local(
+                    local_folder_name,target,release_id,changed,unchanged)
+            else:
+                transfer = send_from_host(
+                    sender,target,release_id,changed,unchanged)
+            round_transfers.append((sender,target,transfer))
+
+        for sender,target,transfer in round_transfers:
+            if transfer.wait() == 0:
+                sources.append(target)
+            elif sender is not None:
+                print '\nRelay to %s failed; sending directly\n' % target.hostname
+                direct_only.add(target)
+                needing.append(target)
+            else:
+                print '\nDeploy to %s failed\n' % target.hostname
+                failed.append(target)
+    return failed
+
 
 def print_usage():
     print ('''
@@ -32,7 +291,9 @@ def print_usage():
   ./copy_experiments_dir <local experiments directory>
 
 Copies all files in <local experiments directory> to running host
-specified by default cfg file.
+specified by default cfg file.  Only files a host does not already
+have are sent, and a host switches to the new version only once it
+has all of it.
 
 ''')
         
@@ -42,4 +303,5 @@ if __name__ == '__main__':
         print_usage()
     else:
         local_experiments_folder_name = sys.argv[1]
-        run(local_experiments_folder_name)
+        if len(run(local_experiments_folder_name)) != 0:
+            sys.exit(1)
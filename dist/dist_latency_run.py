@@ -4,8 +4,11 @@ import time
 import sys
 import argparse
 
+import dist_util
 from dist_util import read_conf_file, kill_all, run_linear_test
 from dist_util import run_tree_test
+# dist_util puts the shared modules on the path
+import tracing
 
 
 LATENCY_TEST_JAR_NAME = 'multi_controller_latency.jar'
@@ -61,15 +64,27 @@ Use this script to run distributed latency experiments on ec2 nodes.
         help='Run the latency experiment in a linear or tree topology.')
     parser.add_argument(
         '--out',
-        help='Name of file to save results to locally.')
+        help=('Name of file to save results to locally: a histogram ' +
+              'summary is saved as <out>.histogram, and raw results ' +
+              'to <out> only with --raw.'))
+    parser.add_argument(
+        '--raw',action='store_true',
+        help='Also copy back every node\'s raw result file.')
 
     parser.add_argument(
         '--num_switches',
         type=int, default=1,
         help='Number of switches to run per controller.')
 
-    
+    parser.add_argument(
+        '--trace',
+        help='Record where the run spends its time as a trace in this file.')
+
     args = parser.parse_args()
+    if args.trace is not None:
+        tracing.use_tracing(args.trace)
+    if args.raw:
+        dist_util.COLLECT_RAW_RESULTS = True
     
 
     if args.kill:
@@ -4,8 +4,13 @@ import time
 import sys
 import argparse
 
+import dist_util
 from dist_util import read_conf_file, kill_all, run_linear_test
-from dist_util import run_tree_test
+from dist_util import run_tree_test, NodeFailure, summary_filename
+# dist_util puts the shared modules on the path
+import ab_compare
+import histogram
+import tracing
 
 
 SPECULATION_TEST_JAR_NAME = 'multi_controller_speculation_throughput.jar'
@@ -42,6 +47,46 @@ def tree_speculation_test(local_filename_to_save_to,
         MAX_EXPERIMENT_WAIT_TIME_SECONDS,
         num_switches_per_controller)
 
+
+def compare_speculation(output_prefix,topo,num_switches_per_controller,
+                        num_ops_per_switch=DEFAULT_NUM_OPS_TO_RUN,
+                        **kwargs):
+    '''
+    Interleave runs without and with speculation (see ab_compare.py)
+    until their throughputs are significantly different or equivalent.
+    Each run's results go to <output_prefix>-<true|false>-block<n>.csv
+    (and its histogram summaries next to that), and the blocks to
+    <output_prefix>.comparison.
+
+    @param kwargs --- @see ab_compare.ab_compare
+    '''
+    test = linear_speculation_test
+    if topo == 'tree':
+        test = tree_speculation_test
+
+    def runner(should_speculate_arg):
+        def run(block_num):
+            filename = '%s-%s-block%i.csv' % (
+                output_prefix,should_speculate_arg,block_num)
+            try:
+                test(filename,num_switches_per_controller,
+                     should_speculate_arg,num_ops_per_switch)
+            except NodeFailure as ex:
+                print '\nBlock %i failed: %s\n' % (block_num,ex)
+                return None
+            return filename
+        return run
+
+    def throughput(filename):
+        # raw results may not have been collected
+        return histogram.read(summary_filename(filename)).throughput()
+
+    result = ab_compare.ab_compare(
+        runner('false'),runner('true'),throughput,
+        'no_speculation','speculation',**kwargs)
+    result.write(output_prefix + '.comparison')
+    return result
+
     
 def kill_speculation_experiments(host_entry_list=None):
     if host_entry_list is None:
@@ -63,17 +108,41 @@ Use this script to run distributed speculation experiments on ec2 nodes.
     parser.add_argument(
         '--should_speculate',choices=['true','false'],
         help='Speculate or do not speculate when running.')
+    parser.add_argument(
+        '--compare',action='store_true',
+        help=('Interleave runs with and without speculation until ' +
+              'they differ or are shown equivalent; --out is a prefix.'))
+    parser.add_argument(
+        '--max_blocks',
+        type=int, default=ab_compare.DEFAULT_MAX_BLOCKS,
+        help='With --compare, most pairs of runs to make.')
+    parser.add_argument(
+        '--num_ops',
+        type=int, default=DEFAULT_NUM_OPS_TO_RUN,
+        help='Number of operations per switch on the head.')
     parser.add_argument(
         '--out',
-        help='Name of file to save results to locally.')
+        help=('Name of file to save results to locally: a histogram ' +
+              'summary is saved as <out>.histogram, and raw results ' +
+              'to <out> only with --raw.'))
+    parser.add_argument(
+        '--raw',action='store_true',
+        help='Also copy back every node\'s raw result file.')
 
     parser.add_argument(
         '--num_switches',
         type=int, default=1,
         help='Number of switches to run per controller.')
 
-    
+    parser.add_argument(
+        '--trace',
+        help='Record where the run spends its time as a trace in this file.')
+
     args = parser.parse_args()
+    if args.trace is not None:
+        tracing.use_tracing(args.trace)
+    if args.raw:
+        dist_util.COLLECT_RAW_RESULTS = True
     
 
     if args.kill:
@@ -91,6 +160,12 @@ Use this script to run distributed speculation experiments on ec2 nodes.
 
         num_switches_per_controller = args.num_switches
 
+        if args.compare:
+            compare_speculation(
+                output_filename,topo,num_switches_per_controller,
+                args.num_ops,max_blocks=args.max_blocks)
+            return
+
         should_speculate = args.should_speculate
         if should_speculate is None:
             print '\nError: if not killing, require should_speculate.\n'
@@ -98,10 +173,12 @@ Use this script to run distributed speculation experiments on ec2 nodes.
         
         if topo == 'linear':
             linear_speculation_test(
-                output_filename,num_switches_per_controller,should_speculate)
+                output_filename,num_switches_per_controller,should_speculate,
+                args.num_ops)
         elif topo == 'tree':
             tree_speculation_test(
-                output_filename,num_switches_per_controller,should_speculate)
+                output_filename,num_switches_per_controller,should_speculate,
+                args.num_ops)
             
         #### DEBUG
         else:
@@ -1,16 +1,90 @@
 #!/usr/bin/env python
 
+import pipes
+import re
+import stat
 import subprocess
+import tempfile
+import threading
 import time
 import os
 import sys
 
+# modules shared with the single-host harness live one directory up
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import ovsdb
+import jvm
+import host_sampler
+import cpu_plan
+import histogram
+import tracing
+
 DEFAULT_JAR_DIRECTORY = 'experiments_jar_dir'
 
 CONF_FILE_LINES_PER_ENTRY = 4
 LISTENING_FOR_CONNECTIONS_ON_PORT = 31521
 DEFAULT_CONF_FILE = 'distributed.cfg'
-BETWEEN_NODE_WAIT_TIME_SECONDS = 4
+
+# Startup waits on events rather than fixed sleeps: a node starts once
+# the peers it connects to are listening, and switches are versioned
+# once mininet has created them.  These bound how long either may take.
+NODE_LISTEN_TIMEOUT_SECONDS = 60
+MININET_START_TIMEOUT_SECONDS = 60
+STARTUP_POLL_PERIOD_SECONDS = .2
+# how much of a failed node's log to show
+LOG_TAIL_LINES = 30
+# state column of a listening socket in /proc/net/tcp
+TCP_LISTEN_STATE = '0A'
+
+# Each host gets one multiplexed ssh connection; every ssh, scp and
+# ovsdb session to it runs over that connection instead of doing its own
+# handshake.  The master exits on its own after this much idle time.
+# Whoever can open a master's socket can run commands as us on its
+# host, so the directory is per user and kept private (@see
+# ensure_ssh_control_dir).  It stays under the temp directory because
+# socket paths are limited to about 100 characters.
+SSH_CONTROL_DIR = os.path.join(
+    tempfile.gettempdir(), 'pronghorn-ssh-%i' % os.getuid())
+SSH_CONTROL_DIR_MODE = 0700
+SSH_CONTROL_PERSIST_SECONDS = 600
+DEFAULT_SSH_PORT = 22
+
+# How often to check whether nodes' processes have exited, how often to
+# print progress while an experiment runs, how long a run may go
+# without new rows or log output before we call it stalled, and how
+# long to let result streams catch up after the experiment is torn
+# down.
+NODE_POLL_PERIOD_SECONDS = .5
+PROGRESS_PRINT_PERIOD_SECONDS = 5
+STALL_TIMEOUT_SECONDS = 60
+STREAM_DRAIN_SECONDS = 2
+# Run on a node, prints the number of numeric fields (operations) of
+# each row; same rule as histogram.parse_row.
+COUNT_OPS_AWK = (
+    r'{n = 0; for (i = 1; i <= NF; i++) '
+    r'if ($i ~ /^[ \t]*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?[ \t]*$/) '
+    r'n++; print n; fflush()}')
+
+# Every node samples host-level counters (see host_sampler.py) while an
+# experiment runs.  The sampler is copied to each host's home directory
+# and writes there; None to not sample.
+HOST_SAMPLE_PERIOD_MS = host_sampler.DEFAULT_PERIOD_MS
+FOREIGN_SAMPLES_FILENAME = 'host_samples.csv'
+
+# If True, each host pins its jvm, ovs and mininet to their own cores
+# and holds its cpu governor for the run (see cpu_plan.py); placements
+# are saved next to the results.
+PLAN_CPUS = False
+
+# Every node reduces its result file to a mergeable histogram summary
+# (see histogram.py), and only those are copied back: the cluster's is
+# saved as <results>.histogram, each node's as
+# <results>.<hostname>.histogram.  If True, nodes' raw result files are
+# streamed back too: the head's to the requested file, others' to files
+# next to it.
+COLLECT_RAW_RESULTS = False
+SUMMARY_INTERVAL_MS = histogram.DEFAULT_INTERVAL_MS
 
 def produce_linear_topology_arguments(host_entry_list):
     '''
@@ -66,6 +140,7 @@ def produce_tree_topology_arguments(host_entry_list):
 
 def kill_all(host_entry_list,jar_name):
     # tear down all mininets and all experiments
+    connect_all(host_entry_list)
     waiting_on_list = []
     for host_entry in host_entry_list:
         waiting_on_list.append(host_entry.stop_mininet())
@@ -77,6 +152,42 @@ def kill_all(host_entry_list,jar_name):
         waiting_on.wait()
 
 
+class NodeFailure(Exception):
+    '''
+    A node failed to come up or died during a run.
+    '''
+    def __init__(self,hostname,reason,log_filename=None):
+        message = '%s: %s' % (hostname,reason)
+        if log_filename is not None:
+            message += '\n\nLast lines of %s:\n%s' % (
+                log_filename,log_tail(log_filename))
+        Exception.__init__(self,message)
+        self.hostname = hostname
+
+
+class RunIncomplete(NodeFailure):
+    '''
+    The head never finished: the run stalled or hit its time limit.  A
+    NodeFailure, so that callers that skip failed runs skip these too.
+    '''
+    def __init__(self,hostname,outcome,log_filename=None):
+        '''
+        @param {String} outcome --- 'stalled' or 'timeout'; @see
+        ProgressMonitor.wait
+        '''
+        NodeFailure.__init__(
+            self,hostname,'run ended (%s) before the head finished' % outcome,
+            log_filename)
+        self.outcome = outcome
+
+
+def log_tail(log_filename,num_lines=LOG_TAIL_LINES):
+    if not os.path.exists(log_filename):
+        return ''
+    with open(log_filename,'r') as fd:
+        return ''.join(fd.readlines()[-num_lines:])
+
+
 class TopoType(object):
     LINEAR,TREE = range(2)
 
@@ -84,32 +195,32 @@ def run_linear_test(jar_name,local_filename_to_save_results_to,
                     head_num_ops_to_run_per_switch,
                     command_string, max_experiment_wait_time_seconds,
                     num_switches_per_controller,
-                    special_last_command_string=None):
+                    special_last_command_string=None,jvm_profile=None):
     return run_test(
         jar_name,local_filename_to_save_results_to,
         head_num_ops_to_run_per_switch,
         command_string, max_experiment_wait_time_seconds,
         num_switches_per_controller,TopoType.LINEAR,
-        special_last_command_string)
+        special_last_command_string,jvm_profile)
 
 def run_tree_test(jar_name,local_filename_to_save_results_to,
                   head_num_ops_to_run_per_switch,
                   command_string, max_experiment_wait_time_seconds,
                   num_switches_per_controller,
-                  special_last_command_string=None):
+                  special_last_command_string=None,jvm_profile=None):
     return run_test(
         jar_name,local_filename_to_save_results_to,
         head_num_ops_to_run_per_switch,
         command_string, max_experiment_wait_time_seconds,
         num_switches_per_controller,TopoType.TREE,
-        special_last_command_string)
+        special_last_command_string,jvm_profile)
 
 
 def run_test(jar_name,local_filename_to_save_results_to,
              head_num_ops_to_run_per_switch,
              command_string, max_experiment_wait_time_seconds,
              num_switches_per_controller,topo_type,
-             special_last_command_string=None):
+             special_last_command_string=None,jvm_profile=None):
     '''
     @param {String} jar_name --- Does not include name of default jar
     directory.
@@ -131,9 +242,9 @@ def run_test(jar_name,local_filename_to_save_results_to,
         4) %i --- The number of operations to run
         5) %s --- The name of the file to save results to on foreign host
     
-    @param {int} max_experiment_wait_time_seconds --- The time to wait
-    for the experiment to finish before tearing everything down and
-    copying the result file from head to local machine.
+    @param {int} max_experiment_wait_time_seconds --- Upper bound on
+    how long to let the experiment run.  The run normally ends as soon
+    as the head's process exits; this only guards against hangs.
 
     @param {int} num_switches_per_controller --- The number of
     switches mininet should start up for each controller.
@@ -146,10 +257,28 @@ def run_test(jar_name,local_filename_to_save_results_to,
     In these cases, specify special_last_command_string as non-None
     (with same format as command_string), and will run the last node
     with these arguments.
+
+    @param {JvmProfile or None} jvm_profile --- Heap and gc flags for
+    every node's jvm.  None for jvm.DEFAULT_PROFILE.
+
+    @returns {Summary} --- Histogram summary of every node's results.
+    local_filename_to_save_results_to itself is only written if
+    COLLECT_RAW_RESULTS.
+
+    @throws {NodeFailure} --- If a node failed, or RunIncomplete if
+    the run stalled or timed out; nodes are torn down and what results
+    there are saved first.
     
     '''
     foreign_output_filename = 'output.csv'
+    run_begin = time.time()
     host_entry_list = read_conf_file()
+    with tracing.span('connect_all'):
+        connect_all(host_entry_list)
+    if PLAN_CPUS:
+        with tracing.span('plan_cpus'):
+            for host_entry in host_entry_list:
+                host_entry.plan_cpus()
 
 
     if topo_type == TopoType.LINEAR:
@@ -161,89 +290,700 @@ def run_test(jar_name,local_filename_to_save_results_to,
         assert(False)
 
 
-    # start sergeant on nodes in reverse order
-    for i in range(len(host_entry_list) -1, -1, -1):
-        host_entry_to_start = host_entry_list[i]
-        who_to_contact_args = topo_args[i]
+    # results left over from an earlier run would be streamed back as
+    # if they were this run's
+    foreign_output_path = (
+        # note: this path concatenation works because we're assuming
+        # that we're running remotely on a *nix
+        DEFAULT_JAR_DIRECTORY + '/' + foreign_output_filename)
+    with tracing.span('clear_results'):
+        fan_out(host_entry_list,'sudo rm -f %s' % foreign_output_path)
+    with tracing.span('copy_scripts'):
+        copy_to_all(host_entry_list,histogram.SCRIPT_NAME)
+    with tracing.span('start_host_samplers'):
+        start_host_samplers(host_entry_list,jar_name)
 
-        command_string_to_use = command_string        
+    # every node's command, as it would run from within the jar
+    # directory
+    node_cmds = []
+    host_log_filenames = []
+    for i, host_entry in enumerate(host_entry_list):
+        command_string_to_use = command_string
         if i != 0:
             # non-head node
             num_ops_to_run_per_switch = 0
             # check if this is the last worker node.  if it is, may
-            # need to use substitute command string.            
+            # need to use substitute command string.
             if i == (len(host_entry_list) -1):
                 if special_last_command_string is not None:
                     command_string_to_use = special_last_command_string
         else:
-            # head            
+            # head
             num_ops_to_run_per_switch = head_num_ops_to_run_per_switch
 
-        ssh_cmd = 'cd %s; sudo ' % DEFAULT_JAR_DIRECTORY
-        ssh_cmd += (command_string_to_use %
+        ssh_cmd = 'cd %s; mkdir -p %s; %ssudo ' % (
+            DEFAULT_JAR_DIRECTORY,jvm.REMOTE_CDS_DIR,
+            host_entry.place(cpu_plan.CONTROLLER))
+        java_cmd = (command_string_to_use %
                     (jar_name,
-                     who_to_contact_args,
+                     topo_args[i],
                      LISTENING_FOR_CONNECTIONS_ON_PORT,
                      num_ops_to_run_per_switch,
                      foreign_output_filename))
+        # launch with the jar's class-data-sharing archive and the
+        # shared jvm flags
+        ssh_cmd += re.sub(
+            r'^java ',jvm.remote_java(jar_name,jvm_profile) + ' ',java_cmd)
+        node_cmds.append(ssh_cmd)
+        host_log_filenames.append(host_entry.hostname + '_log.txt')
 
-        print '\n\n'
-        print ssh_cmd
-        print '\n\n'
+    # nodes start as soon as the peers they connect to are listening,
+    # so independent parts of the topology come up together.
+    try:
+        with tracing.span('start_nodes'):
+            node_procs = start_nodes(
+                host_entry_list,topo_args,node_cmds,host_log_filenames)
 
-        host_log_filename = host_entry_to_start.hostname + '_log.txt'
-        host_entry_to_start.issue_ssh(ssh_cmd,False,host_log_filename)
-        time.sleep(BETWEEN_NODE_WAIT_TIME_SECONDS)
+        print '\n\n\n\n'
+        print 'Starting mininet and versioning'
+        print '\n\n\n\n'
+        sys.stdout.flush()
 
-    # now that we've started all nodes, start mininet on all nodes:
-    # start in reverse order so that can ensure last node
-    for host_entry in reversed(host_entry_list):
-        host_entry.start_mininet(num_switches_per_controller)
-
-
-    print '\n\nBefore sleep\n\n'
-    sys.stdout.flush()
-    # time.sleep(100)
-    #time.sleep(40)
-    time.sleep(10)
-
-    print '\n\n\n\n'
-    print 'Starting versioning'
-    print '\n\n\n\n'
-    sys.stdout.flush()
-    
-    for host_entry in reversed(host_entry_list):
-        host_entry.version_mininet(num_switches_per_controller)
+        with tracing.span('start_all_mininets'):
+            start_all_mininets(host_entry_list,num_switches_per_controller)
+    except NodeFailure:
+        teardown(
+            host_entry_list,jar_name,local_filename_to_save_results_to)
+        tracing.record('run_test',run_begin,jar=jar_name)
+        raise
 
     print '\n\n\n\n'
     print 'Finished versioning'
     print '\n\n\n\n'
     sys.stdout.flush()
-    
-    # wait for experiment to complete
-    time.sleep(max_experiment_wait_time_seconds)
+
+    # follow every node's results as they are written, for progress:
+    # if collecting raw results, head's go to the requested file,
+    # others' to files next to it.
+    streams = []
+    for i, host_entry in enumerate(host_entry_list):
+        local_filename = None
+        if COLLECT_RAW_RESULTS:
+            local_filename = local_filename_to_save_results_to
+            if i != 0:
+                local_filename += '.' + host_entry.hostname
+        streams.append(
+            ResultStream(host_entry,foreign_output_path,local_filename))
+    monitor = ProgressMonitor(
+        streams,host_log_filenames,host_entry_list,node_procs)
+
+    # wait for head to finish, any node to fail, or the ceiling
+    failure = None
+    try:
+        with tracing.span('experiment'):
+            outcome = monitor.wait(max_experiment_wait_time_seconds)
+        if outcome != 'finished':
+            failure = RunIncomplete(
+                host_entry_list[0].hostname,outcome,host_log_filenames[0])
+    except NodeFailure as ex:
+        failure = ex
 
     # teardown mininets and experiments
-    kill_all(host_entry_list,jar_name)
-    
-    # collect result file from master
-    head = host_entry_list[0]
-    head.collect_result_file(
-        # note: this path concatenation works because we're assuming
-        # that we're running remotely on a *nix
-        DEFAULT_JAR_DIRECTORY + '/' + foreign_output_filename,
-        local_filename_to_save_results_to)
+    teardown(host_entry_list,jar_name,local_filename_to_save_results_to)
+
+    with tracing.span('drain_streams'):
+        time.sleep(STREAM_DRAIN_SECONDS)
+        for stream in streams:
+            stream.stop()
+
+    # nodes' files are complete once they are torn down, so summaries
+    # never miss rows
+    with tracing.span('summarize_results'):
+        summary = summarize_results(
+            host_entry_list,foreign_output_path,
+            local_filename_to_save_results_to)
+    tracing.record('run_test',run_begin,jar=jar_name)
+
+    if failure is not None:
+        # keep whatever was streamed, but do not pass off a partial
+        # run as finished
+        print '\nAborted run: %s\n' % failure
+        raise failure
+
+    # the head's streamed copy is the result file, unless the stream
+    # missed rows; then fall back to copying the whole file.
+    if COLLECT_RAW_RESULTS and (not streams[0].complete()):
+        print '\nResult stream from head incomplete; copying result file\n'
+        head = host_entry_list[0]
+        head.collect_result_file(
+            foreign_output_path,local_filename_to_save_results_to)
+    return summary
+
+
+def teardown(host_entry_list,jar_name,local_filename):
+    '''
+    Stop samplers, mininets and experiments on every host, and undo
+    cpu placements.
+    '''
+    with tracing.span('stop_host_samplers'):
+        stop_host_samplers(host_entry_list,local_filename)
+    with tracing.span('kill_all'):
+        kill_all(host_entry_list,jar_name)
+    with tracing.span('release_host_cpus'):
+        release_host_cpus(host_entry_list,local_filename)
+
+
+def copy_to_all(host_entry_list,script_name):
+    '''
+    Copy one of the shared scripts one directory up to every host's
+    home directory, in parallel.
+    '''
+    script = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),'..',script_name)
+    for proc in [
+        host_entry.scp_to_foreign(script,script_name,False)
+        for host_entry in host_entry_list]:
+        proc.wait()
+
+
+def start_host_samplers(host_entry_list,jar_name):
+    '''
+    Copy host_sampler.py to every host and start it there, watching the
+    node's jvm and ovs-vswitchd.  Samplers run until
+    stop_host_samplers.
+    '''
+    if HOST_SAMPLE_PERIOD_MS is None:
+        return
+    copy_to_all(host_entry_list,host_sampler.SCRIPT_NAME)
+
+    cmd_vec = host_sampler.command_vec(
+        FOREIGN_SAMPLES_FILENAME,
+        [('controller',jar_name),('ovs','ovs-vswitchd')],
+        HOST_SAMPLE_PERIOD_MS,host_sampler.SCRIPT_NAME)
+    # root, for the ovs datapath counters
+    # so that a sampler that fails to start leaves no stale samples to
+    # collect
+    ssh_cmd_str = 'sudo rm -f %s; sudo python %s' % (
+        FOREIGN_SAMPLES_FILENAME,' '.join(pipes.quote(arg) for arg in cmd_vec))
+    for host_entry in host_entry_list:
+        host_entry.issue_ssh(ssh_cmd_str)
+
+
+def host_sidecar_filename(local_filename,host_entry,kind):
+    '''
+    @returns {String} --- Where auxiliary data of kind about
+    host_entry's part of a run is saved, next to the results.
+    '''
+    return '%s.%s.%s' % (
+        os.path.splitext(local_filename)[0],host_entry.hostname,kind)
+
+
+def stop_host_samplers(host_entry_list,local_filename):
+    '''
+    Stop every host's sampler and copy its samples back.
+    '''
+    if HOST_SAMPLE_PERIOD_MS is None:
+        return
+    for proc in [
+        host_entry.issue_pkill(host_sampler.SCRIPT_NAME)
+        for host_entry in host_entry_list]:
+        proc.wait()
+    for host_entry in host_entry_list:
+        host_entry.collect_result_file(
+            FOREIGN_SAMPLES_FILENAME,
+            host_sidecar_filename(local_filename,host_entry,'host'))
+
+
+def summary_filename(local_filename):
+    '''
+    @returns {String} --- Where the cluster-wide histogram summary of a
+    run is saved.
+    '''
+    return os.path.splitext(local_filename)[0] + '.histogram'
+
+
+def summarize_results(host_entry_list,foreign_output_path,local_filename):
+    '''
+    Have every node summarize its result file at once, save each node's
+    summary and their merge next to the results, and print them.
+
+    @returns {Summary or None} --- The merge, or None if no node could
+    summarize.
+    '''
+    ssh_cmd_str = ' '.join(
+        pipes.quote(arg) for arg in histogram.command_vec(
+            foreign_output_path,SUMMARY_INTERVAL_MS,
+            script=histogram.SCRIPT_NAME))
+    # stderr would corrupt the json
+    futures = [
+        host_entry.run_async(ssh_cmd_str + ' 2>/dev/null')
+        for host_entry in host_entry_list]
+
+    begin = time.time()
+    summaries = []
+    for host_entry, future in zip(host_entry_list,futures):
+        returncode, output = future.result()
+        # waits in host order, so a host's span can end late
+        tracing.record('summarize',begin,host=host_entry.hostname)
+        try:
+            if returncode != 0:
+                raise histogram.SummaryError('exited with %i' % returncode)
+            summary = histogram.loads(output)
+        except histogram.SummaryError as ex:
+            print '%s: could not summarize results: %s' % (
+                host_entry.hostname,ex)
+            continue
+        summary.write(
+            host_sidecar_filename(local_filename,host_entry,'histogram'))
+        print '%s: %s' % (host_entry.hostname,summary.describe())
+        summaries.append(summary)
+
+    if len(summaries) == 0:
+        return None
+    merged = histogram.merge(summaries)
+    merged.write(summary_filename(local_filename))
+    print 'cluster: %s' % merged.describe()
+    sys.stdout.flush()
+    return merged
+
+
+def release_host_cpus(host_entry_list,local_filename):
+    '''
+    Undo each host's cpu placement and save it next to the results.
+    '''
+    for host_entry in host_entry_list:
+        if host_entry.cpu_placement is not None:
+            host_entry.cpu_placement.write(
+                host_sidecar_filename(local_filename,host_entry,'placement'))
+            host_entry.release_cpus()
+
+
+def topology_dependencies(host_entry_list,topo_args):
+    '''
+    @param {list} topo_args --- @see produce_linear_topology_arguments
+
+    @returns {list} --- Element i is the set of indices of the nodes
+    that node i connects to.  Those must be listening before node i
+    starts.
+    '''
+    index_of = dict(
+        (host_entry.hostname,i) for i, host_entry in enumerate(host_entry_list))
+    to_return = []
+    for who_to_contact_args in topo_args:
+        peers = set()
+        for host_port_pair in who_to_contact_args.split(','):
+            hostname = host_port_pair.rsplit(':',1)[0]
+            if hostname in index_of:
+                peers.add(index_of[hostname])
+        to_return.append(peers)
+    return to_return
+
+
+def listening_check_cmd(port):
+    '''
+    @returns {String} --- Shell command that exits 0 if something on
+    the host is listening on tcp port.
+    '''
+    # remote address is all zeros in either table for listening sockets
+    return 'grep -q ":%04X [0-9A-F]*:0000 %s" /proc/net/tcp /proc/net/tcp6' % (
+        port,TCP_LISTEN_STATE)
+
+
+def start_nodes(host_entry_list,topo_args,node_cmds,log_filenames,
+                timeout_seconds=NODE_LISTEN_TIMEOUT_SECONDS):
+    '''
+    Start every node as soon as all the peers it connects to are
+    accepting connections on LISTENING_FOR_CONNECTIONS_ON_PORT.  Nodes
+    whose peers are ready start together, so a tree comes up in two
+    steps and a line in one step per node.
+
+    @param {list} node_cmds --- Element i is the command to run on
+    host_entry_list[i].
+
+    @param {list} log_filenames --- Element i is the local file to
+    pipe node i's output to.
+
+    @returns {list} --- Element i is the Popen of the ssh session
+    running node i.
+
+    @throws {NodeFailure} --- If a node exits or does not start
+    listening within timeout_seconds.
+    '''
+    dependencies = topology_dependencies(host_entry_list,topo_args)
+    # only nodes that someone connects to need to be listening
+    depended_on = set()
+    for peers in dependencies:
+        depended_on |= peers
+
+    num_nodes = len(host_entry_list)
+    procs = [None] * num_nodes
+    start_times = [None] * num_nodes
+    ready = set(range(num_nodes)) - depended_on
+    while True:
+        for i in range(num_nodes):
+            if (procs[i] is None) and (dependencies[i] <= ready):
+                print '\n\n'
+                print node_cmds[i]
+                print '\n\n'
+                sys.stdout.flush()
+                procs[i] = host_entry_list[i].issue_ssh(
+                    node_cmds[i],False,log_filenames[i])
+                start_times[i] = time.time()
+
+        waiting = [
+            i for i in range(num_nodes)
+            if (procs[i] is not None) and (i not in ready)]
+        if None not in procs and len(waiting) == 0:
+            return procs
+        if len(waiting) == 0:
+            # nothing started and nothing to wait for: the topology
+            # has a cycle
+            raise NodeFailure(
+                host_entry_list[procs.index(None)].hostname,
+                'waits on peers that can never start')
+
+        checks = [
+            (i, host_entry_list[i].run_async(
+                    listening_check_cmd(LISTENING_FOR_CONNECTIONS_ON_PORT)))
+            for i in waiting]
+        for i, check in checks:
+            if check.wait() == 0:
+                ready.add(i)
+                tracing.record(
+                    'node_listening',start_times[i],
+                    host=host_entry_list[i].hostname)
+            elif procs[i].poll() is not None:
+                raise NodeFailure(
+                    host_entry_list[i].hostname,
+                    'exited with %i before listening' % procs[i].returncode,
+                    log_filenames[i])
+            elif time.time() - start_times[i] > timeout_seconds:
+                raise NodeFailure(
+                    host_entry_list[i].hostname,
+                    'not listening on %i after %is' % (
+                        LISTENING_FOR_CONNECTIONS_ON_PORT,timeout_seconds),
+                    log_filenames[i])
+        time.sleep(STARTUP_POLL_PERIOD_SECONDS)
+
+
+def start_all_mininets(host_entry_list,num_switches):
+    '''
+    Start mininet on every host at once, then version each host's
+    switches as soon as they exist.
+
+    @throws {NodeFailure} --- If any host's switches do not come up.
+    '''
+    begin = time.time()
+    for host_entry in host_entry_list:
+        host_entry.start_mininet(num_switches)
+
+    failures = []
+    def bring_up(host_entry):
+        try:
+            # versioning waits for mininet to come up first
+            host_entry.version_mininet(num_switches)
+            tracing.record(
+                'start_and_version_mininet',begin,host=host_entry.hostname)
+        except NodeFailure as ex:
+            failures.append(ex)
+        except Exception as ex:
+            failures.append(NodeFailure(host_entry.hostname,str(ex)))
+
+    calls = [
+        BackgroundCall(lambda host_entry=host_entry: bring_up(host_entry))
+        for host_entry in host_entry_list]
+    for call in calls:
+        call.wait()
+    if len(failures) != 0:
+        raise failures[0]
+
+
+class ResultStream(object):
+    '''
+    Follows a result file on a remote node while the experiment runs,
+    appending each row to a local file as it arrives.
+    '''
+    def __init__(self,host_entry,foreign_filename,local_filename):
+        '''
+        @param {String or None} local_filename --- None to only count
+        rows and operations; the node then sends, for each row, the
+        number of operations (numeric fields) in it.
+        '''
+        self.host_entry = host_entry
+        self.foreign_filename = foreign_filename
+        self.local_filename = local_filename
+        self.rows = 0
+        self.ops = 0
+        self.last_row_time = None
+        self.tail_cmd = 'tail -n +1 -F %s' % foreign_filename
+        remote_cmd = self.tail_cmd + ' 2>/dev/null'
+        if local_filename is None:
+            remote_cmd += ' | awk -F, %s' % pipes.quote(COUNT_OPS_AWK)
+        self.proc = subprocess.Popen(
+            host_entry.ssh_cmd_vec() + [remote_cmd],
+            stdout=subprocess.PIPE)
+        self.thread = threading.Thread(target=self._follow)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _follow(self):
+        if self.local_filename is None:
+            for line in iter(self.proc.stdout.readline,''):
+                self.rows += 1
+                self.ops += int(line.strip() or 0)
+                self.last_row_time = time.time()
+            return
+        with open(self.local_filename,'w') as fd:
+            for line in iter(self.proc.stdout.readline,''):
+                fd.write(line)
+                fd.flush()
+                self.rows += 1
+                self.ops += len(histogram.parse_row(line))
+                self.last_row_time = time.time()
+
+    def stop(self):
+        # closing our end does not stop a remote tail that has nothing
+        # to write, so kill it explicitly.  pkill takes a regex, so
+        # escape the +.
+        self.host_entry.issue_ssh(
+            'pkill -f "%s"' % self.tail_cmd.replace('+','[+]'),True)
+        self.proc.terminate()
+        self.thread.join()
+
+    def complete(self):
+        '''
+        @returns {boolean} --- True if we streamed as many rows as the
+        remote file has.
+        '''
+        returncode, output = self.host_entry.run_async(
+            'wc -l < %s' % self.foreign_filename).result()
+        if returncode != 0:
+            return False
+        return int(output.strip() or 0) == self.rows
+
+
+class ProgressMonitor(object):
+    '''
+    Prints operations so far and the current operation rate of every
+    ResultStream, notices when a run stops making progress, and watches
+    each node's process to tell when the run finished or failed.
+    '''
+    def __init__(self,streams,log_filenames,host_entry_list=None,
+                 node_procs=None):
+        '''
+        @param {list} log_filenames --- Local files that nodes' stdout
+        is piped to.  Growth in any of them counts as progress.
+
+        @param {list} node_procs --- Element i is the Popen of the ssh
+        session running the experiment on host_entry_list[i]; the
+        first is the head.  None to only wait out the time limit.
+        '''
+        self.streams = streams
+        self.log_filenames = log_filenames
+        self.host_entry_list = host_entry_list
+        self.node_procs = node_procs
+        self.last_ops = [0] * len(streams)
+        self.last_print_time = time.time()
+        # nothing before the monitor starts counts as progress
+        self.begin = time.time()
+
+    def last_activity(self):
+        times = [self.begin] + [
+            stream.last_row_time for stream in self.streams
+            if stream.last_row_time is not None]
+        for log_filename in self.log_filenames:
+            if os.path.exists(log_filename):
+                times.append(os.path.getmtime(log_filename))
+        return max(times)
 
+    def stalled(self):
+        '''
+        @returns {boolean} --- True if nothing has happened on any node
+        for STALL_TIMEOUT_SECONDS, whether or not any results arrived:
+        nodes write a row only once a thread finishes, so a run that
+        hangs early never sends one.
+        '''
+        return (time.time() - self.last_activity()) > STALL_TIMEOUT_SECONDS
+
+    def print_progress(self):
+        now = time.time()
+        elapsed = now - self.last_print_time
+        for i, stream in enumerate(self.streams):
+            rate = (stream.ops - self.last_ops[i]) / elapsed
+            print '%s: %i ops, %.1f ops/s' % (
+                stream.host_entry.hostname,stream.ops,rate)
+            self.last_ops[i] = stream.ops
+        sys.stdout.flush()
+        self.last_print_time = now
+
+    def check_nodes(self):
+        '''
+        @returns {boolean} --- True once the head's process has exited
+        cleanly.
 
+        @throws {NodeFailure} --- If the head exited with an error or
+        any other node exited at all: workers serve until torn down.
+        '''
+        if self.node_procs is None:
+            return False
+        # workers may go down with the head once it is done
+        if self.node_procs[0].poll() == 0:
+            return True
+        for i, proc in enumerate(self.node_procs):
+            returncode = proc.poll()
+            if returncode is not None:
+                raise NodeFailure(
+                    self.host_entry_list[i].hostname,
+                    'experiment exited with %i' % returncode,
+                    self.log_filenames[i])
+        return False
+
+    def wait(self,max_wait_time_seconds):
+        '''
+        Print progress until the head finishes, the run stalls, or
+        max_wait_time_seconds pass, whichever is first.
+
+        @returns {String} --- 'finished', 'stalled' or 'timeout'.
+
+        @throws {NodeFailure} --- As soon as any node's process dies.
+        '''
+        deadline = time.time() + max_wait_time_seconds
+        while time.time() < deadline:
+            time.sleep(min(NODE_POLL_PERIOD_SECONDS,
+                           max(0,deadline - time.time())))
+            if self.check_nodes():
+                self.print_progress()
+                print '\nHead finished\n'
+                return 'finished'
+            if time.time() - self.last_print_time < PROGRESS_PRINT_PERIOD_SECONDS:
+                continue
+            self.print_progress()
+            if self.stalled():
+                print (
+                    '\nNo progress from any node for %is\n' %
+                    STALL_TIMEOUT_SECONDS)
+                return 'stalled'
+        print '\nNo result after %is; giving up\n' % max_wait_time_seconds
+        return 'timeout'
+
+
+class BackgroundCall(object):
+    '''
+    Runs a function on its own thread.  Has the same wait() as the
+    Popen objects that HostEntry's other issue_* methods return, so
+    callers can wait on either.
+    '''
+    def __init__(self,func):
+        self.thread = threading.Thread(target=func)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def wait(self):
+        self.thread.join()
+
+
+class CommandFuture(object):
+    '''
+    A command running in the background whose output is captured.
+    wait() matches Popen.wait(), so callers that only wait can treat a
+    CommandFuture like the Popen objects issue_ssh returns.
+    '''
+    def __init__(self,cmd_vec):
+        self.proc = subprocess.Popen(
+            cmd_vec,stdout=subprocess.PIPE,stderr=subprocess.STDOUT)
+        self.output = None
+        # read on a separate thread so that a chatty command cannot
+        # block on a full pipe.
+        self.reader = threading.Thread(target=self._read_output)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def _read_output(self):
+        self.output = self.proc.communicate()[0]
+
+    def done(self):
+        return not self.reader.is_alive()
+
+    def result(self,timeout=None):
+        '''
+        @returns {tuple} --- (exit code, combined stdout and stderr), or
+        None if timeout (in seconds) passes first.
+        '''
+        self.reader.join(timeout)
+        if self.reader.is_alive():
+            return None
+        return (self.proc.returncode,self.output)
+
+    def wait(self):
+        return self.result()[0]
+
+
+def fan_out(host_entry_list,ssh_cmd_str):
+    '''
+    Run ssh_cmd_str on every host at once.
+
+    @returns {list} --- Each element is a (host_entry, exit code,
+    output) tuple, in the same order as host_entry_list.
+    '''
+    connect_all(host_entry_list)
+    futures = [
+        host_entry.run_async(ssh_cmd_str) for host_entry in host_entry_list]
+    to_return = []
+    for host_entry, future in zip(host_entry_list,futures):
+        returncode, output = future.result()
+        to_return.append((host_entry,returncode,output))
+    return to_return
+
+
+def ensure_ssh_control_dir():
+    '''
+    Create SSH_CONTROL_DIR, readable and writable by this user only.
+    Stops if it is a symlink or another user's, rather than put our
+    masters' sockets where someone else can reach them.
+    '''
+    try:
+        os.mkdir(SSH_CONTROL_DIR,SSH_CONTROL_DIR_MODE)
+    except OSError:
+        # already there, possibly made by another thread
+        pass
+    st = os.lstat(SSH_CONTROL_DIR)
+    if (not stat.S_ISDIR(st.st_mode)) or (st.st_uid != os.getuid()):
+        print ('%s is not a directory owned by this user; remove it' %
+               SSH_CONTROL_DIR)
+        assert(False)
+    if stat.S_IMODE(st.st_mode) != SSH_CONTROL_DIR_MODE:
+        os.chmod(SSH_CONTROL_DIR,SSH_CONTROL_DIR_MODE)
+
+
+def connect_all(host_entry_list):
+    '''
+    Open each host's multiplexed connection, all handshakes at once.
+    '''
+    for proc in [host_entry.connect() for host_entry in host_entry_list]:
+        proc.wait()
+
+    
 class HostEntry(object):
-    def __init__(self,key_filename,username,hostname):
+    def __init__(self,key_filename,username,hostname,
+                 ssh_port=DEFAULT_SSH_PORT,extra_ssh_options=None):
         '''
         @param {string} key_filename --- None if should not use
         keyfile.
+
+        @param {int} ssh_port --- Port sshd listens on.  Together with
+        extra_ssh_options (a list of -o values, eg.
+        ['UserKnownHostsFile=/dev/null']), lets tests point a HostEntry
+        at a throwaway local sshd.
         '''
         self.key_filename = key_filename
         self.username = username
         self.hostname = hostname
+        self.ssh_port = ssh_port
+        self.extra_ssh_options = []
+        # set by plan_cpus
+        self.cpu_placement = None
+        if extra_ssh_options is not None:
+            self.extra_ssh_options = extra_ssh_options
 
     def issue_stop_ovs_controller(self):
         ssh_cmd = 'sudo service openvswitch-controller stop'
@@ -252,30 +992,74 @@ class HostEntry(object):
     def issue_bridges_down(self):
         '''
         Stopping mininet sometimes doesn't cleanly bring down all the
-        bridges that we set up.  Therefore, we expclicitly bring
-        switches down with an ssh command.
+        bridges that we set up.  Therefore, we expclicitly delete all
+        bridges in one ovsdb transaction.
+
+        @returns {BackgroundCall}
         '''
-        ssh_cmd = (
-            'sudo ovs-vsctl list-br | xargs -L 1 -I ' +
-            '\'{1}\' sudo ovs-vsctl del-br \'{1}\'')
-        return self.issue_ssh(ssh_cmd)
+        def bridges_down():
+            with self.ovsdb() as client:
+                client.del_bridges(client.bridges().keys())
+        return BackgroundCall(bridges_down)
         
-    def version_mininet(self,num_switches):
+    def version_mininet(self,num_switches,
+                        timeout_seconds=MININET_START_TIMEOUT_SECONDS):
         '''
-        Update each switch to speak 1.3 protocol instead of 1.0
+        Wait for mininet to create all num_switches switches, then
+        update each to speak 1.3 protocol instead of 1.0, in one ovsdb
+        transaction.
         '''
         # start at 1 because switches are named starting at 1 as s1,
         # s2, s3, etc.
-        bridge_cmd = ''
-        for i in range(1,1+num_switches):
-            bridge_cmd += (
-                'sudo ovs-vsctl set bridge s%i protocols=OpenFlow13; ' %
-                i)
-        self.issue_ssh(bridge_cmd,True)
+        switch_names = ['s%i' % i for i in range(1,1+num_switches)]
+        deadline = time.time() + timeout_seconds
+        with self.ovsdb() as client:
+            while not set(switch_names) <= set(client.bridges()):
+                if time.time() > deadline:
+                    raise NodeFailure(
+                        self.hostname,
+                        'mininet did not create %i switches within %is' %
+                        (num_switches,timeout_seconds))
+                time.sleep(STARTUP_POLL_PERIOD_SECONDS)
+            client.set_protocols(switch_names)
+
+    def ovsdb(self):
+        '''
+        @returns {OvsdbClient} --- Connected to the ovsdb-server on this
+        host.  Caller should close it.
+        '''
+        return ovsdb.connect_remote(self.ssh_cmd_vec())
         
+    def plan_cpus(self,governor=cpu_plan.DEFAULT_GOVERNOR):
+        '''
+        Split this host's cores between the jvm, ovs and mininet, pin
+        ovs and set the governor.  Commands started afterwards get their
+        cores from place.  Undo with release_cpus.
+        '''
+        shell = cpu_plan.host_shell(self)
+        self.cpu_placement = cpu_plan.plan(
+            cpu_plan.read_cores(shell),governor=governor)
+        self.cpu_placement.apply(shell)
+
+    def release_cpus(self):
+        if self.cpu_placement is not None:
+            self.cpu_placement.restore(cpu_plan.host_shell(self))
+            self.cpu_placement = None
+
+    def place(self,component):
+        '''
+        @returns {String} --- Shell prefix that keeps a command on
+        component's cores (one of cpu_plan.COMPONENTS), or '' if cpus
+        are not planned.
+        '''
+        if self.cpu_placement is None:
+            return ''
+        return self.cpu_placement.shell_prefix(component)
+
     def start_mininet(self,num_switches):
         ssh_cmd_str = (
-            'sudo mn --controller=remote --topo=linear,%i' % num_switches)
+            '%ssudo mn --controller=remote --topo=linear,%i' % (
+                self.place(cpu_plan.HOUSEKEEPING),num_switches))
         self.issue_ssh(ssh_cmd_str)
 
     def stop_mininet(self):
@@ -294,9 +1078,7 @@ class HostEntry(object):
         @param {boolean} recursive --- True if should issue scp as
         recursive.  False otherwise.
         '''
-        cmd_vec = ['scp','-o','StrictHostKeyChecking=no']
-        if self.key_filename is not None:
-            cmd_vec.extend(['-i',self.key_filename])
+        cmd_vec = self.scp_cmd_vec()
         if recursive:
             cmd_vec.append('-r')
 
@@ -310,20 +1092,84 @@ class HostEntry(object):
         
         
     def collect_result_file(self,foreign_filename,local_filename):
-        cmd_vec = ['scp','-o','StrictHostKeyChecking=no']
-        if self.key_filename is not None:
-            cmd_vec.extend(['-i',self.key_filename])
+        cmd_vec = self.scp_cmd_vec()
         cmd_vec.append('%s@%s:%s' % (self.username,self.hostname,foreign_filename))
         cmd_vec.append(local_filename)
-        p = subprocess.Popen(cmd_vec)
-        p.wait()
+        with tracing.span(
+            'collect_result_file',host=self.hostname,file=foreign_filename):
+            p = subprocess.Popen(cmd_vec)
+            p.wait()
         
-    def issue_ssh(self,ssh_cmd_str,block_until_completion=False,
-                  fname_to_pipe_to=None):
-        cmd_vec = ['ssh','-o','StrictHostKeyChecking=no']
+    def ssh_options(self):
+        '''
+        @returns {list} --- Options shared by ssh and scp, including
+        the ones that route sessions over this host's multiplexed
+        connection.
+        '''
+        ensure_ssh_control_dir()
+        options = ['-o','StrictHostKeyChecking=no']
         if self.key_filename is not None:
-            cmd_vec.extend(['-i',self.key_filename])
+            options.extend(['-i',self.key_filename])
+        options.extend([
+            '-o','ControlMaster=auto',
+            '-o','ControlPath=%s' % os.path.join(SSH_CONTROL_DIR,'%r@%h:%p'),
+            '-o','ControlPersist=%i' % SSH_CONTROL_PERSIST_SECONDS])
+        for option in self.extra_ssh_options:
+            options.extend(['-o',option])
+        return options
+
+    def ssh_cmd_vec(self,forward_agent=False):
+        '''
+        @param {boolean} forward_agent --- Forward this machine's ssh
+        agent, so that the session can ssh on to other hosts.
+
+        @returns {list} --- Command vector that opens an ssh session to
+        this host; append the remote command to it.
+        '''
+        cmd_vec = ['ssh','-p',str(self.ssh_port)] + self.ssh_options()
+        if forward_agent:
+            cmd_vec.extend(['-o','ForwardAgent=yes'])
         cmd_vec.append('%s@%s' % (self.username,self.hostname))
+        return cmd_vec
+
+    def scp_cmd_vec(self):
+        return ['scp','-P',str(self.ssh_port)] + self.ssh_options()
+
+    def connect(self):
+        '''
+        Start this host's multiplexed master connection in the
+        background, if it is not already running.
+
+        @returns {Popen} --- Exits once the master is up.
+        '''
+        check_vec = self.ssh_cmd_vec()
+        check_vec[1:1] = ['-O','check']
+        master_vec = self.ssh_cmd_vec()
+        master_vec[1:1] = ['-M','-N','-f']
+        shell_cmd = '%s >/dev/null 2>&1 || %s' % (
+            ' '.join(pipes.quote(arg) for arg in check_vec),
+            ' '.join(pipes.quote(arg) for arg in master_vec))
+        return subprocess.Popen(shell_cmd,shell=True)
+
+    def disconnect(self):
+        cmd_vec = self.ssh_cmd_vec()
+        cmd_vec[1:1] = ['-O','exit']
+        with open(os.devnull,'w') as devnull:
+            return subprocess.call(cmd_vec,stdout=devnull,stderr=devnull)
+
+    def run_async(self,ssh_cmd_str,forward_agent=False):
+        '''
+        @param {boolean} forward_agent --- @see ssh_cmd_vec
+
+        @returns {CommandFuture} --- Runs ssh_cmd_str on this host and
+        captures its exit code and output.
+        '''
+        return CommandFuture(
+            self.ssh_cmd_vec(forward_agent) + [ssh_cmd_str])
+
+    def issue_ssh(self,ssh_cmd_str,block_until_completion=False,
+                  fname_to_pipe_to=None):
+        cmd_vec = self.ssh_cmd_vec()
         cmd_vec.append(ssh_cmd_str)
 
         if fname_to_pipe_to is not None:
@@ -360,6 +1206,14 @@ def read_conf_file(conf_filename=DEFAULT_CONF_FILE):
     username
     hostname
     ...
+
+    An entry whose key filename line is "netns" is a host emulated
+    in a network namespace on this machine (@see netns_cluster):
+
+    #entry
+    netns
+    delay in ms on the emulated host's link
+    index of the emulated host
     
     '''
     with open(conf_filename,'r') as fd:
@@ -379,12 +1233,26 @@ def read_conf_file(conf_filename=DEFAULT_CONF_FILE):
             key_filename = None
         username = split_conf[i+2].strip()
         hostname = split_conf[i+3].strip()
+        if key_filename == 'netns':
+            # imported here because netns_cluster builds on this module
+            from netns_cluster import NamespaceHostEntry
+            host_entries.append(
+                NamespaceHostEntry(int(hostname),float(username)))
+            continue
         host_entries.append(HostEntry(key_filename,username,hostname))
     return host_entries
     
     
 if __name__ == '__main__':
     host_entry_list = read_conf_file()
+    if len(sys.argv) == 2:
+        # run the given command on every host and print what each said
+        failed = False
+        for host_entry, returncode, output in fan_out(host_entry_list,sys.argv[1]):
+            print '\n%s (exit %i):\n%s' % (host_entry.hostname,returncode,output)
+            failed = failed or (returncode != 0)
+        sys.exit(1 if failed else 0)
+
     for host_entry in host_entry_list:
         host_entry.debug_print()
 
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+'''
+Runs a throwaway sshd on this machine, listening on localhost only and
+letting in only a key made for it, so that HostEntry's multiplexed
+connections and fan_out can be exercised without any remote host:
+
+    ./local_sshd.py check
+
+starts one, checks the pool against it (masters, futures, exit codes,
+fan out, scp over the master, disconnect), prints what failed, and
+exits non-zero if anything did.  Other scripts can borrow one with
+
+    with local_sshd() as host_entry:
+        ...
+
+Needs OpenSSH's sshd and ssh-keygen; no root, since sshd then only
+lets in the user that started it.
+'''
+
+import getpass
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from dist_util import HostEntry, fan_out, connect_all
+
+SSHD_CANDIDATES = ['/usr/sbin/sshd', '/usr/local/sbin/sshd']
+LOCALHOST = '127.0.0.1'
+SSHD_START_TIMEOUT_SECONDS = 10
+SSHD_POLL_PERIOD_SECONDS = .1
+# hosts check fans out to; all of them are the one local sshd
+NUM_CHECK_HOSTS = 3
+
+SSHD_CONFIG = '''
+ListenAddress %(address)s
+Port %(port)i
+HostKey %(host_key)s
+AuthorizedKeysFile %(authorized_keys)s
+PidFile %(pid_file)s
+PubkeyAuthentication yes
+PasswordAuthentication no
+KbdInteractiveAuthentication no
+UsePAM no
+StrictModes no
+'''
+
+
+def find_sshd():
+    for fname in SSHD_CANDIDATES:
+        if os.path.exists(fname):
+            return fname
+    return None
+
+
+def free_port():
+    '''
+    @returns {int} --- A localhost port nothing was listening on a
+    moment ago.
+    '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((LOCALHOST, 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def keygen(fname):
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call(
+            ['ssh-keygen', '-q', '-t', 'ed25519', '-N', '', '-f', fname],
+            stdout=devnull)
+
+
+def listening(port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.connect((LOCALHOST, port))
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+
+@contextmanager
+def local_sshd():
+    '''
+    @returns {HostEntry} --- Logs in to a new sshd on localhost as this
+    user.  The sshd, and its keys, are gone after the with block.
+    '''
+    sshd = find_sshd()
+    if sshd is None:
+        print 'No sshd in %s' % ', '.join(SSHD_CANDIDATES)
+        assert(False)
+
+    tmp_dir = tempfile.mkdtemp(prefix='pronghorn-sshd-')
+    proc = None
+    try:
+        host_key = os.path.join(tmp_dir, 'host_key')
+        client_key = os.path.join(tmp_dir, 'client_key')
+        keygen(host_key)
+        keygen(client_key)
+        authorized_keys = os.path.join(tmp_dir, 'authorized_keys')
+        shutil.copy(client_key + '.pub', authorized_keys)
+
+        port = free_port()
+        config = os.path.join(tmp_dir, 'sshd_config')
+        with open(config, 'w') as fd:
+            fd.write(SSHD_CONFIG % {
+                'address': LOCALHOST, 'port': port, 'host_key': host_key,
+                'authorized_keys': authorized_keys,
+                'pid_file': os.path.join(tmp_dir, 'sshd.pid')})
+        with open(os.path.join(tmp_dir, 'sshd.log'), 'w') as log:
+            # -D: stay in the foreground, so that we can kill it
+            proc = subprocess.Popen(
+                [sshd, '-D', '-e', '-f', config], stdout=log, stderr=log)
+
+        begin = time.time()
+        while not listening(port):
+            if (proc.poll() is not None) or (
+                    (time.time() - begin) > SSHD_START_TIMEOUT_SECONDS):
+                with open(os.path.join(tmp_dir, 'sshd.log'), 'r') as fd:
+                    print 'sshd did not start:\n%s' % fd.read()
+                assert(False)
+            time.sleep(SSHD_POLL_PERIOD_SECONDS)
+
+        host_entry = HostEntry(
+            client_key, getpass.getuser(), LOCALHOST, port,
+            ['UserKnownHostsFile=/dev/null', 'LogLevel=ERROR',
+             'IdentitiesOnly=yes', 'BatchMode=yes'])
+        try:
+            yield host_entry
+        finally:
+            host_entry.disconnect()
+    finally:
+        if (proc is not None) and (proc.poll() is None):
+            proc.terminate()
+            proc.wait()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def check():
+    '''
+    @returns {list} --- Descriptions of the checks that failed.
+    '''
+    failures = []
+    def expect(what, ok):
+        print '%-44s %s' % (what, 'ok' if ok else 'FAILED')
+        if not ok:
+            failures.append(what)
+
+    with local_sshd() as host_entry:
+        connect_all([host_entry])
+        check_vec = host_entry.ssh_cmd_vec()
+        check_vec[1:1] = ['-O', 'check']
+        with open(os.devnull, 'w') as devnull:
+            expect('master running after connect_all',
+                   subprocess.call(
+                       check_vec, stdout=devnull, stderr=devnull) == 0)
+
+        expect('run_async output',
+               host_entry.run_async('echo hello').result() == (0, 'hello\n'))
+        expect('run_async exit code',
+               host_entry.run_async('exit 3').wait() == 3)
+
+        hosts = [host_entry] * NUM_CHECK_HOSTS
+        results = fan_out(hosts, 'echo $$')
+        expect('fan_out exit codes',
+               [returncode for h, returncode, output in results] ==
+               [0] * NUM_CHECK_HOSTS)
+        # one shell per session, all over the same master
+        expect('fan_out ran a session per host',
+               len(set(output for h, r, output in results)) ==
+               NUM_CHECK_HOSTS)
+
+        local_fd, local_fname = tempfile.mkstemp()
+        os.write(local_fd, 'copied\n')
+        os.close(local_fd)
+        foreign_fname = local_fname + '.copy'
+        try:
+            host_entry.scp_to_foreign(
+                local_fname, foreign_fname, False, True)
+            expect('scp over the master',
+                   host_entry.run_async('cat %s' % foreign_fname).result() ==
+                   (0, 'copied\n'))
+        finally:
+            for fname in (local_fname, foreign_fname):
+                if os.path.exists(fname):
+                    os.remove(fname)
+
+        expect('disconnect stops the master',
+               host_entry.disconnect() == 0)
+    return failures
+
+
+def print_usage():
+    print ('''
+
+  ./local_sshd.py check
+
+Starts a throwaway sshd on localhost and checks dist_util's ssh pool
+against it.
+
+''')
+
+
+if __name__ == '__main__':
+    if (len(sys.argv) == 2) and (sys.argv[1] == 'check'):
+        failures = check()
+        if len(failures) != 0:
+            print '\n%i checks failed\n' % len(failures)
+            sys.exit(1)
+        print '\nAll checks passed\n'
+    else:
+        print_usage()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+
+'''
+Emulates a cluster of hosts on one Linux box, so that the dist_*
+experiments can run without EC2.  Each emulated host is a network
+namespace with its own ovsdb-server and ovs-vswitchd (userspace
+datapath), its own home directory, and a veth link to a bridge shared by
+all of them.  Each link can be delayed.
+
+NamespaceHostEntry stands in for HostEntry: commands that would run over
+ssh run inside the namespace instead, so run_linear_test and
+run_tree_test work unchanged.  The driver must then run as root.  To
+use, point distributed.cfg at namespaces, eg.:
+
+    ./netns_cluster.py conf 10 2 > distributed.cfg
+
+and tear them down afterwards with
+
+    ./netns_cluster.py destroy
+'''
+
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+from dist_util import HostEntry, BackgroundCall, read_conf_file
+from dist_util import DEFAULT_CONF_FILE
+import ovsdb
+
+NAMESPACE_PREFIX = 'pgnode'
+HOST_VETH_PREFIX = 'pgnh'
+NAMESPACE_VETH_PREFIX = 'pgnc'
+CLUSTER_BRIDGE = 'pgcluster'
+# every emulated host gets NODE_ADDRESS_FORMAT % index on one /24; the
+# bridge has MAX_NODE_INDEX + 1
+NODE_ADDRESS_FORMAT = '10.253.0.%i'
+SUBNET_PREFIX_LEN = 24
+MAX_NODE_INDEX = 253
+# emulated hosts' home directories, ovs databases and logs
+CLUSTER_ROOT = '/var/tmp/pronghorn-cluster'
+OVS_SCHEMA = '/usr/share/openvswitch/vswitch.ovsschema'
+# key line of a distributed.cfg entry for an emulated host
+CONF_KEY = 'netns'
+
+# Commands run under bash with sudo made a no-op (everything already
+# runs as root) and pkill limited to this namespace's processes, since
+# all emulated hosts share one pid namespace.  The command itself is $1.
+COMMAND_WRAPPER = (
+    'sudo() { "$@"; }; '
+    'pkill() { command pkill --ns $$ --nslist net "$@"; }; '
+    'cd "$HOME" && eval "$1"')
+
+# creating the shared bridge is not idempotent
+_bridge_lock = threading.Lock()
+
+
+def ensure_cluster_bridge():
+    with _bridge_lock:
+        with open(os.devnull, 'w') as devnull:
+            if subprocess.call(
+                ['ip', 'link', 'show', CLUSTER_BRIDGE],
+                stdout=devnull, stderr=devnull) == 0:
+                return
+        subprocess.check_call(
+            ['ip', 'link', 'add', CLUSTER_BRIDGE, 'type', 'bridge'])
+        subprocess.check_call(
+            ['ip', 'addr', 'add',
+             '%s/%i' % (NODE_ADDRESS_FORMAT % (MAX_NODE_INDEX + 1),
+                        SUBNET_PREFIX_LEN),
+             'dev', CLUSTER_BRIDGE])
+        subprocess.check_call(['ip', 'link', 'set', CLUSTER_BRIDGE, 'up'])
+
+
+class NamespaceHostEntry(HostEntry):
+    def __init__(self, index, delay_ms=0):
+        '''
+        @param {int} index --- Distinguishes this emulated host from
+        others.  Between 1 and MAX_NODE_INDEX.
+
+        @param {float} delay_ms --- Added to each direction of this
+        host's link to the shared bridge, so a one-way trip between two
+        emulated hosts takes the sum of their delays.
+        '''
+        if (index < 1) or (index > MAX_NODE_INDEX):
+            print '\nEmulated host index %i out of range\n' % index
+            assert False
+
+        HostEntry.__init__(
+            self, None, 'root', NODE_ADDRESS_FORMAT % index)
+        self.index = index
+        self.delay_ms = delay_ms
+        self.namespace = '%s%i' % (NAMESPACE_PREFIX, index)
+        self.host_veth = '%s%i' % (HOST_VETH_PREFIX, index)
+        self.namespace_veth = '%s%i' % (NAMESPACE_VETH_PREFIX, index)
+        self.home = os.path.join(CLUSTER_ROOT, self.namespace)
+        self.ovs_dir = os.path.join(self.home, 'ovs')
+        self.db_socket = os.path.join(self.ovs_dir, 'db.sock')
+
+    def ovs_env(self):
+        return [
+            'HOME=%s' % self.home,
+            'OVS_RUNDIR=%s' % self.ovs_dir,
+            'OVS_DBDIR=%s' % self.ovs_dir,
+            'OVS_LOGDIR=%s' % self.ovs_dir]
+
+    def ns_cmd_vec(self):
+        return (['ip', 'netns', 'exec', self.namespace, 'env'] +
+                self.ovs_env())
+
+    def ssh_cmd_vec(self, forward_agent=False):
+        '''
+        @param {boolean} forward_agent --- Ignored: there is no ssh
+        session to forward an agent over.
+
+        @returns {list} --- Command vector that runs a shell command in
+        this host's namespace, from its home directory; append the
+        command to it.
+        '''
+        return self.ns_cmd_vec() + ['bash', '-c', COMMAND_WRAPPER, 'node']
+
+    def exists(self):
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.call(
+                ['ip', 'netns', 'exec', self.namespace, 'true'],
+                stderr=devnull) == 0
+
+    def connect(self):
+        '''
+        Bring up this emulated host if it is not already up.
+
+        @returns {BackgroundCall}
+        '''
+        return BackgroundCall(self.create)
+
+    def disconnect(self):
+        return 0
+
+    def create(self):
+        if not self.exists():
+            self.create_namespace()
+        self.set_delay()
+        self.start_ovs()
+
+    def create_namespace(self):
+        ensure_cluster_bridge()
+        subprocess.check_call(['ip', 'netns', 'add', self.namespace])
+        subprocess.check_call(
+            ['ip', 'link', 'add', self.host_veth, 'type', 'veth',
+             'peer', 'name', self.namespace_veth])
+        subprocess.check_call(
+            ['ip', 'link', 'set', self.namespace_veth,
+             'netns', self.namespace])
+        subprocess.check_call(
+            ['ip', 'link', 'set', self.host_veth,
+             'master', CLUSTER_BRIDGE, 'up'])
+        self.ns_call(
+            ['ip', 'addr', 'add',
+             '%s/%i' % (self.hostname, SUBNET_PREFIX_LEN),
+             'dev', self.namespace_veth])
+        self.ns_call(['ip', 'link', 'set', self.namespace_veth, 'up'])
+        self.ns_call(['ip', 'link', 'set', 'lo', 'up'])
+
+    def set_delay(self):
+        '''
+        Uses replace, so can be called any number of times.
+        '''
+        delay = '%fms' % self.delay_ms
+        subprocess.check_call(
+            ['tc', 'qdisc', 'replace', 'dev', self.host_veth, 'root',
+             'netem', 'delay', delay])
+        self.ns_call(
+            ['tc', 'qdisc', 'replace', 'dev', self.namespace_veth, 'root',
+             'netem', 'delay', delay])
+
+    def start_ovs(self):
+        '''
+        Start this host's own ovsdb-server and ovs-vswitchd, unless
+        they are already running.
+        '''
+        if not os.path.isdir(self.ovs_dir):
+            os.makedirs(self.ovs_dir)
+        if os.path.exists(self.db_socket):
+            with open(os.devnull, 'w') as devnull:
+                if subprocess.call(
+                    ['ovs-vsctl', '--db=unix:%s' % self.db_socket,
+                     '--timeout=1', 'show'],
+                    stdout=devnull, stderr=devnull) == 0:
+                    return
+
+        db_fname = os.path.join(self.ovs_dir, 'conf.db')
+        if not os.path.exists(db_fname):
+            subprocess.check_call(
+                ['ovsdb-tool', 'create', db_fname, OVS_SCHEMA])
+        self.ns_call(
+            ['ovsdb-server', db_fname,
+             '--remote=punix:%s' % self.db_socket,
+             '--pidfile', '--detach', '--log-file'])
+        self.ns_call(
+            ['ovs-vsctl', '--db=unix:%s' % self.db_socket,
+             '--no-wait', 'init'])
+        self.ns_call(
+            ['ovs-vswitchd', 'unix:%s' % self.db_socket,
+             '--pidfile', '--detach', '--log-file'])
+
+    def destroy(self):
+        for daemon in ('ovs-vswitchd', 'ovsdb-server'):
+            pid_fname = os.path.join(self.ovs_dir, daemon + '.pid')
+            if os.path.exists(pid_fname):
+                with open(pid_fname) as fd:
+                    pid = fd.read().strip()
+                with open(os.devnull, 'w') as devnull:
+                    subprocess.call(['kill', pid], stderr=devnull)
+        # deleting the namespace also deletes both ends of the veth
+        # pair.  Ignore failure in case it does not exist.
+        with open(os.devnull, 'w') as devnull:
+            subprocess.call(
+                ['ip', 'netns', 'del', self.namespace], stderr=devnull)
+        shutil.rmtree(self.home, True)
+
+    def ns_call(self, cmd):
+        subprocess.check_call(self.ns_cmd_vec() + cmd)
+
+    def ovsdb(self):
+        return ovsdb.connect_local(self.db_socket)
+
+    def issue_stop_ovs_controller(self):
+        # there is no system openvswitch-controller inside a namespace,
+        # and stopping the real one would affect the whole box.
+        return self.issue_ssh('true')
+
+    def start_mininet(self, num_switches):
+        # kernel datapaths belong to the box, not the namespace's own
+        # ovs-vswitchd
+        ssh_cmd_str = (
+            'sudo mn --controller=remote --switch=ovs,datapath=user '
+            '--topo=linear,%i' % num_switches)
+        self.issue_ssh(ssh_cmd_str)
+
+    def plan_cpus(self, governor=None):
+        # emulated hosts share one box's cores, governors and
+        # ovs-vswitchd names, so per-host plans would overlap.
+        print '\nNot planning cpus for emulated host %s\n' % self.hostname
+
+    def scp_to_foreign(self, local_name, foreign_name, recursive,
+                       block_until_completion=False):
+        cmd_vec = ['cp']
+        if recursive:
+            cmd_vec.append('-r')
+        cmd_vec.extend([local_name, os.path.join(self.home, foreign_name)])
+        p = subprocess.Popen(cmd_vec)
+        if block_until_completion:
+            p.wait()
+        return p
+
+    def collect_result_file(self, foreign_filename, local_filename):
+        subprocess.call(
+            ['cp', os.path.join(self.home, foreign_filename), local_filename])
+
+    def debug_print(self):
+        print '%s (namespace %s, %sms delay)' % (
+            self.hostname, self.namespace, self.delay_ms)
+
+
+def conf_entry(index, delay_ms):
+    '''
+    @returns {String} --- A distributed.cfg entry for an emulated host.
+    @see dist_util.read_conf_file
+    '''
+    return '#entry\n%s\n%s\n%i' % (CONF_KEY, delay_ms, index)
+
+
+def destroy_cluster(host_entry_list):
+    for host_entry in host_entry_list:
+        if isinstance(host_entry, NamespaceHostEntry):
+            host_entry.destroy()
+    with open(os.devnull, 'w') as devnull:
+        subprocess.call(
+            ['ip', 'link', 'del', CLUSTER_BRIDGE], stderr=devnull)
+
+
+def print_usage():
+    print ('''
+
+  ./netns_cluster.py conf <number of hosts> <delay ms>
+  ./netns_cluster.py destroy [conf file]
+
+conf prints a configuration file for a cluster of emulated hosts.
+Hosts are brought up the first time an experiment connects to them.
+destroy tears down the emulated hosts in conf file (default %s).
+
+''' % DEFAULT_CONF_FILE)
+
+
+if __name__ == '__main__':
+    if (len(sys.argv) == 4) and (sys.argv[1] == 'conf'):
+        # read_conf_file does not allow a trailing newline
+        sys.stdout.write('\n'.join(
+            conf_entry(index, float(sys.argv[3]))
+            for index in range(1, 1 + int(sys.argv[2]))))
+    elif (len(sys.argv) in (2, 3)) and (sys.argv[1] == 'destroy'):
+        destroy_cluster(read_conf_file(*sys.argv[2:]))
+    else:
+        print_usage()
@@ -1,10 +1,14 @@
 #!/usr/bin/python
 
+import glob
 import os
+import re
+import shutil
 import subprocess
 import sys
 import time
 import threading
+from contextlib import contextmanager
 
 from mininet.net import Mininet
 from mininet.node import OVSSwitch, Controller, RemoteController
@@ -13,12 +17,18 @@ from mininet.topolib import TreeTopo
 from mininet.log import setLogLevel
 from mininet.cli import CLI
 
+import ovsdb
+import jvm
+import host_sampler
+import cpu_plan
+import tracing
+import stat_util
+from convergence import ConvergenceMonitor
+from paths import BASE_PATH, EXPERIMENTS_JAR_DIR, PAPER_DATA
+from catalog import Catalog, DEFAULT_CATALOG_FNAME
+import network_profile
+from network_profile import NetworkProfile, LOOPBACK_SHAPER, link_address
 
-with open(os.path.dirname(os.path.realpath(__file__)) + "/basedir.txt", 'r') as f:
-    BASE_PATH = f.read().strip()
-    
-EXPERIMENTS_JAR_DIR = os.path.join(BASE_PATH,'experiment_jars')
-PAPER_DATA = os.path.join(BASE_PATH, "data")
 
 # controls whether we instantiate a factory to listen for changes or not.
 NO_VERSION_LISTENER_FACTORY = 'no-listener-factory'
@@ -29,27 +39,237 @@ START = int(time.time())
 def reset_start():
     START = int(time.time())
 
-def set_rtt(t_ms):
-    """Sets RTT between switches and controller.
-    Exception on failure"""
+# If non-None, a Catalog of finished runs: Experiment.run skips any
+# point the catalog already has valid results for.
+CATALOG = None
 
-    if (t_ms % 2) != 0:
-        print '\nCannot run.  Require even number of rtt when setting rtt\n'
-        assert False
-    t_ms = t_ms /2
+def use_catalog(fname=DEFAULT_CATALOG_FNAME):
+    global CATALOG
+    CATALOG = Catalog(fname)
 
-    
-    subprocess.call(["tc", "qdisc", "add", "dev", "lo", "root",
-                     "handle", "1:", "prio"])
-    # Delete rule in case it's there, ignore failure in case it's not
-    subprocess.call(["tc", "qdisc", "del", "dev", "lo", "parent", "1:3",
-                     "handle", "10:", "netem", "delay", "%dms" % t_ms])
-    status = subprocess.check_call(["tc", "qdisc", "add", "dev", "lo", "parent", "1:3",
-                              "handle", "10:", "netem", "delay", "%dms" % t_ms])
-    subprocess.check_call(["tc", "filter", "add", "dev", "lo", "protocol",
-                           "ip", "parent", "1:0", "prio", "3", "u32", "match",
-                           "ip", "dst", "127.0.0.2/32", "flowid", "1:3"])
+# How long to wait on each readiness barrier before giving up on a run.
+CONTROLLER_LISTEN_TIMEOUT_SECONDS = 60
+SWITCHES_CONNECTED_TIMEOUT_SECONDS = 60
+READINESS_POLL_PERIOD_SECONDS = .05
 
+# Period of the host-level samples (cpu, softirq, controller and
+# ovs-vswitchd usage, datapath counters) each run writes to its .host
+# sidecar.  None to not sample.
+HOST_SAMPLE_PERIOD_MS = host_sampler.DEFAULT_PERIOD_MS
+
+# If non-None, a cpu_plan.CpuPlacement: each run pins the controller,
+# ovs and the harness (with mininet) to their own cores, holds the cpu
+# governor, and records both in a .placement sidecar.
+CPU_PLACEMENT = None
+
+def use_cpu_plan(housekeeping_cores=cpu_plan.DEFAULT_HOUSEKEEPING_CORES,
+                 ovs_cores=cpu_plan.DEFAULT_OVS_CORES,
+                 governor=cpu_plan.DEFAULT_GOVERNOR):
+    '''
+    @returns {boolean} --- True if runs will be placed; False (with a
+    warning) if this machine's cpus cannot be split, eg. it has too few
+    physical cores.
+    '''
+    global CPU_PLACEMENT
+    try:
+        CPU_PLACEMENT = cpu_plan.plan_local(
+            housekeeping_cores, ovs_cores, governor)
+    except cpu_plan.CpuPlanError as ex:
+        print '\nNot placing runs on cpus: %s\n' % ex
+        CPU_PLACEMENT = None
+        return False
+    return True
+
+def place_controller(task):
+    '''
+    @returns {list} --- task, restricted to the controller's cores if
+    there is a CPU_PLACEMENT.
+    '''
+    if CPU_PLACEMENT is None:
+        return task
+    return CPU_PLACEMENT.prefix(cpu_plan.CONTROLLER) + task
+
+# /proc/net/tcp state code for a listening socket
+TCP_LISTEN_STATE = '0A'
+
+
+class ReadinessTimeout(Exception):
+    pass
+
+
+def wait_until(predicate, timeout_seconds, what, give_up=None):
+    '''
+    Polls predicate until it returns True.
+
+    @param {function or None} give_up --- If non-None, polled along
+    with predicate.  If it returns True, stop waiting immediately
+    (eg., because the process we were waiting on died).
+
+    @returns {float} --- Seconds spent waiting.
+
+    Raises ReadinessTimeout if predicate does not become True within
+    timeout_seconds, or if give_up returns True.
+    '''
+    begin = time.time()
+    while not predicate():
+        if (give_up is not None) and give_up():
+            raise ReadinessTimeout('Gave up waiting for %s' % what)
+        if (time.time() - begin) > timeout_seconds:
+            raise ReadinessTimeout(
+                'Timed out after %is waiting for %s' % (timeout_seconds, what))
+        time.sleep(READINESS_POLL_PERIOD_SECONDS)
+    return time.time() - begin
+
+
+def port_listening(port, pid='self'):
+    '''
+    @returns {boolean} --- True if there is a tcp socket listening on
+    port in the network namespace of process pid.
+
+    Reads /proc instead of connecting so that the controller never
+    sees a probe connection that it might mistake for a switch.
+    '''
+    hex_port = '%04X' % port
+    for table in ('tcp', 'tcp6'):
+        try:
+            with open('/proc/%s/net/%s' % (pid, table), 'r') as fd:
+                lines = fd.readlines()[1:]
+        except IOError:
+            continue
+        for line in lines:
+            fields = line.split()
+            local_port = fields[1].split(':')[-1]
+            if (local_port == hex_port) and (fields[3] == TCP_LISTEN_STATE):
+                return True
+    return False
+
+
+# How often to look for new results, how often to print progress, how
+# long a run may go without writing results or controller output before
+# we call it stalled (from the start of the measurement: the jars write
+# a row only when a thread finishes, so a run that hangs before then
+# has written nothing), and the most a run's measurement may take.
+PROGRESS_POLL_PERIOD_SECONDS = .5
+PROGRESS_PRINT_PERIOD_SECONDS = 5
+STALL_TIMEOUT_SECONDS = 60
+RUN_TIMEOUT_SECONDS = 60 * 60
+
+
+class OutputFollower(object):
+    '''
+    Follows an experiment's output file while the controller runs,
+    printing progress (operations so far and the current operation
+    rate) and noticing when a run stops making progress.
+    '''
+    def __init__(self, fname, on_row=None):
+        '''
+        @param {function or None} on_row --- If non-None, called with
+        each complete row (without its newline) as it is written.
+        '''
+        self.fname = fname
+        self.on_row = on_row
+        # operations (numeric fields) in complete rows
+        self.ops = 0
+        self.last_activity = time.time()
+        self.partial_row = ''
+        self.stopped = False
+        self.thread = threading.Thread(target=self._follow)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def activity(self):
+        '''
+        Note that the run did something (eg., the controller printed a
+        line), even if it did not write a row.
+        '''
+        self.last_activity = time.time()
+
+    def stalled(self):
+        '''
+        @returns {boolean} --- True if nothing has happened for
+        STALL_TIMEOUT_SECONDS, whether or not any row was written.
+        '''
+        return (time.time() - self.last_activity) > STALL_TIMEOUT_SECONDS
+
+    def ops_so_far(self):
+        '''
+        @returns {int} --- Operations written, counting fields of a row
+        still being written.
+        '''
+        return self.ops + self.partial_row.count(',')
+
+    def stop(self):
+        self.stopped = True
+        self.thread.join()
+
+    def _follow(self):
+        fd = None
+        last_print_time = time.time()
+        last_print_ops = 0
+        while not self.stopped:
+            if (fd is None) and os.path.exists(self.fname):
+                fd = open(self.fname, 'r')
+            if fd is not None:
+                self._read_rows(fd)
+
+            now = time.time()
+            if (now - last_print_time) >= PROGRESS_PRINT_PERIOD_SECONDS:
+                ops = self.ops_so_far()
+                rate = (ops - last_print_ops) / (now - last_print_time)
+                print '%s: %i ops, %.1f ops/s' % (
+                    os.path.basename(self.fname), ops, rate)
+                sys.stdout.flush()
+                last_print_time = now
+                last_print_ops = ops
+            time.sleep(PROGRESS_POLL_PERIOD_SECONDS)
+
+        if fd is not None:
+            self._read_rows(fd)
+            fd.close()
+
+    def _read_rows(self, fd):
+        data = fd.read()
+        if len(data) == 0:
+            return
+        self.activity()
+        rows = (self.partial_row + data).split('\n')
+        # last element is an incomplete row (or empty)
+        self.partial_row = rows.pop()
+        for row in rows:
+            self.ops += len(stat_util.parse_samples(row))
+            if self.on_row is not None:
+                self.on_row(row)
+
+
+class PhaseTimer(object):
+    '''
+    Records how long each named phase of an experiment run takes so
+    that we can see where wall-clock time goes.  Each phase is also a
+    span of the campaign's trace, if tracing.
+    '''
+    def __init__(self, label=None):
+        '''
+        @param {String or None} label --- Run the phases belong to, for
+        the trace.
+        '''
+        # list of (phase name, seconds) tuples, in order
+        self.phases = []
+        self.label = label
+
+    @contextmanager
+    def phase(self, name):
+        begin = time.time()
+        try:
+            with tracing.span(name, run=self.label):
+                yield
+        finally:
+            self.phases.append((name, time.time() - begin))
+
+    def write(self, fname):
+        with open(fname, 'w') as fd:
+            fd.write('phase,seconds\n')
+            for name, seconds in self.phases:
+                fd.write('%s,%f\n' % (name, seconds))
 
 
 def data_dir(task):
@@ -59,52 +279,361 @@ def data_dir(task):
 def output_data_fname(task, basename):
     return "%s/%s.csv" % (data_dir(task), basename)
 
+def output_name(output_file):
+    '''
+    @returns {String} --- <task>/<basename> of a result file in a data
+    directory, without the campaign's start time.
+    '''
+    dirname, basename = os.path.split(output_file)
+    task = re.sub(r'-\d+$', '', os.path.basename(dirname))
+    return '%s/%s' % (task, basename)
+
+def link_results(src_output_file, dst_output_file):
+    '''
+    Hard-link (or, across filesystems, copy) a result file and its
+    sidecars to dst_output_file and the matching sidecar names.
+    '''
+    src_base = os.path.splitext(src_output_file)[0]
+    dst_base = os.path.splitext(dst_output_file)[0]
+    for src in [src_output_file] + glob.glob(src_base + '.*'):
+        dst = dst_base + src[len(src_base):]
+        if os.path.abspath(src) == os.path.abspath(dst):
+            continue
+        if os.path.exists(dst):
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+def sidecar_fname(output_file, kind):
+    '''
+    @returns {String} --- Name of a file that sits next to an
+    experiment's csv and holds auxiliary data about the run (eg.,
+    kind='phases' for phase timings).  Deliberately does not end in
+    .csv so that globbing for results does not pick it up.
+    '''
+    return "%s.%s" % (os.path.splitext(output_file)[0], kind)
+
+
+def switch_number(switch_name):
+    '''
+    @returns {int} --- The number at the end of a switch's name (eg., 3
+    for s3 or for p2s3).
+    '''
+    return int(re.search(r'(\d+)$', switch_name).group(1))
 
 class MultiSwitch( OVSSwitch ):
-    "Custom Switch() subclass that connects to different controllers"
+    """Custom Switch() subclass that connects to different controllers.
+
+    Starting and stopping only pick the switch's controller; Fabric
+    creates and deletes the actual bridges in bulk through ovsdb."""
     def start( self, controllers ):
-        my_num = int(self.name[1:])-1
-        return OVSSwitch.start( self, [ controllers[my_num % len(controllers)] ] )
+        my_num = switch_number(self.name)-1
+        self.controller = controllers[my_num % len(controllers)]
+
+    def stop( self, *args, **kwargs ):
+        self.terminate()
 
+    @classmethod
+    def batchStartup( cls, switches, **kwargs ):
+        return switches
+
+    @classmethod
+    def batchShutdown( cls, switches, **kwargs ):
+        return switches
+
+DEFAULT_SWITCH_PREFIX = 's'
 class FlatTopo(Topo):
     "N switches, no connections, no hosts"
-    def __init__(self, switches=5, **opts):
+    def __init__(self, switches=5, prefix=DEFAULT_SWITCH_PREFIX, **opts):
         Topo.__init__(self, **opts)
         for i in range(switches):
-            switch = self.addSwitch("s%d" % (i + 1))
+            # dpid is explicit so that switches with a prefix like p2s3
+            # get the same datapath id as s3 would.
+            switch = self.addSwitch(
+                "%s%d" % (prefix, i + 1), dpid='%x' % (i + 1))
 
 
 CONTROLLER_OF_PORT = 6633            
+class ControllerEndpoint(object):
+    '''
+    Where an experiment's controller jvm runs and how its switches
+    reach it.  This default runs the controller in the host's own
+    network namespace on CONTROLLER_OF_PORT.  Each switch connects to
+    it at its own loopback address, so that a NetworkProfile can shape
+    each link on lo separately; see netns.NamespaceEndpoint for an
+    isolated alternative.
+    '''
+    ip = '127.0.0.1'
+    port = CONTROLLER_OF_PORT
+    switch_prefix = DEFAULT_SWITCH_PREFIX
+
+    def switch_ip(self, switch_name):
+        '''
+        @returns {String} --- Address the named switch connects to the
+        controller at.
+        '''
+        return link_address(switch_number(switch_name))
+
+    def apply_profile(self, profile, switch_names):
+        '''
+        Shape the links of the named switches as profile says, changing
+        only what differs from the profile applied last.
+        '''
+        LOOPBACK_SHAPER.apply(
+            profile, [switch_number(name) for name in switch_names])
+
+    def verify_profile(self, profile, switch_names, fname=None):
+        '''
+        @throws {NetworkProfileError} --- If the measured rtt of any
+        named switch's link does not match profile.
+        '''
+        network_profile.verify(
+            profile,
+            lambda num: network_profile.measure_rtt(link_address(num)),
+            [switch_number(name) for name in switch_names], fname)
+
+    def clear_profile(self):
+        LOOPBACK_SHAPER.reset()
+
+    def wrap_command(self, task):
+        '''
+        @param {list} task --- Command vector to run the controller.
+        @returns {list} --- Command vector that runs task inside this
+        endpoint.
+        '''
+        return task
+
+    def owns_bridge(self, bridge_name):
+        '''
+        The default endpoint owns every bridge on the host, so that
+        teardown also removes bridges left over by earlier crashed runs.
+        '''
+        return True
+
+
+def destroy_bridges(owns_bridge, client=None):
+    '''
+    Delete every bridge for which owns_bridge(name) is True in a single
+    ovsdb transaction.
+
+    @param {OvsdbClient or None} client --- If None, opens (and closes)
+    a connection to the local ovsdb-server.
+    '''
+    if client is None:
+        with ovsdb.connect_local() as client:
+            return destroy_bridges(owns_bridge, client)
+    client.del_bridges(
+        [name for name in client.bridges() if owns_bridge(name)])
+
+
+def clear_flows(names):
+    '''
+    Delete every flow from the named bridges, one ovs-ofctl per bridge,
+    all at once.  Flows are not in ovsdb, so this cannot be a
+    transaction.
+    '''
+    procs = [
+        (name, subprocess.Popen(
+            ['ovs-ofctl', '-O', ovsdb.OPENFLOW_13, 'del-flows', name]))
+        for name in names]
+    failed = [name for name, proc in procs if proc.wait() != 0]
+    if len(failed) != 0:
+        raise subprocess.CalledProcessError(
+            1, 'ovs-ofctl del-flows %s' % ' '.join(failed))
+
+class Fabric(object):
+    '''
+    A Mininet network and its OVS bridges that outlive a single
+    Experiment run.  Use one for a whole sweep so that bridges and the
+    controller connection survive between points; when a point needs a
+    different number of switches, only the difference is added or
+    removed.
+
+    with Fabric() as fabric:
+        for exp in order_for_fabric(experiments):
+            exp.run(fabric)
+    '''
+    def __init__(self):
+        self.net = None
+        # endpoint of the experiment that built the network.  All
+        # experiments that share a fabric must share an endpoint.
+        self.endpoint = None
+        # every controller endpoint the switches are spread over; the
+        # first is self.endpoint.
+        self.endpoints = []
+        # connection to the local ovsdb-server while the fabric is up
+        self.ovsdb = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.shutdown()
+
+    def attach(self, exp, timer):
+        '''
+        Make the fabric's switches match exp's topology and wait for
+        all of them to be connected to exp's (already listening)
+        controller.
+        '''
+        if self.net is None:
+            new_names = self.build(exp, timer)
+        else:
+            new_names = self.resize(exp, timer)
+
+        switch_names = set(switch.name for switch in self.net.switches)
+
+        # bridges that were connected to a previous run's controller
+        # still hold the flows it installed (their fail mode keeps them
+        # across disconnects), and are in reconnect backoff: empty
+        # them, then kick them so they connect now.
+        reused_names = switch_names - new_names
+        if len(reused_names) != 0:
+            with timer.phase('clear_flows'):
+                clear_flows(sorted(reused_names))
+            with timer.phase('reconnect'):
+                by_target = {}
+                for name in sorted(reused_names):
+                    target = self.bridge_spec(name)[2]
+                    by_target.setdefault(target, []).append(name)
+                for target, names in by_target.items():
+                    self.ovsdb.set_controller(names, target)
+
+        with timer.phase('switches_connected'):
+            wait_until(
+                lambda: switch_names <= self.ovsdb.connected_bridges(),
+                SWITCHES_CONNECTED_TIMEOUT_SECONDS,
+                'switches to connect to controller')
+
+    def bridge_spec(self, name):
+        '''
+        @returns {tuple} --- (name, dpid, controller target) of the
+        named (started) switch, for ovsdb.OvsdbClient.add_bridges.
+        '''
+        switch = self.net.nameToNode[name]
+        endpoint = self.endpoints[self.net.controllers.index(switch.controller)]
+        return (name, switch.dpid,
+                'tcp:%s:%d' % (endpoint.switch_ip(name), endpoint.port))
+
+    def create_bridges(self, names, timer):
+        '''
+        Create the bridges for the named (started) switches, speaking
+        openflow 1.3, in one transaction.
+        '''
+        with timer.phase('create_bridges'):
+            self.ovsdb.add_bridges(
+                [self.bridge_spec(name) for name in sorted(names)])
+
+    def build(self, exp, timer):
+        '''
+        @returns {set} --- Names of all switches created.
+        '''
+        self.endpoint = exp.endpoint
+        self.endpoints = exp.controller_endpoints()
+        self.ovsdb = ovsdb.connect_local()
+        self.net = Mininet(topo=exp.topology, build=False, switch=MultiSwitch)
+        # MultiSwitch spreads switches round-robin over these
+        for i, endpoint in enumerate(self.endpoints):
+            self.net.addController(
+                RemoteController(
+                    "c%d" % i, ip=endpoint.ip, port=endpoint.port))
+        with timer.phase('mininet_build'):
+            self.net.build()
+        with timer.phase('mininet_start'):
+            self.net.start()
+        names = set(switch.name for switch in self.net.switches)
+        self.create_bridges(names, timer)
+        return names
+
+    def resize(self, exp, timer):
+        '''
+        Add switches that exp's topology has but the fabric does not,
+        and remove those the fabric has but the topology does not.
+
+        @returns {set} --- Names of switches that were added.
+        '''
+        wanted = set(exp.topology.switches())
+        current = set(switch.name for switch in self.net.switches)
+
+        with timer.phase('resize'):
+            to_remove = sorted(current - wanted)
+            self.ovsdb.del_bridges(to_remove)
+            for name in to_remove:
+                switch = self.net.nameToNode[name]
+                switch.stop()
+                self.net.switches.remove(switch)
+                del self.net.nameToNode[name]
+
+            for name in sorted(wanted - current):
+                switch = self.net.addSwitch(
+                    name, **exp.topology.nodeInfo(name))
+                switch.start(self.net.controllers)
+        self.create_bridges(wanted - current, timer)
+        return wanted - current
+
+    def shutdown(self):
+        if self.endpoint is None:
+            # never built
+            return
+        for endpoint in self.endpoints:
+            endpoint.clear_profile()
+        if self.net is not None:
+            with tracing.span('mininet_stop'):
+                self.net.stop()
+            self.net = None
+        with tracing.span('destroy_bridges'):
+            destroy_bridges(self.endpoint.owns_bridge, self.ovsdb)
+        if self.ovsdb is not None:
+            self.ovsdb.close()
+            self.ovsdb = None
+
+
+def order_for_fabric(experiments):
+    '''
+    @returns {list} --- experiments, reordered so that running them in
+    sequence on one Fabric changes the number of switches
+    monotonically.  Changing the switch count is the only expensive
+    reconfiguration, so this minimizes total reconfiguration cost.
+    Ties keep their original relative order.
+    '''
+    return sorted(
+        experiments,
+        key=lambda exp: (len(exp.topology.switches()), exp.rtt))
+
+
+def run_sweep(experiments):
+    '''
+    Run all experiments on a single shared Fabric.
+    '''
+    with Fabric() as fabric:
+        for exp in order_for_fabric(experiments):
+            print '\nRunning %s\n' % exp.output_file
+            exp.run(fabric)
+
+
 class setup():
-    def __init__(self, exp):
+    '''
+    Attaches an experiment to a fabric for the duration of a run.  If
+    no fabric is passed in, uses a fresh one and tears it down on exit.
+    '''
+    def __init__(self, exp, timer, fabric=None):
         self.exp = exp
+        self.timer = timer
+        self.owns_fabric = fabric is None
+        if self.owns_fabric:
+            fabric = Fabric()
+        self.fabric = fabric
 
     def __enter__(self):
-        # Run Mininet
-        self.net = Mininet(topo=self.exp.topology, build=False, switch=MultiSwitch)
-        self.net.addController(
-            RemoteController("c0", ip="127.0.0.1", port=CONTROLLER_OF_PORT))
-        time.sleep(5)
-        self.net.build()
-        time.sleep(5)
-        self.net.start()
-        time.sleep(5)
-        
-        num_switches = len(self.exp.topology.switches())
-        # add a bridge for each so that it communicates using openflow 1.3
-        for i in range(1,num_switches+1):
-            bridge_cmd = 'ovs-vsctl set bridge s%i protocols=OpenFlow13; ' % i
-            subprocess.call(bridge_cmd,shell=True)
+        self.fabric.attach(self.exp, self.timer)
         return self
 
     def __exit__(self, type, value, traceback):
-        set_rtt(0)
-        self.net.stop()
-        # destroy bridges
-        destroy_cmd = (
-            'ovs-vsctl list-br | xargs -L 1 -I ' +
-            '\'{1}\' ovs-vsctl del-br \'{1}\'')
-        subprocess.call(destroy_cmd,shell=True)
+        if self.owns_fabric:
+            with self.timer.phase('teardown'):
+                self.fabric.shutdown()
 
 class Experiment:
     def __init__(
@@ -112,16 +641,53 @@ class Experiment:
         arguments=None,version_listener_factory=NO_VERSION_LISTENER_FACTORY,
         # default is to not collect statistics
         collect_stats_period_ms = -1,
-        num_controllers=1):
+        num_controllers=1, convergence_rule=None, network_profile=None,
+        jvm_profile=None):
+        '''
+        @param {ConvergenceRule or None} convergence_rule --- If
+        non-None, stop the controller as soon as the samples it writes
+        satisfy this rule instead of waiting for it to finish all its
+        operations.
+
+        @param {NetworkProfile or None} network_profile --- Conditions
+        on each switch's link to the controller.  If None, every link
+        gets rtt.
+
+        @param {JvmProfile or None} jvm_profile --- Heap and gc flags
+        for the controller jvm.  None for jvm.DEFAULT_PROFILE.
+        '''
         
         self.topology = topology
         self.fq_jar = os.path.join(EXPERIMENTS_JAR_DIR,jar_name)
         self.output_file = output_file
         self.rtt = rtt
+        if network_profile is None:
+            network_profile = NetworkProfile.uniform(rtt)
+        self.network_profile = network_profile
+        if jvm_profile is None:
+            jvm_profile = jvm.DEFAULT_PROFILE
+        self.jvm_profile = jvm_profile
+        # how the controller jvm was launched; set by run.
+        self.launch = None
         self.num_controllers = num_controllers
+        self.endpoint = ControllerEndpoint()
+        # directory the controller jvm runs in; None for the current one.
+        self.work_dir = None
+        # the running controller jvm; set by subproc_thread.
+        self.proc = None
+        # follows output_file while the controller runs; set by run.
+        self.follower = None
+        self.convergence_rule = convergence_rule
+        # why the last run ended: completed, converged or stalled
+        self.stop_reason = None
         self.arguments = []
         if arguments is not None:
             self.arguments = arguments
+        self.collect_stats_period_ms = collect_stats_period_ms
+        self.version_listener_factory = version_listener_factory
+        # identifies this point in the catalog; everything except
+        # where results go.
+        self.catalog_key_arguments = map(str, self.arguments)
         self.arguments.append(str(collect_stats_period_ms))
         self.arguments.append(self.output_file)
         self.arguments.append(version_listener_factory)
@@ -129,27 +695,219 @@ class Experiment:
             lambda to_stringify: str(to_stringify),
             self.arguments)
         
-    def run(self):
+    def run(self, fabric=None):
+        '''
+        @param {Fabric or None} fabric --- If non-None, run on this
+        (possibly already built) fabric and leave it up afterwards.
+        Otherwise, build a network for this run only.
+        '''
+        if CATALOG is not None:
+            existing = CATALOG.lookup(self)
+            if existing is not None:
+                print '\nSkipping %s: already have %s\n' % (
+                    self.output_file, existing)
+                # so that this campaign's data directory is complete
+                self.ensure_output_dir()
+                link_results(existing, self.output_file)
+                return
+
         self.ensure_output_dir()
-        set_rtt(self.rtt)
-        
-        subprocess_thread = threading.Thread(target=self.subproc_thread)
-        subprocess_thread.daemon = True
-        subprocess_thread.start()
-        time.sleep(1)
+        # a stale file would be picked up as this run's progress
+        if os.path.exists(self.output_file):
+            os.remove(self.output_file)
+        run_begin = time.time()
+        timer = PhaseTimer(self.output_file)
+        switch_names = self.topology.switches()
+        with timer.phase('network_profile'):
+            self.endpoint.apply_profile(self.network_profile, switch_names)
+        with timer.phase('verify_network'):
+            self.endpoint.verify_profile(
+                self.network_profile, switch_names,
+                sidecar_fname(self.output_file, 'network'))
 
-        with setup(self) as mininet_setup:
+        self.stop_reason = 'completed'
+        monitor = None
+        on_row = None
+        if self.convergence_rule is not None:
+            monitor = ConvergenceMonitor(self.convergence_rule)
+            on_row = monitor.add_row
+        self.follower = OutputFollower(self.output_file, on_row)
+        self.launch = None
+        self.proc = None
+        placement = None
+        sampler = None
+        subprocess_thread = None
+        try:
+            with timer.phase('jvm_prepare'):
+                self.launch = jvm.launch(
+                    self.fq_jar, self.arguments, self.jvm_profile)
+            if CPU_PLACEMENT is not None:
+                # mininet, built later in this process, inherits its cores
+                with timer.phase('cpu_placement'):
+                    CPU_PLACEMENT.apply(cpu_plan.local_shell, [os.getpid()])
+                placement = CPU_PLACEMENT
+            if HOST_SAMPLE_PERIOD_MS is not None:
+                sampler = host_sampler.SamplerProcess(
+                    sidecar_fname(self.output_file, 'host'),
+                    [('controller', self.fq_jar), ('ovs', 'ovs-vswitchd')],
+                    HOST_SAMPLE_PERIOD_MS)
+                sampler.start()
+            subprocess_thread = threading.Thread(target=self.subproc_thread)
+            subprocess_thread.daemon = True
+            subprocess_thread.start()
+
+            with timer.phase('controller_listening'):
+                wait_until(
+                    self.controller_listening,
+                    CONTROLLER_LISTEN_TIMEOUT_SECONDS,
+                    'controller to listen on port %i' % self.endpoint.port,
+                    lambda: not subprocess_thread.is_alive())
+
+            with setup(self, timer, fabric) as mininet_setup:
+                with timer.phase('experiment'):
+                    self.wait_for_controller(subprocess_thread, monitor)
+        except BaseException:
+            # whatever failed (readiness, ovsdb, tc, ^C), the jvm must
+            # not outlive the run holding the controller port
+            if subprocess_thread is not None:
+                self.kill_controller()
+                # it may have been launched after that kill
+                while subprocess_thread.is_alive():
+                    subprocess_thread.join(PROGRESS_POLL_PERIOD_SECONDS)
+                    self.kill_controller()
+            raise
+        finally:
+            self.follower.stop()
+            if sampler is not None:
+                sampler.stop()
+            if placement is not None:
+                placement.restore(cpu_plan.local_shell, [os.getpid()])
+                placement.write(sidecar_fname(self.output_file, 'placement'))
+            timer.write(sidecar_fname(self.output_file, 'phases'))
+            if self.launch is not None:
+                self.launch.write(sidecar_fname(self.output_file, 'jvm'))
+            if monitor is not None:
+                monitor.write(
+                    sidecar_fname(self.output_file, 'convergence'),
+                    self.stop_reason)
+            tracing.record('run', run_begin, run=self.output_file)
+
+        if (CATALOG is not None) and self.produced_results():
+            CATALOG.record(self)
+
+    def controller_endpoints(self):
+        '''
+        @returns {list} --- Endpoints of every controller this
+        experiment's switches connect to, round-robin; the first is
+        self.endpoint, whose jvm run() starts and waits on.
+        '''
+        return [self.endpoint]
+
+    def produced_results(self):
+        '''
+        @returns {boolean} --- True if the last run finished (or was
+        stopped because it converged) and left a result file.
+        '''
+        if self.stop_reason in ('stalled', 'timeout'):
+            return False
+        if (self.stop_reason == 'completed') and (self.proc.returncode != 0):
+            return False
+        return os.path.exists(self.output_file)
+
+    def catalog_arguments(self):
+        '''
+        @returns {dict} --- Everything that determines this point's
+        results.  Includes the task and name of the output file, but
+        not the campaign's start time embedded in its path.
+        '''
+        rule = None
+        if self.convergence_rule is not None:
+            rule = vars(self.convergence_rule)
+        to_return = {
+            'arguments': self.catalog_key_arguments,
+            'output_name': output_name(self.output_file),
+            'collect_stats_period_ms': self.collect_stats_period_ms,
+            'version_listener_factory': self.version_listener_factory,
+            'rtt': self.rtt,
+            'network_profile': self.network_profile.describe(),
+            'num_switches': len(self.topology.switches()),
+            'num_controllers': self.num_controllers,
+            'convergence_rule': rule,
+            'jvm_flags': self.jvm_profile.flags(),
+        }
+        if CPU_PLACEMENT is not None:
+            to_return['cpu_placement'] = {
+                'cpus': CPU_PLACEMENT.cpus,
+                'governor': CPU_PLACEMENT.governor,
+            }
+        return to_return
+
+    def wait_for_controller(self, subprocess_thread, monitor=None):
+        '''
+        Wait for the controller jvm to exit.  Kill it early if it
+        stalls, runs past RUN_TIMEOUT_SECONDS, or if monitor (a
+        ConvergenceMonitor or None) says the results have converged.
+        '''
+        begin = time.time()
+        # setup is not a stall; time the measurement from here
+        self.follower.activity()
+        while subprocess_thread.is_alive():
+            subprocess_thread.join(PROGRESS_POLL_PERIOD_SECONDS)
+            if (monitor is not None) and monitor.converged:
+                print '\nResults for %s converged; stopping\n' % self.output_file
+                self.stop_reason = 'converged'
+            elif self.follower.stalled():
+                print (
+                    '\nNo progress on %s for %is; killing controller\n' %
+                    (self.output_file, STALL_TIMEOUT_SECONDS))
+                self.stop_reason = 'stalled'
+            elif (time.time() - begin) > RUN_TIMEOUT_SECONDS:
+                print (
+                    '\n%s still running after %is; killing controller\n' %
+                    (self.output_file, RUN_TIMEOUT_SECONDS))
+                self.stop_reason = 'timeout'
+            else:
+                continue
+            self.kill_controller()
             subprocess_thread.join()
 
 
     def subproc_thread(self):
-        task = ['java','-jar',self.fq_jar]
-        task.extend(self.arguments)
+        task = place_controller(self.endpoint.wrap_command(self.launch.task))
         print task
         sys.stdout.flush()
-        subprocess.call(task)
+        self.proc = subprocess.Popen(
+            task, cwd=self.work_dir,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        # echo the controller's output, counting it as progress
+        for line in iter(self.proc.stdout.readline, ''):
+            sys.stdout.write(line)
+            sys.stdout.flush()
+            self.follower.activity()
+        self.proc.wait()
+
+    def controller_listening(self):
+        # check the jvm's own network namespace, which may differ from
+        # ours.
+        proc = self.proc
+        if proc is None:
+            return False
+        return port_listening(self.endpoint.port, proc.pid)
+
+    def kill_controller(self):
+        if (self.proc is not None) and (self.proc.poll() is None):
+            self.proc.kill()
+
+    def rename_output(self, output_file):
+        '''
+        Write results to output_file instead of the file the
+        constructor chose.  Call before run.
+        '''
+        self.arguments = [
+            output_file if argument == self.output_file else argument
+            for argument in self.arguments]
+        self.output_file = output_file
 
-    
     def ensure_output_dir(self):
         dirname = os.path.dirname(self.output_file)
         try:
@@ -188,18 +946,22 @@ class FairnessExperiment(Experiment):
             
 class LatencyExperiment(Experiment):
     def __init__(self, task_name,rtt, num_ops_per_thread,
-                 num_warmup_ops_per_thread,num_threads):
+                 num_warmup_ops_per_thread,num_threads,
+                 convergence_rule=None):
         topo = FlatTopo(switches=1)
         jar_name = 'single_controller_latency.jar'
         output_file = output_data_fname(task_name,"%d-%d" % (rtt * 1000, num_threads))
         arguments = [num_ops_per_thread,num_warmup_ops_per_thread,num_threads]
-        Experiment.__init__(self, topo, jar_name, output_file,rtt, arguments)
+        Experiment.__init__(
+            self, topo, jar_name, output_file,rtt, arguments,
+            convergence_rule=convergence_rule)
 
 class ThroughputExperiment(Experiment):
     def __init__(
         self, num_switches, task_name, coarse_locking_boolean,
         num_threads_per_switch,num_ops_per_thread,
-        num_warmup_ops_per_thread,filename_num_label=None):
+        num_warmup_ops_per_thread,filename_num_label=None,
+        convergence_rule=None):
         '''
         @param {String} filename_label --- how experiment should label
         file, if not None.  (If it is None, use num_switches.)
@@ -221,10 +983,12 @@ class ThroughputExperiment(Experiment):
         output_filename = output_data_fname(task_name, "%d"  % filename_num_label)
 
         Experiment.__init__(
-            self,topo,jar_name,output_filename,0,arguments)
+            self,topo,jar_name,output_filename,0,arguments,
+            convergence_rule=convergence_rule)
 
 class ReadOnlyLatencyExperiment(Experiment):
-    def __init__(self, task_name,num_ops,num_warmup_ops):
+    def __init__(self, task_name,num_ops,num_warmup_ops,
+                 convergence_rule=None):
         topo = FlatTopo(1)
         jar_name = 'read_only_latency.jar'
 
@@ -236,11 +1000,13 @@ class ReadOnlyLatencyExperiment(Experiment):
         output_filename = output_data_fname(task_name,'read_only')
 
         Experiment.__init__(
-            self,topo,jar_name,output_filename,0,arguments)
+            self,topo,jar_name,output_filename,0,arguments,
+            convergence_rule=convergence_rule)
 
 class ReadOnlyThroughputExperiment(Experiment):
     def __init__(self, task_name,num_switches,num_ops,
-                 num_warmup_ops,num_threads_per_switch):
+                 num_warmup_ops,num_threads_per_switch,
+                 convergence_rule=None):
         topo = FlatTopo(num_switches)
         jar_name = 'read_only_throughput.jar'
 
@@ -256,66 +1022,86 @@ class ReadOnlyThroughputExperiment(Experiment):
             'read_only_throughput-%i-%i' % (num_switches,num_threads_per_switch))
 
         Experiment.__init__(
-            self,topo,jar_name,output_filename,0,arguments)
+            self,topo,jar_name,output_filename,0,arguments,
+            convergence_rule=convergence_rule)
 
         
+# Set to a convergence.ConvergenceRule to stop latency and throughput
+# sweep points as soon as their results settle.  The rule finds the end
+# of warmup from the samples themselves, so the controller then runs no
+# separate warmup operations; readers of the results drop the warmup
+# the rule found (see convergence.py, which also says why stopping is
+# coarse with the current jars).  Only pass warmup_ops to points that
+# also get the rule.
+CONVERGENCE_RULE = None
+
+def warmup_ops(num_warmup_ops):
+    if CONVERGENCE_RULE is not None:
+        return 0
+    return num_warmup_ops
+
 DEFAULT_NUM_OPERATIONS_PER_THREAD = 30000
 DEFAULT_WARMUP_OPERATIONS_PER_THREAD = 30000
 def latency_rtt():
-    for rtt in (0,2,4,8):
+    run_sweep([
         LatencyExperiment(
             'single_controller_latency_rtt',
             rtt,DEFAULT_NUM_OPERATIONS_PER_THREAD,
-            DEFAULT_WARMUP_OPERATIONS_PER_THREAD,1).run()
+            warmup_ops(DEFAULT_WARMUP_OPERATIONS_PER_THREAD),1,
+            convergence_rule=CONVERGENCE_RULE)
+        for rtt in (0,2,4,8)])
 
             
 def latency_contention():
-    for threads in  (1, 2, 4, 6, 8, 10):
-        print '\nAbout to run latency_no_rtt threads %i\n' % threads
+    run_sweep([
         LatencyExperiment(
             'single_controller_latency_contention',
             2,DEFAULT_NUM_OPERATIONS_PER_THREAD,
-            DEFAULT_WARMUP_OPERATIONS_PER_THREAD,threads).run()
+            warmup_ops(DEFAULT_WARMUP_OPERATIONS_PER_THREAD),threads,
+            convergence_rule=CONVERGENCE_RULE)
+        for threads in (1, 2, 4, 6, 8, 10)])
             
 
 THROUGHPUT_NO_CONTENTION_NUM_SWITCHES = (1, 5, 10, 20, 40)
 def throughput_no_contention():
-    for num_switches in THROUGHPUT_NO_CONTENTION_NUM_SWITCHES:
-        print (
-            '\nRunning no contention throughput test with %i switches\n' %
-            num_switches)
-        
+    run_sweep([
         ThroughputExperiment(
             num_switches,'NoContentionThroughput',False,
             1,DEFAULT_NUM_OPERATIONS_PER_THREAD,
-            DEFAULT_WARMUP_OPERATIONS_PER_THREAD).run()
+            warmup_ops(DEFAULT_WARMUP_OPERATIONS_PER_THREAD),
+            convergence_rule=CONVERGENCE_RULE)
+        for num_switches in THROUGHPUT_NO_CONTENTION_NUM_SWITCHES])
         
 def throughput_no_contention_coarse_lock():
-    for num_switches in THROUGHPUT_NO_CONTENTION_NUM_SWITCHES:
+    run_sweep([
         ThroughputExperiment(
             num_switches,'CoarseNoContentionThroughput',True,
             1,DEFAULT_NUM_OPERATIONS_PER_THREAD,
-            DEFAULT_WARMUP_OPERATIONS_PER_THREAD).run()
+            warmup_ops(DEFAULT_WARMUP_OPERATIONS_PER_THREAD),
+            convergence_rule=CONVERGENCE_RULE)
+        for num_switches in THROUGHPUT_NO_CONTENTION_NUM_SWITCHES])
 
         
 THROUGHPUT_CONTENTION_NUM_THREADS = (1,2,4,8,10)
 def throughput_contention():
-    for num_threads in THROUGHPUT_CONTENTION_NUM_THREADS:
+    run_sweep([
         ThroughputExperiment(
             1,'ContentionThroughput',False,
             num_threads,DEFAULT_NUM_OPERATIONS_PER_THREAD,
-            DEFAULT_WARMUP_OPERATIONS_PER_THREAD,
-            num_threads).run()
+            warmup_ops(DEFAULT_WARMUP_OPERATIONS_PER_THREAD),
+            num_threads,convergence_rule=CONVERGENCE_RULE)
+        for num_threads in THROUGHPUT_CONTENTION_NUM_THREADS])
         
 def error_experiment():
-    ErrorExperiment('ErrorExperiment',1000,10,.01).run()
-    ErrorExperiment('ErrorExperiment',1000,10,.05).run()
-    ErrorExperiment('ErrorExperiment',1000,10,.1).run()
+    run_sweep([
+        ErrorExperiment('ErrorExperiment',1000,10,failure_probability)
+        for failure_probability in (.01, .05, .1)])
 
 
 def fairness_experiment():
-    FairnessExperiment('FairnessExperiment',30000,True).run()
-    FairnessExperiment('FairnessExperiment',30000,False).run()
+    run_sweep([
+        FairnessExperiment('FairnessExperiment',30000,wound_wait)
+        for wound_wait in (True, False)])
 
 
 READ_ONLY_LATENCY_NUM_WARMUP_OPS = 50000
@@ -323,15 +1109,18 @@ READ_ONLY_LATENCY_NUM_OPS = 100000
 def read_only_experiment():
     ReadOnlyLatencyExperiment(
         'ReadOnlyLatency',READ_ONLY_LATENCY_NUM_OPS,
-        READ_ONLY_LATENCY_NUM_WARMUP_OPS).run()
+        warmup_ops(READ_ONLY_LATENCY_NUM_WARMUP_OPS),
+        convergence_rule=CONVERGENCE_RULE).run()
 
 READ_ONLY_THROUGHPUT_NUM_SWITCHES = (1,2,3,4,5,6)
 READ_ONLY_THROUGHPUT_NUM_THREADS = (1,2,3,4,5,6)
 READ_ONLY_THROUGHPUT_NUM_WARMUP_OPS = 50000
 READ_ONLY_THROUGHPUT_NUM_OPS = 100000
 def read_only_throughput():
-    for num_switches in READ_ONLY_THROUGHPUT_NUM_SWITCHES:
-        for num_threads in READ_ONLY_THROUGHPUT_NUM_THREADS:
-            ReadOnlyThroughputExperiment(
-                'ReadOnlyThroughput',num_switches,READ_ONLY_THROUGHPUT_NUM_OPS,
-                READ_ONLY_THROUGHPUT_NUM_WARMUP_OPS,num_threads).run()
+    run_sweep([
+        ReadOnlyThroughputExperiment(
+            'ReadOnlyThroughput',num_switches,READ_ONLY_THROUGHPUT_NUM_OPS,
+            warmup_ops(READ_ONLY_THROUGHPUT_NUM_WARMUP_OPS),num_threads,
+            convergence_rule=CONVERGENCE_RULE)
+        for num_switches in READ_ONLY_THROUGHPUT_NUM_SWITCHES
+        for num_threads in READ_ONLY_THROUGHPUT_NUM_THREADS])
@@ -1,7 +1,42 @@
 from fab.api import *
 from experiment import *
 from serialize import *
+import batch as manifest_batch
 
 
 def experiment(serialized):
     sudo("/home/ubuntu/experiments/manage-host.py experiment " + serialized)
+
+def batch(manifest_fname, local_dir='.'):
+    '''
+    Run a whole manifest on the host in one session, saving each point's
+    results under local_dir as it finishes (see batch.py).
+
+        fab -H ubuntu@host batch:sweep.json,results
+    '''
+    user_host, _, port = env.host_string.partition(':')
+    ssh_cmd_vec = ['ssh', '-o', 'StrictHostKeyChecking=no']
+    if port:
+        ssh_cmd_vec.extend(['-p', port])
+    key_filenames = env.key_filename or []
+    if isinstance(key_filenames, basestring):
+        key_filenames = [key_filenames]
+    for key_filename in key_filenames:
+        ssh_cmd_vec.extend(['-i', key_filename])
+    ssh_cmd_vec.append(user_host)
+    with open(manifest_fname, 'r') as fd:
+        failed = manifest_batch.submit(ssh_cmd_vec, fd.read(), local_dir)
+    if len(failed) != 0:
+        abort('%i points failed' % len(failed))
+
+def start_agent():
+    # pty=False so the agent outlives this session
+    sudo("nohup python /home/ubuntu/experiments/host_agent.py serve "
+         "> /tmp/pronghorn-agent.log 2>&1 &", pty=False)
+
+def agent(command, args='{}'):
+    '''
+        fab -H ubuntu@host agent:mininet,'{"num_switches": 5}'
+    '''
+    sudo("python /home/ubuntu/experiments/host_agent.py call %s '%s'" % (
+        command, args))
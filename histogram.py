@@ -0,0 +1,345 @@
+#!/usr/bin/python
+
+'''
+Reduces a raw result file (one row per thread, each field one
+operation's latency in ns) to a compact summary that can be merged
+exactly with other nodes' summaries:
+
+    histogram --- log-bucketed latency counts.  Bucket i holds values in
+                  (gamma^(i-1), gamma^i], gamma = (1 + e) / (1 - e), so
+                  every percentile read back is within relative error e
+                  of a sample's true value.  Merging adds counts, so the
+                  merged histogram is exactly the one all the samples
+                  would have made together.
+    series    --- operations completed in each interval of the run.
+                  Threads run their operations back to back, so an
+                  operation completes at the sum of the latencies before
+                  and including it, measured from its thread's start.
+    rows      --- (operations, total latency ns) of each row, which is
+                  all analysis.throughput needs.
+
+Standard library only, so that it can be copied to and run on dist
+nodes, where it prints the summary as json:
+
+    python histogram.py summarize output.csv [--interval-ms 100]
+    python histogram.py merge a.histogram b.histogram ...
+'''
+
+import json
+import math
+import optparse
+import sys
+
+SUMMARY_VERSION = 1
+DEFAULT_RELATIVE_ERROR = .01
+DEFAULT_INTERVAL_MS = 100
+DEFAULT_PERCENTILES = (50, 90, 99, 99.9)
+NANOSECONDS_PER_SECOND = 1e9
+NANOSECONDS_PER_MS = 1000000
+SCRIPT_NAME = 'histogram.py'
+
+
+class SummaryError(Exception):
+    pass
+
+
+def parse_row(line):
+    '''
+    @returns {list} --- Numeric fields of one row of a result file.
+    Same rules as stat_util.parse_samples, which remote nodes may not
+    have.
+    '''
+    samples = []
+    for field in line.strip().strip(',').split(','):
+        try:
+            samples.append(float(field))
+        except ValueError:
+            # header or label
+            pass
+    return samples
+
+
+class Histogram(object):
+    def __init__(self, relative_error=DEFAULT_RELATIVE_ERROR):
+        self.relative_error = relative_error
+        self.gamma = (1 + relative_error) / (1 - relative_error)
+        self.log_gamma = math.log(self.gamma)
+        # bucket index -> count; values <= 0 are counted in zeros
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value, count=1):
+        if value <= 0:
+            self.zeros += count
+        else:
+            index = int(math.ceil(math.log(value) / self.log_gamma))
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        if (self.min is None) or (value < self.min):
+            self.min = value
+        if (self.max is None) or (value > self.max):
+            self.max = value
+
+    def merge(self, other):
+        if other.relative_error != self.relative_error:
+            raise SummaryError(
+                'Cannot merge histograms with relative errors %s and %s' % (
+                    self.relative_error, other.relative_error))
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        for value in (other.min, other.max):
+            if value is not None:
+                if (self.min is None) or (value < self.min):
+                    self.min = value
+                if (self.max is None) or (value > self.max):
+                    self.max = value
+
+    def quantile(self, q):
+        '''
+        @returns {float} --- The q-th quantile (0 <= q <= 1), nearest
+        rank, to within relative_error; nan if empty.
+        '''
+        if self.count == 0:
+            return float('nan')
+        return self.value_at_rank(int(math.ceil(q * self.count)) - 1)
+
+    def quantile_ci(self, q, z):
+        '''
+        Distribution-free confidence interval for the q-th quantile.
+        @see stat_util.quantile_ci
+
+        @returns {tuple} --- (low, high); nan if empty.
+        '''
+        if self.count == 0:
+            return float('nan'), float('nan')
+        half_width = z * math.sqrt(self.count * q * (1 - q))
+        return (self.value_at_rank(int(math.floor(self.count * q - half_width))),
+                self.value_at_rank(int(math.ceil(self.count * q + half_width))))
+
+    def value_at_rank(self, rank):
+        '''
+        @returns {float} --- The rank-th smallest sample (from 0, clamped
+        to the samples there are), to within relative_error.
+        '''
+        rank = min(max(rank, 0), self.count - 1)
+        if rank < self.zeros:
+            return self.min
+        seen = self.zeros
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                estimate = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def percentiles(self, which=DEFAULT_PERCENTILES):
+        return [self.quantile(p / 100.) for p in which]
+
+    def to_dict(self):
+        return {
+            'relative_error': self.relative_error,
+            'buckets': sorted(self.buckets.items()),
+            'zeros': self.zeros,
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @staticmethod
+    def from_dict(d):
+        histogram = Histogram(d['relative_error'])
+        histogram.buckets = dict(
+            (int(index), count) for index, count in d['buckets'])
+        histogram.zeros = d['zeros']
+        histogram.count = d['count']
+        histogram.min = d['min']
+        histogram.max = d['max']
+        return histogram
+
+
+class Summary(object):
+    def __init__(self, relative_error=DEFAULT_RELATIVE_ERROR,
+                 interval_ms=DEFAULT_INTERVAL_MS):
+        self.histogram = Histogram(relative_error)
+        self.interval_ms = interval_ms
+        # element i is the number of operations that completed in
+        # [i, i + 1) intervals after their thread started
+        self.series = []
+        # (operations, total latency ns) of each row
+        self.rows = []
+
+    def add_row(self, samples):
+        if len(samples) == 0:
+            return
+        interval_ns = self.interval_ms * NANOSECONDS_PER_MS
+        elapsed = 0.
+        for sample in samples:
+            self.histogram.add(sample)
+            elapsed += max(sample, 0)
+            index = int(elapsed // interval_ns)
+            if index >= len(self.series):
+                self.series.extend([0] * (index + 1 - len(self.series)))
+            self.series[index] += 1
+        self.rows.append((len(samples), elapsed))
+
+    def merge(self, other):
+        if other.interval_ms != self.interval_ms:
+            raise SummaryError(
+                'Cannot merge series with intervals %i and %i ms' % (
+                    self.interval_ms, other.interval_ms))
+        self.histogram.merge(other.histogram)
+        if len(other.series) > len(self.series):
+            self.series.extend([0] * (len(other.series) - len(self.series)))
+        for i, count in enumerate(other.series):
+            self.series[i] += count
+        self.rows.extend(other.rows)
+
+    def throughput(self):
+        '''
+        @returns {float} --- Total operations per second across all
+        rows.  @see analysis.throughput
+        '''
+        return sum(
+            count * NANOSECONDS_PER_SECOND / total
+            for count, total in self.rows if total > 0)
+
+    def series_throughput(self):
+        '''
+        @returns {list} --- Operations per second in each interval.
+        '''
+        return [count * 1000. / self.interval_ms for count in self.series]
+
+    def full_series_throughput(self):
+        '''
+        @returns {list} --- Operations per second in each interval that
+        every row ran through to its end, so that no interval is short
+        of threads that finished early.
+        '''
+        running = [total for count, total in self.rows if count > 0]
+        if len(running) == 0:
+            return []
+        num_full = int(min(running) // (self.interval_ms * NANOSECONDS_PER_MS))
+        return self.series_throughput()[:num_full]
+
+    def to_dict(self):
+        return {
+            'version': SUMMARY_VERSION,
+            'histogram': self.histogram.to_dict(),
+            'interval_ms': self.interval_ms,
+            'series': self.series,
+            'rows': self.rows,
+        }
+
+    @staticmethod
+    def from_dict(d):
+        if d.get('version') != SUMMARY_VERSION:
+            raise SummaryError(
+                'Summary version %s; can only read version %i' % (
+                    d.get('version'), SUMMARY_VERSION))
+        summary = Summary(d['histogram']['relative_error'], d['interval_ms'])
+        summary.histogram = Histogram.from_dict(d['histogram'])
+        summary.series = list(d['series'])
+        summary.rows = [tuple(row) for row in d['rows']]
+        return summary
+
+    def write(self, fname):
+        with open(fname, 'w') as fd:
+            json.dump(self.to_dict(), fd)
+
+    def describe(self, which=DEFAULT_PERCENTILES):
+        '''
+        @returns {String} --- One line: operations, throughput and
+        latency percentiles.
+        '''
+        return '%i ops, %.1f ops/s, %s' % (
+            self.histogram.count, self.throughput(), ', '.join(
+                'p%s %.0f ns' % (p, value) for p, value in zip(
+                    which, self.histogram.percentiles(which))))
+
+
+def loads(text):
+    '''
+    @throws {SummaryError} --- If text is not a summary.
+    '''
+    try:
+        return Summary.from_dict(json.loads(text))
+    except (ValueError, KeyError, TypeError) as ex:
+        raise SummaryError('Not a summary: %s' % ex)
+
+
+def read(fname):
+    with open(fname, 'r') as fd:
+        return loads(fd.read())
+
+
+def summarize(fname, relative_error=DEFAULT_RELATIVE_ERROR,
+              interval_ms=DEFAULT_INTERVAL_MS, row_warmup=None):
+    '''
+    @param {list or None} row_warmup --- Samples to drop from the start
+    of each row that has samples; @see convergence.read_row_warmup.
+
+    @returns {Summary} --- Of the raw result file fname.
+    '''
+    summary = Summary(relative_error, interval_ms)
+    row_num = 0
+    with open(fname, 'r') as fd:
+        for line in fd:
+            samples = parse_row(line)
+            if len(samples) == 0:
+                continue
+            if (row_warmup is not None) and (row_num < len(row_warmup)):
+                samples = samples[row_warmup[row_num]:]
+            row_num += 1
+            summary.add_row(samples)
+    return summary
+
+
+def merge(summaries):
+    '''
+    @param {list} summaries --- Non-empty; all with the same relative
+    error and interval.
+
+    @returns {Summary} --- A new summary of every one's samples.
+    '''
+    merged = Summary(
+        summaries[0].histogram.relative_error, summaries[0].interval_ms)
+    for summary in summaries:
+        merged.merge(summary)
+    return merged
+
+
+def command_vec(fname, interval_ms=DEFAULT_INTERVAL_MS,
+                relative_error=DEFAULT_RELATIVE_ERROR, script=None):
+    '''
+    @returns {list} --- Command that prints fname's summary as json.
+    '''
+    if script is None:
+        script = __file__
+    return [
+        'python', script, 'summarize', fname,
+        '--interval-ms', str(interval_ms),
+        '--relative-error', str(relative_error)]
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(
+        usage='%prog summarize <result csv> | merge <summary> ...')
+    parser.add_option(
+        '--interval-ms', type='int', default=DEFAULT_INTERVAL_MS)
+    parser.add_option(
+        '--relative-error', type='float', default=DEFAULT_RELATIVE_ERROR)
+    options, args = parser.parse_args()
+    if (len(args) == 2) and (args[0] == 'summarize'):
+        summary = summarize(
+            args[1], options.relative_error, options.interval_ms)
+        sys.stdout.write(json.dumps(summary.to_dict()) + '\n')
+    elif (len(args) >= 2) and (args[0] == 'merge'):
+        summary = merge([read(fname) for fname in args[1:]])
+        sys.stdout.write(summary.describe() + '\n')
+    else:
+        parser.error('expected summarize or merge')
@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+
+'''
+A resident agent per host, so that commands do not each pay for a new
+interpreter, a mininet import and reading basedir.txt.  The agent
+listens on a unix socket and speaks json lines: each request is
+
+    {"id": 1, "command": "update", "args": {}}
+
+and gets zero or more {"id": 1, "event": {...}} lines (eg., one per
+finished experiment point) followed by one {"id": 1, "ok": true,
+"result": ...} or {"id": 1, "ok": false, "error": "..."}.  Requests on
+one connection run concurrently; commands that touch mininet or ovs
+take turns.
+
+Commands:
+
+    update       fetch and reset the experiments and pronghorn repos,
+                 all at once; if every repo updated, the agent then
+                 re-executes itself (once mininet and ovs commands are
+                 done), so that later commands run the new code
+    mininet      {"num_switches": n} starts a mininet of n switches
+                 pointed at the controller ({"stop": true} stops it);
+                 shuts down the experiment fabric, whose bridges it
+                 would reuse the names of
+    experiment   {"manifest": {...}} runs a batch manifest (see
+                 batch.py) on a fabric the agent keeps up between
+                 batches, streaming each point's files as events;
+                 stops the mininet command's network first
+    collect      {"paths": [glob, ...]} returns files under the data
+                 directory
+    clean_ovs    stops the agent's mininet and fabric and deletes every
+                 ovs bridge
+
+    sudo ./host_agent.py serve &
+    ./host_agent.py call update
+    ./host_agent.py call mininet '{"num_switches": 5}'
+
+relay connects stdin and stdout to the socket, so that an ssh session
+running it is a single persistent channel to a remote host's agent (see
+AgentClient.over_ssh).
+'''
+
+import fcntl
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'pronghorn-agent.sock')
+REMOTE_AGENT = '/home/ubuntu/experiments/host_agent.py'
+# where the mininet command's switches find the controller
+DEFAULT_CONTROLLER_IP = '127.0.0.2'
+RELAY_CHUNK_SIZE = 1 << 16
+
+GIT_UPDATE_CMDS = [
+    ['git', 'fetch'],
+    ['git', 'reset', '--hard', 'origin/master'],
+    ['git', 'submodule', 'update', '--init', '--recursive']]
+
+
+class AgentError(Exception):
+    pass
+
+
+def git_pull(git_dir):
+    '''
+    @returns {tuple} --- (exit code of the first git command that
+    failed, or 0; combined output).
+    '''
+    output = []
+    for cmd in GIT_UPDATE_CMDS:
+        proc = subprocess.Popen(
+            cmd, cwd=git_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output.append(proc.communicate()[0])
+        if proc.returncode != 0:
+            return proc.returncode, ''.join(output)
+    return 0, ''.join(output)
+
+
+def update_repos(git_dirs):
+    '''
+    Pull every repo at once.
+
+    @returns {dict} --- git dir -> (exit code, output) @see git_pull
+    '''
+    results = {}
+    def pull(git_dir):
+        results[git_dir] = git_pull(git_dir)
+    threads = [
+        threading.Thread(target=pull, args=(git_dir,)) for git_dir in git_dirs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def repo_dirs():
+    '''
+    @returns {list} --- The repos update pulls; same as manage-host.py.
+    '''
+    # paths reads basedir.txt; only the agent itself needs it
+    from paths import BASE_PATH
+    return [os.path.join(BASE_PATH, 'experiments'),
+            os.path.join(BASE_PATH, 'pronghorn')]
+
+
+class Agent(object):
+    def __init__(self):
+        # mininet, the harness and ovsdb are loaded once, here
+        import batch
+        import experiments
+        import ovsdb
+        from paths import PAPER_DATA
+        self.batch = batch
+        self.experiments = experiments
+        self.ovsdb = ovsdb
+        self.data_dir = PAPER_DATA
+        # held by commands that use mininet or ovs
+        self.fabric_lock = threading.Lock()
+        # set by the mininet command
+        self.net = None
+        # set by the first experiment command
+        self.fabric = None
+        # set by a successful update; serve_connection restarts the
+        # agent once the update's response is sent
+        self.restart_pending = False
+        self.commands = {
+            'update': self.update,
+            'mininet': self.mininet,
+            'experiment': self.experiment,
+            'collect': self.collect,
+            'clean_ovs': self.clean_ovs,
+        }
+
+    def handle(self, command, args, send_event):
+        '''
+        @param {function} send_event --- Takes a dict to report before
+        the command finishes.
+
+        @returns --- Anything json can encode.
+        '''
+        if command not in self.commands:
+            raise AgentError('Unknown command %s' % command)
+        return self.commands[command](send_event=send_event, **args)
+
+    def update(self, send_event):
+        results = update_repos(repo_dirs())
+        self.restart_pending = all(
+            returncode == 0 for returncode, output in results.values())
+        return dict(
+            (git_dir, {'returncode': returncode, 'output': output})
+            for git_dir, (returncode, output) in results.items())
+
+    def restart(self):
+        '''
+        Re-execute the agent, so that it loads the code update fetched.
+        Waits for any mininet or ovs command to finish, and tears down
+        what the agent built; connections are dropped (each is
+        close-on-exec), so their clients see EOF.
+        '''
+        with self.fabric_lock:
+            self.stop_mininet()
+            self.stop_fabric()
+            print 'Agent restarting after update'
+            sys.stdout.flush()
+            os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def mininet(self, send_event, num_switches=None, stop=False,
+                controller_ip=DEFAULT_CONTROLLER_IP):
+        from mininet.net import Mininet
+        from mininet.node import RemoteController
+        with self.fabric_lock:
+            self.stop_mininet()
+            if stop:
+                return None
+            # FlatTopo's switches are named like the fabric's bridges
+            self.stop_fabric()
+            self.net = Mininet(
+                topo=self.experiments.FlatTopo(num_switches),
+                controller=lambda name: RemoteController(name, ip=controller_ip))
+            self.net.start()
+            return len(self.net.switches)
+
+    def stop_mininet(self):
+        if self.net is not None:
+            self.net.stop()
+            self.net = None
+
+    def stop_fabric(self):
+        if self.fabric is not None:
+            self.fabric.shutdown()
+            self.fabric = None
+
+    def experiment(self, send_event, manifest):
+        manifest = self.batch.load_manifest(json.dumps(manifest))
+        with self.fabric_lock:
+            self.stop_mininet()
+            if self.fabric is None:
+                self.fabric = self.experiments.Fabric()
+            return self.batch.run_batch(
+                manifest, EventWriter(send_event), self.fabric)
+
+    def collect(self, send_event, paths):
+        import glob
+        fnames = []
+        for pattern in paths:
+            fnames.extend(
+                fname for fname in glob.glob(os.path.join(self.data_dir, pattern))
+                if os.path.isfile(fname))
+        return self.batch.encode_files(sorted(set(fnames)), self.data_dir)
+
+    def clean_ovs(self, send_event):
+        with self.fabric_lock:
+            self.stop_mininet()
+            self.stop_fabric()
+            with self.ovsdb.connect_local() as client:
+                names = client.bridges().keys()
+                client.del_bridges(names)
+            return sorted(names)
+
+
+class EventWriter(object):
+    '''
+    File-like object for batch.run_batch: each json line it is given
+    becomes an event.
+    '''
+    def __init__(self, send_event):
+        self.send_event = send_event
+
+    def write(self, text):
+        for line in text.splitlines():
+            if line.strip() != '':
+                self.send_event(json.loads(line))
+
+    def flush(self):
+        pass
+
+
+def serve_connection(agent, rfile, wfile):
+    '''
+    Answer requests from rfile on wfile until rfile closes.  Each
+    request runs on its own thread.
+    '''
+    write_lock = threading.Lock()
+    def send(message):
+        with write_lock:
+            wfile.write(json.dumps(message) + '\n')
+            wfile.flush()
+
+    def run(request):
+        request_id = request.get('id')
+        try:
+            result = agent.handle(
+                request['command'], request.get('args', {}),
+                lambda event: send({'id': request_id, 'event': event}))
+            send({'id': request_id, 'ok': True, 'result': result})
+        except Exception as ex:
+            send({'id': request_id, 'ok': False,
+                  'error': '%s: %s' % (ex.__class__.__name__, ex)})
+        if agent.restart_pending:
+            agent.restart()
+
+    threads = []
+    for line in iter(rfile.readline, ''):
+        try:
+            request = json.loads(line)
+        except ValueError:
+            send({'id': None, 'ok': False, 'error': 'Bad request: %s' % line})
+            continue
+        thread = threading.Thread(target=run, args=(request,))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+
+def close_on_exec(sock):
+    '''
+    Python 2's sockets survive exec; mark sock's so that a restarted
+    agent does not inherit it.  A connection the new agent held open
+    would never show its client EOF.  (makefile()s share the socket's
+    descriptor, so this covers them too.)
+    '''
+    fcntl.fcntl(sock.fileno(), fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+
+
+def serve(socket_fname=DEFAULT_SOCKET):
+    agent = Agent()
+    if os.path.exists(socket_fname):
+        os.remove(socket_fname)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    close_on_exec(listener)
+    listener.bind(socket_fname)
+    listener.listen(5)
+    print 'Agent listening on %s' % socket_fname
+    sys.stdout.flush()
+    try:
+        while True:
+            conn = listener.accept()[0]
+            close_on_exec(conn)
+            thread = threading.Thread(
+                target=serve_socket, args=(agent, conn))
+            thread.daemon = True
+            thread.start()
+    finally:
+        listener.close()
+        os.remove(socket_fname)
+
+
+def serve_socket(agent, conn):
+    rfile = conn.makefile('r')
+    wfile = conn.makefile('w')
+    try:
+        serve_connection(agent, rfile, wfile)
+    finally:
+        rfile.close()
+        wfile.close()
+        conn.close()
+
+
+def relay(socket_fname=DEFAULT_SOCKET):
+    '''
+    Copy stdin to the agent's socket and the socket to stdout until
+    either side closes.
+    '''
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.connect(socket_fname)
+    def to_agent():
+        for chunk in iter(lambda: os.read(sys.stdin.fileno(), RELAY_CHUNK_SIZE), ''):
+            conn.sendall(chunk)
+        conn.shutdown(socket.SHUT_WR)
+    thread = threading.Thread(target=to_agent)
+    thread.daemon = True
+    thread.start()
+    for chunk in iter(lambda: conn.recv(RELAY_CHUNK_SIZE), ''):
+        os.write(sys.stdout.fileno(), chunk)
+
+
+class AgentClient(object):
+    '''
+    One connection to an agent.  Calls from several threads may share
+    it; each waits for its own response.
+    '''
+    def __init__(self, rfile, wfile, proc=None):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.proc = proc
+        self.lock = threading.Lock()
+        self.next_id = 1
+        # request id -> (on_event, list to put the response in, Event)
+        self.pending = {}
+        self.reader = threading.Thread(target=self._read)
+        self.reader.daemon = True
+        self.reader.start()
+
+    @classmethod
+    def local(cls, socket_fname=DEFAULT_SOCKET):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(socket_fname)
+        return cls(conn.makefile('r'), conn.makefile('w'))
+
+    @classmethod
+    def over_ssh(cls, ssh_cmd_vec, agent=REMOTE_AGENT):
+        '''
+        @param {list} ssh_cmd_vec --- Command vector that opens an ssh
+        session to the host; the remote command is appended to it.
+        '''
+        proc = subprocess.Popen(
+            ssh_cmd_vec + ['sudo python %s relay' % agent],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return cls(proc.stdout, proc.stdin, proc)
+
+    def _read(self):
+        for line in iter(self.rfile.readline, ''):
+            message = json.loads(line)
+            with self.lock:
+                entry = self.pending.get(message.get('id'))
+            if entry is None:
+                continue
+            on_event, response, done = entry
+            if 'event' in message:
+                if on_event is not None:
+                    on_event(message['event'])
+                continue
+            response.append(message)
+            done.set()
+        # connection closed: fail every outstanding call
+        with self.lock:
+            for on_event, response, done in self.pending.values():
+                response.append({'ok': False, 'error': 'Connection closed'})
+                done.set()
+
+    def call(self, command, on_event=None, **args):
+        '''
+        @param {function or None} on_event --- Called with each event
+        the command reports before it finishes.
+
+        @returns --- The command's result.
+
+        @throws {AgentError} --- If the command failed.
+        '''
+        response = []
+        done = threading.Event()
+        with self.lock:
+            request_id = self.next_id
+            self.next_id += 1
+            self.pending[request_id] = (on_event, response, done)
+            self.wfile.write(json.dumps(
+                {'id': request_id, 'command': command, 'args': args}) + '\n')
+            self.wfile.flush()
+        done.wait()
+        with self.lock:
+            del self.pending[request_id]
+        if not response[0]['ok']:
+            raise AgentError(response[0]['error'])
+        return response[0]['result']
+
+    def close(self):
+        self.wfile.close()
+        if self.proc is not None:
+            self.proc.wait()
+
+
+def print_usage():
+    print ('''
+
+  ./host_agent.py serve [socket]
+  ./host_agent.py call <command> [json arguments]
+  ./host_agent.py relay [socket]
+
+The socket defaults to %s.
+
+''' % DEFAULT_SOCKET)
+
+
+if __name__ == '__main__':
+    if (len(sys.argv) in (2, 3)) and (sys.argv[1] == 'serve'):
+        serve(*sys.argv[2:])
+    elif (len(sys.argv) in (2, 3)) and (sys.argv[1] == 'relay'):
+        relay(*sys.argv[2:])
+    elif (len(sys.argv) in (3, 4)) and (sys.argv[1] == 'call'):
+        args = {}
+        if len(sys.argv) == 4:
+            args = json.loads(sys.argv[3])
+        client = AgentClient.local()
+        def print_event(event):
+            print json.dumps(event)
+        try:
+            print json.dumps(
+                client.call(sys.argv[2], print_event, **args), indent=2)
+        except AgentError as ex:
+            print '\n%s\n' % ex
+            sys.exit(1)
+        finally:
+            client.close()
+    else:
+        print_usage()
@@ -0,0 +1,295 @@
+#!/usr/bin/python
+
+'''
+Samples host-level performance counters while an experiment runs, so
+that odd results can be matched to cpu saturation, softirq load from
+the ovs datapath, context switching or a process's cpu and memory.
+
+Writes one csv row per period, each stamped with ms since the epoch
+(the same clock the controller's System.currentTimeMillis uses):
+
+    epoch_ms, cpu<n>_util (busy % of each core), ctxt_per_s,
+    softirq_pct (% of all cpu time), <name>_cpu_pct and <name>_rss_kb
+    for each watched process group, dp_hit/dp_missed/dp_lost (ovs
+    datapath lookups per second) and dp_flows
+
+Standard library only, so that it can be copied to and run on dist
+nodes.  Run as root to see ovs datapath counters.
+
+    python host_sampler.py --out samples.csv --period-ms 500 \
+        --process controller=my.jar --process ovs=ovs-vswitchd
+'''
+
+import optparse
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+
+DEFAULT_PERIOD_MS = 1000
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_KB = os.sysconf('SC_PAGE_SIZE') // 1024
+# fields of a cpu line in /proc/stat, after the name
+IDLE_FIELDS = (3, 4)
+SOFTIRQ_FIELD = 6
+# fields of /proc/<pid>/stat, after the ")" that ends the command name
+UTIME_FIELD = 11
+STIME_FIELD = 12
+RSS_FIELD = 21
+DPCTL_CMD = ['ovs-appctl', 'dpctl/show']
+SAMPLER_STOP_SECONDS = 5
+SCRIPT_NAME = 'host_sampler.py'
+
+
+def read_cpu_times():
+    '''
+    @returns {tuple} --- (list of (busy, total) clock ticks per core,
+    total softirq ticks over all cores, context switches since boot).
+    '''
+    cores = []
+    softirq = 0
+    ctxt = 0
+    with open('/proc/stat', 'r') as fd:
+        for line in fd:
+            fields = line.split()
+            if re.match(r'cpu\d+$', fields[0]):
+                ticks = [int(field) for field in fields[1:]]
+                total = sum(ticks)
+                idle = sum(ticks[i] for i in IDLE_FIELDS)
+                cores.append((total - idle, total))
+                softirq += ticks[SOFTIRQ_FIELD]
+            elif fields[0] == 'ctxt':
+                ctxt = int(fields[1])
+    return cores, softirq, ctxt
+
+
+def matching_pids(pattern):
+    '''
+    @returns {list} --- Pids of processes whose command line contains
+    pattern, other than samplers (whose own arguments contain it).
+    '''
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/%s/cmdline' % entry, 'r') as fd:
+                cmdline = fd.read().replace('\0', ' ')
+        except IOError:
+            # exited
+            continue
+        if (pattern in cmdline) and (SCRIPT_NAME not in cmdline):
+            pids.append(int(entry))
+    return pids
+
+
+def read_process_group(pids):
+    '''
+    @returns {tuple} --- (cpu clock ticks used, rss in kb), summed over
+    pids.
+    '''
+    ticks = 0
+    rss_kb = 0
+    for pid in pids:
+        try:
+            with open('/proc/%i/stat' % pid, 'r') as fd:
+                fields = fd.read().rsplit(')', 1)[1].split()
+        except IOError:
+            continue
+        ticks += int(fields[UTIME_FIELD]) + int(fields[STIME_FIELD])
+        rss_kb += int(fields[RSS_FIELD]) * PAGE_KB
+    return ticks, rss_kb
+
+
+def read_datapath():
+    '''
+    @returns {tuple or None} --- (hit, missed, lost, flows) summed over
+    every ovs datapath, or None if ovs is not reachable.
+    '''
+    try:
+        proc = subprocess.Popen(
+            DPCTL_CMD, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+    except OSError:
+        return None
+    output = proc.communicate()[0]
+    if proc.returncode != 0:
+        return None
+    totals = [0, 0, 0, 0]
+    for i, name in enumerate(('hit', 'missed', 'lost')):
+        for value in re.findall(r'\b%s:(\d+)' % name, output):
+            totals[i] += int(value)
+    for value in re.findall(r'flows: ?(\d+)', output):
+        totals[3] += int(value)
+    return tuple(totals)
+
+
+class HostSampler(object):
+    def __init__(self, processes, datapath=True):
+        '''
+        @param {list} processes --- Each element is a (name, command
+        line pattern) tuple.  Processes are looked up again at every
+        sample, so groups may start and stop during sampling.
+
+        @param {boolean} datapath --- False to skip ovs counters.
+        '''
+        self.processes = processes
+        self.datapath = datapath
+        self.last = None
+
+    def header(self):
+        num_cores = len(read_cpu_times()[0])
+        columns = ['epoch_ms']
+        columns += ['cpu%i_util' % i for i in range(num_cores)]
+        columns += ['ctxt_per_s', 'softirq_pct']
+        for name, pattern in self.processes:
+            columns += ['%s_cpu_pct' % name, '%s_rss_kb' % name]
+        if self.datapath:
+            columns += ['dp_hit', 'dp_missed', 'dp_lost', 'dp_flows']
+        return ','.join(columns)
+
+    def read(self):
+        now = time.time()
+        cores, softirq, ctxt = read_cpu_times()
+        groups = [
+            read_process_group(matching_pids(pattern))
+            for name, pattern in self.processes]
+        datapath = None
+        if self.datapath:
+            datapath = read_datapath()
+        return now, cores, softirq, ctxt, groups, datapath
+
+    def sample(self):
+        '''
+        @returns {String or None} --- A csv row of rates since the last
+        call, or None on the first call.
+        '''
+        current = self.read()
+        last = self.last
+        self.last = current
+        if last is None:
+            return None
+
+        now, cores, softirq, ctxt, groups, datapath = current
+        elapsed = now - last[0]
+        fields = ['%i' % (now * 1000)]
+        all_ticks = 0
+        for (busy, total), (last_busy, last_total) in zip(cores, last[1]):
+            fields.append(
+                '%.1f' % percent(busy - last_busy, total - last_total))
+            all_ticks += total - last_total
+        fields.append('%.0f' % ((ctxt - last[3]) / elapsed))
+        fields.append('%.2f' % percent(softirq - last[2], all_ticks))
+        for (ticks, rss_kb), (last_ticks, last_rss_kb) in zip(groups, last[4]):
+            # processes that exited since the last sample make the
+            # difference negative
+            cpu_seconds = max(ticks - last_ticks, 0) / float(CLOCK_TICKS)
+            fields.append('%.1f' % percent(cpu_seconds, elapsed))
+            fields.append('%i' % rss_kb)
+        if self.datapath:
+            if (datapath is None) or (last[5] is None):
+                fields.extend([''] * 4)
+            else:
+                for i in range(3):
+                    fields.append(
+                        '%.0f' % ((datapath[i] - last[5][i]) / elapsed))
+                fields.append('%i' % datapath[3])
+        return ','.join(fields)
+
+
+def percent(part, whole):
+    if whole <= 0:
+        return 0.
+    return 100. * part / whole
+
+
+def run(out_fname, processes, period_ms=DEFAULT_PERIOD_MS, datapath=True):
+    '''
+    Sample every period_ms until SIGTERM or SIGINT.  Every row is
+    flushed as it is written, so a killed sampler loses nothing.
+    '''
+    stopping = []
+    def stop(signum, frame):
+        stopping.append(signum)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    sampler = HostSampler(processes, datapath)
+    period = period_ms / 1000.
+    with open(out_fname, 'w') as fd:
+        fd.write(sampler.header() + '\n')
+        fd.flush()
+        sampler.sample()
+        # fixed schedule, so slow samples do not make rows drift
+        next_sample = time.time() + period
+        while len(stopping) == 0:
+            time.sleep(max(next_sample - time.time(), 0))
+            next_sample += period
+            fd.write(sampler.sample() + '\n')
+            fd.flush()
+
+
+class SamplerProcess(object):
+    '''
+    Runs this module as a separate process, so that sampling does not
+    compete with the harness's own threads.
+    '''
+    def __init__(self, out_fname, processes, period_ms=DEFAULT_PERIOD_MS):
+        self.out_fname = out_fname
+        self.processes = processes
+        self.period_ms = period_ms
+        self.proc = None
+
+    def start(self):
+        cmd = command_vec(self.out_fname, self.processes, self.period_ms)
+        self.proc = subprocess.Popen([sys.executable] + cmd)
+
+    def stop(self):
+        if (self.proc is None) or (self.proc.poll() is not None):
+            return
+        self.proc.terminate()
+        deadline = time.time() + SAMPLER_STOP_SECONDS
+        while (self.proc.poll() is None) and (time.time() < deadline):
+            time.sleep(.05)
+        if self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+
+
+def command_vec(out_fname, processes, period_ms=DEFAULT_PERIOD_MS,
+                script=None):
+    '''
+    @param {String or None} script --- Path to this file, if not where
+    it is locally (eg., on a remote host).
+
+    @returns {list} --- Arguments that run the sampler; prepend a
+    python interpreter.
+    '''
+    if script is None:
+        script = os.path.abspath(__file__).replace('.pyc', '.py')
+    cmd = [script, '--out', out_fname, '--period-ms', str(period_ms)]
+    for name, pattern in processes:
+        cmd.extend(['--process', '%s=%s' % (name, pattern)])
+    return cmd
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--out', help='csv file to write samples to')
+    parser.add_option(
+        '--period-ms', type='int', default=DEFAULT_PERIOD_MS)
+    parser.add_option(
+        '--process', action='append', default=[],
+        help='name=pattern: report cpu and rss of processes whose '
+        'command line contains pattern as <name>_cpu_pct and <name>_rss_kb')
+    parser.add_option(
+        '--no-datapath', action='store_true', default=False,
+        help='do not query ovs datapath counters')
+    options, args = parser.parse_args()
+    if options.out is None:
+        parser.error('--out is required')
+    run(options.out,
+        [tuple(spec.split('=', 1)) for spec in options.process],
+        options.period_ms, not options.no_datapath)
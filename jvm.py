@@ -0,0 +1,279 @@
+#!/usr/bin/python
+
+'''
+How controller jvms are launched: shared flag profiles (heap, gc) and a
+class-data-sharing archive per jar, so that later runs of a jar skip
+most class loading and verification.  Archives are keyed on the jar's
+content hash, the java version and the profile, and are rebuilt
+automatically when any of those change.
+
+Each local run records how its jvm was launched in a .jvm sidecar.
+
+    python jvm.py <task data dir or task name> ...
+
+compares startup time and residual warmup between runs that created an
+archive, used one or ran without, to show how far warmup counts can be
+cut.
+'''
+
+import glob
+import hashlib
+import os
+import re
+import subprocess
+import sys
+
+# Local archives go under PAPER_DATA/CDS_SUBDIR.  paths (and catalog,
+# which uses it) are imported only where needed, so that dist/ drivers,
+# which have no basedir.txt, can use the profiles and remote_java.
+CDS_SUBDIR = 'cds'
+# remote hosts keep archives outside the jar directory, which every
+# deploy replaces
+REMOTE_CDS_DIR = '$HOME/jvm-cds'
+ARCHIVE_KEY_LENGTH = 16
+
+# versions that can dump a dynamic archive at exit, and that can also
+# create or refresh one on their own
+FIRST_DYNAMIC_ARCHIVE_VERSION = 13
+FIRST_AUTO_ARCHIVE_VERSION = 19
+
+# how a run used the archive
+CDS_OFF, CDS_CREATE, CDS_USE = 'off', 'create', 'use'
+
+
+class JvmProfile(object):
+    def __init__(self, name, heap_mb=None, gc=None, extra_flags=None):
+        '''
+        @param {int or None} heap_mb --- If non-None, fixes both the
+        initial and maximum heap, so that the heap never resizes
+        during a run.
+
+        @param {String or None} gc --- Collector name as in
+        -XX:+Use<gc>GC (eg., 'Parallel', 'G1', 'Z'), or None for the
+        jvm's default.
+        '''
+        self.name = name
+        self.heap_mb = heap_mb
+        self.gc = gc
+        self.extra_flags = []
+        if extra_flags is not None:
+            self.extra_flags = extra_flags
+
+    def flags(self):
+        flags = []
+        if self.heap_mb is not None:
+            flags.extend(['-Xms%im' % self.heap_mb, '-Xmx%im' % self.heap_mb])
+        if self.gc is not None:
+            flags.append('-XX:+Use%sGC' % self.gc)
+        return flags + self.extra_flags
+
+
+PROFILES = dict(
+    (profile.name, profile) for profile in [
+        JvmProfile('default'),
+        # throughput runs: no heap resizing, no concurrent collector
+        # threads competing with workers
+        JvmProfile('throughput', heap_mb=4096, gc='Parallel'),
+        # latency runs: short pauses
+        JvmProfile('latency', heap_mb=4096, gc='G1',
+                   extra_flags=['-XX:MaxGCPauseMillis=5']),
+    ])
+DEFAULT_PROFILE = PROFILES['default']
+
+_java_version = []
+
+
+def java_version():
+    '''
+    @returns {int} --- Feature version of the local java (eg., 8 for
+    1.8.0, 17 for 17.0.2).
+    '''
+    if len(_java_version) == 0:
+        output = subprocess.Popen(
+            ['java', '-version'], stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT).communicate()[0]
+        match = re.search(r'version "(\d+)(?:\.(\d+))?', output)
+        if match is None:
+            print '\nCould not parse java version from:\n%s\n' % output
+            assert False
+        version = int(match.group(1))
+        if (version == 1) and (match.group(2) is not None):
+            version = int(match.group(2))
+        _java_version.append(version)
+    return _java_version[0]
+
+
+class CdsCache(object):
+    def __init__(self, cache_dir=None):
+        '''
+        @param {String or None} cache_dir --- Where to keep archives.
+        None for PAPER_DATA/CDS_SUBDIR.
+        '''
+        if cache_dir is None:
+            from paths import PAPER_DATA
+            cache_dir = os.path.join(PAPER_DATA, CDS_SUBDIR)
+        self.cache_dir = cache_dir
+
+    def archive_fname(self, jar, profile):
+        from catalog import file_hash
+        key = hashlib.sha1('%s %i %s' % (
+            file_hash(jar), java_version(), ' '.join(profile.flags())))
+        return os.path.join(
+            self.cache_dir,
+            '%s-%s.jsa' % (os.path.splitext(os.path.basename(jar))[0],
+                           key.hexdigest()[:ARCHIVE_KEY_LENGTH]))
+
+    def flags(self, jar, profile):
+        '''
+        @returns {tuple} --- (flags that make the jvm use, or create, the
+        jar's archive; one of CDS_OFF, CDS_CREATE or CDS_USE; archive
+        file name or None).
+        '''
+        version = java_version()
+        if version < FIRST_DYNAMIC_ARCHIVE_VERSION:
+            # only the jdk's own default archive
+            return ['-Xshare:auto'], CDS_OFF, None
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        archive = self.archive_fname(jar, profile)
+        state = CDS_USE if os.path.exists(archive) else CDS_CREATE
+        if version >= FIRST_AUTO_ARCHIVE_VERSION:
+            return (['-XX:+AutoCreateSharedArchive',
+                     '-XX:SharedArchiveFile=%s' % archive], state, archive)
+        if state == CDS_USE:
+            return ['-XX:SharedArchiveFile=%s' % archive], state, archive
+        # written when the jvm exits normally; runs killed early leave
+        # no archive and the next run tries again.
+        return ['-XX:ArchiveClassesAtExit=%s' % archive], state, archive
+
+
+# shared by every local launch; created on first use
+_cds_cache = []
+
+
+class Launch(object):
+    '''
+    A jvm command line and how it was put together.
+    '''
+    def __init__(self, task, profile, cds_state, archive):
+        self.task = task
+        self.profile = profile
+        self.cds_state = cds_state
+        self.archive = archive
+
+    def write(self, fname):
+        with open(fname, 'w') as fd:
+            fd.write('key,value\n')
+            fd.write('profile,%s\n' % self.profile.name)
+            fd.write('java_version,%i\n' % java_version())
+            fd.write('cds,%s\n' % self.cds_state)
+            fd.write('archive,%s\n' % (self.archive or ''))
+            fd.write('flags,%s\n' % ' '.join(self.profile.flags()))
+
+
+def launch(jar, arguments, profile=None, cache=None):
+    '''
+    @returns {Launch} --- Command that runs jar with arguments under
+    profile, using cache's archive for the jar if possible.
+    '''
+    if profile is None:
+        profile = DEFAULT_PROFILE
+    if cache is None:
+        if len(_cds_cache) == 0:
+            _cds_cache.append(CdsCache())
+        cache = _cds_cache[0]
+    cds_flags, cds_state, archive = cache.flags(jar, profile)
+    task = ['java'] + profile.flags() + cds_flags + ['-jar', jar]
+    return Launch(task + list(arguments), profile, cds_state, archive)
+
+
+def remote_java(jar_name, profile=None):
+    '''
+    @returns {String} --- Shell words to use in place of 'java' when
+    running jar_name, from the jar directory, on a host whose java
+    version we do not know.  REMOTE_CDS_DIR must exist.  Archives are
+    keyed on the jar's hash, computed on the host; the jvm itself
+    rebuilds an archive made by a different java version.  Versions
+    that do not know a flag ignore it; versions before 19 do not create
+    archives, but still run.
+    '''
+    if profile is None:
+        profile = DEFAULT_PROFILE
+    flag_key = hashlib.sha1(' '.join(profile.flags())).hexdigest()[:8]
+    archive = '%s/%s-$(sha1sum %s | cut -c1-%i)-%s.jsa' % (
+        REMOTE_CDS_DIR, os.path.splitext(jar_name)[0], jar_name,
+        ARCHIVE_KEY_LENGTH, flag_key)
+    return ' '.join(
+        ['java'] + profile.flags() +
+        ['-XX:+IgnoreUnrecognizedVMOptions', '-XX:+AutoCreateSharedArchive',
+         '-XX:SharedArchiveFile=%s' % archive])
+
+
+def read_key_values(fname):
+    with open(fname, 'r') as fd:
+        lines = fd.read().splitlines()[1:]
+    return dict(line.split(',', 1) for line in lines if ',' in line)
+
+
+def mean(values):
+    if len(values) == 0:
+        return float('nan')
+    return sum(values) / float(len(values))
+
+
+def startup_report(task, data_root=None):
+    '''
+    @returns {dict} --- (profile, cds state) -> list of (seconds until
+    the controller listened, mean warmup samples per row, mean warmup
+    seconds per row) for every run of task that has a .jvm sidecar.
+    Warmup is what MSER-5 truncates from each row, ie. how far a row
+    still was from steady state after the jvm's own warmup operations.
+    '''
+    # numpy is only needed here
+    import analysis
+    import stat_util
+    if data_root is None:
+        data_root = analysis.PAPER_DATA
+
+    report = {}
+    for dirname in analysis.task_dirs(task, data_root):
+        for jvm_fname in sorted(glob.glob(os.path.join(dirname, '*.jvm'))):
+            base = os.path.splitext(jvm_fname)[0]
+            launch_info = read_key_values(jvm_fname)
+            phases = {}
+            if os.path.exists(base + '.phases'):
+                phases = read_key_values(base + '.phases')
+            startup = float(phases.get('controller_listening', 'nan'))
+
+            warmup_samples = []
+            warmup_seconds = []
+            if os.path.exists(base + '.csv'):
+                values, offsets = analysis.load(base + '.csv')
+                for i in range(len(offsets) - 1):
+                    row = values[offsets[i]:offsets[i + 1]]
+                    truncated = stat_util.mser_truncation(list(row))
+                    warmup_samples.append(truncated)
+                    warmup_seconds.append(
+                        row[:truncated].sum() /
+                        analysis.NANOSECONDS_PER_SECOND)
+            key = (launch_info.get('profile'), launch_info.get('cds'))
+            report.setdefault(key, []).append(
+                (startup, mean(warmup_samples), mean(warmup_seconds)))
+    return report
+
+
+def print_startup_report(task):
+    print '\n%s' % task
+    print '%-12s %-7s %5s %12s %14s %14s' % (
+        'profile', 'cds', 'runs', 'startup (s)', 'warmup ops', 'warmup (s)')
+    for (profile, cds), runs in sorted(startup_report(task).items()):
+        startups, warmup_samples, warmup_seconds = zip(*runs)
+        print '%-12s %-7s %5i %12.3f %14.1f %14.4f' % (
+            profile, cds, len(runs), mean(startups),
+            mean(warmup_samples), mean(warmup_seconds))
+
+
+if __name__ == '__main__':
+    for task in sys.argv[1:]:
+        print_startup_report(task)
@@ -4,28 +4,36 @@ import subprocess
 import sys
 from serialize import *
 from experiments import *
+import batch as manifest_batch
+from host_agent import update_repos
 
 EXPERIMENTS_PATH = os.path.join(BASE_PATH, "experiments")
-
-def git_pull(git_dir):
-    p = subprocess.Popen(["git", "fetch"], cwd=git_dir)
-    p.wait()
-    p = subprocess.Popen(["git", "reset", "--hard", "origin/master"], cwd=git_dir)
-    p.wait()
-    p = subprocess.Popen(["git", "submodule", "update", "--init", "--recursive"], cwd=git_dir)
-    p.wait()
-    
+PRONGHORN_PATH = os.path.join(BASE_PATH, "pronghorn")
 
 def update():
-    # Update experiments
-    git_pull(EXPERIMENTS_PATH)
-    # Update pronghorn
-    git_pull(PRONGHORN_PATH)
+    # Update experiments and pronghorn at the same time
+    results = update_repos([EXPERIMENTS_PATH, PRONGHORN_PATH])
+    for git_dir, (returncode, output) in sorted(results.items()):
+        print output
+        if returncode != 0:
+            print "updating %s failed" % git_dir
 
 def experiment():
     exp = deserialize_experiment(sys.argv[2])
     exp.run()
 
+def batch():
+    # manifest from a file, or from stdin if -
+    if (len(sys.argv) < 3) or (sys.argv[2] == '-'):
+        manifest_text = sys.stdin.read()
+    else:
+        with open(sys.argv[2], 'r') as fd:
+            manifest_text = fd.read()
+    manifest = manifest_batch.load_manifest(manifest_text)
+    out = manifest_batch.protocol_stream()
+    num_failed = manifest_batch.run_batch(manifest, out)
+    sys.exit(1 if num_failed != 0 else 0)
+
 def mininet():
     num_switches = int(sys.argv[2])
     net = Mininet(topo=FlatTopo(num_switches), controller=lambda name: RemoteController(name, ip='127.0.0.2'))
@@ -39,6 +47,8 @@ if command == "update":
     update()
 elif command == "experiment":
     experiment()
+elif command == "batch":
+    batch()
 elif command == "mininet":
     mininet()
 else:
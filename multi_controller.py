@@ -0,0 +1,265 @@
+#!/usr/bin/python
+
+'''
+Runs the multi_controller_* jars that the dist/ scripts spread over EC2
+hosts as several controller jvms on one host instead.  Every jvm gets
+its own network namespace (see netns.NamespaceEndpoint), so they can all
+listen on CONTROLLER_OF_PORT and PEER_PORT as the jars expect, and the
+switches are spread round-robin over them.  Controllers reach each other
+through the host, so each hop between two of them crosses two delayed
+veth pairs: peer rtt is twice the experiment's rtt.
+
+    with Fabric() as fabric:
+        MultiControllerExperiment(
+            'multi_controller_throughput', 'multi_controller_throughput.jar',
+            4, 5, 10000).run(fabric)
+'''
+
+import subprocess
+
+import experiments
+import jvm
+from experiments import Experiment, FlatTopo, Fabric
+from experiments import output_data_fname, sidecar_fname
+from experiments import port_listening, wait_until, place_controller
+from experiments import CONTROLLER_LISTEN_TIMEOUT_SECONDS
+from netns import NamespaceEndpoint
+
+# port the jars listen on for other controllers; matches
+# dist_util.LISTENING_FOR_CONNECTIONS_ON_PORT
+PEER_PORT = 31521
+# first namespace index to use; controller i gets index + i
+DEFAULT_FIRST_NAMESPACE_INDEX = 101
+IP_FORWARD_FNAME = '/proc/sys/net/ipv4/ip_forward'
+
+LINEAR, TREE = 'linear', 'tree'
+
+
+def topology_arguments(topo_type, addresses):
+    '''
+    @param {list} addresses --- ip of each controller; the first is the
+    head.
+
+    @returns {tuple} --- (who to contact argument of each controller,
+    set of indices each controller connects to).  Same layout as
+    dist_util.produce_linear_topology_arguments and
+    produce_tree_topology_arguments.
+    '''
+    num_controllers = len(addresses)
+    who_to_contact = ['-1'] * num_controllers
+    dependencies = [set() for i in range(num_controllers)]
+    if topo_type == LINEAR:
+        for i in range(num_controllers - 1):
+            who_to_contact[i] = '%s:%i' % (addresses[i + 1], PEER_PORT)
+            dependencies[i].add(i + 1)
+    elif topo_type == TREE:
+        if num_controllers > 1:
+            who_to_contact[0] = ''.join(
+                '%s:%i,' % (address, PEER_PORT) for address in addresses[1:])
+            dependencies[0] = set(range(1, num_controllers))
+    else:
+        print '\nUnknown multi-controller topology %s\n' % topo_type
+        assert False
+    return who_to_contact, dependencies
+
+
+def enable_forwarding():
+    '''
+    @returns {String} --- The host's previous setting; pass it to
+    restore_forwarding.
+    '''
+    with open(IP_FORWARD_FNAME, 'r') as fd:
+        previous = fd.read()
+    with open(IP_FORWARD_FNAME, 'w') as fd:
+        fd.write('1\n')
+    return previous
+
+
+def restore_forwarding(previous):
+    with open(IP_FORWARD_FNAME, 'w') as fd:
+        fd.write(previous)
+
+
+class PeerController(object):
+    '''
+    A non-head controller jvm.  It only serves the switches assigned to
+    it and the other controllers; its output goes to a log file.
+    '''
+    def __init__(self, endpoint, jar, arguments, jvm_profile, log_fname):
+        self.endpoint = endpoint
+        self.jar = jar
+        self.arguments = arguments
+        self.jvm_profile = jvm_profile
+        self.log_fname = log_fname
+        self.proc = None
+
+    def start(self, work_dir=None):
+        task = place_controller(self.endpoint.wrap_command(
+            jvm.launch(self.jar, self.arguments, self.jvm_profile).task))
+        print task
+        with open(self.log_fname, 'w') as fd:
+            self.proc = subprocess.Popen(
+                task, cwd=work_dir, stdout=fd, stderr=subprocess.STDOUT)
+
+    def listening(self):
+        '''
+        @returns {boolean} --- True once the jvm accepts both switches
+        and other controllers.
+        '''
+        if self.proc is None:
+            return False
+        return (port_listening(PEER_PORT, self.proc.pid) and
+                port_listening(self.endpoint.port, self.proc.pid))
+
+    def exited(self):
+        return (self.proc is not None) and (self.proc.poll() is not None)
+
+    def kill(self):
+        if (self.proc is not None) and (self.proc.poll() is None):
+            self.proc.kill()
+            self.proc.wait()
+
+
+class MultiControllerExperiment(Experiment):
+    def __init__(self, task_name, jar_name, num_controllers,
+                 num_switches_per_controller, num_ops_per_switch,
+                 topo_type=LINEAR, rtt=0, extra_arguments=None,
+                 first_namespace_index=DEFAULT_FIRST_NAMESPACE_INDEX):
+        '''
+        @param {String} jar_name --- One of the multi_controller_*
+        jars.  Each takes who to contact, peer port, number of
+        operations, stats period and output file, followed by
+        extra_arguments.
+
+        @param {int} num_ops_per_switch --- Operations the head runs on
+        each of its switches.  Other controllers run none, as in the
+        distributed experiments.
+
+        @param {String} topo_type --- LINEAR or TREE.
+        '''
+        self.endpoints = [
+            NamespaceEndpoint(first_namespace_index + i)
+            for i in range(num_controllers)]
+        self.topo_type = topo_type
+        self.num_ops_per_switch = num_ops_per_switch
+        self.extra_arguments = []
+        if extra_arguments is not None:
+            self.extra_arguments = map(str, extra_arguments)
+
+        topo = FlatTopo(
+            num_controllers * num_switches_per_controller,
+            prefix=self.endpoints[0].switch_prefix)
+        output_file = output_data_fname(
+            task_name,
+            '%s-%i-%i' % (topo_type, num_controllers,
+                          num_switches_per_controller))
+        Experiment.__init__(
+            self, topo, jar_name, output_file, rtt,
+            [topo_type, num_ops_per_switch] + self.extra_arguments,
+            num_controllers=num_controllers)
+        self.endpoint = self.endpoints[0]
+
+        self.who_to_contact, self.dependencies = topology_arguments(
+            topo_type, [endpoint.ip for endpoint in self.endpoints])
+        self.arguments = self.controller_arguments(0)
+        self.peers = [
+            PeerController(
+                self.endpoints[i], self.fq_jar, self.controller_arguments(i),
+                self.jvm_profile, sidecar_fname(self.output_file, 'controller%i_log' % i))
+            for i in range(1, num_controllers)]
+
+    def controller_arguments(self, i):
+        num_ops = 0
+        output_file = sidecar_fname(self.output_file, 'controller%i' % i)
+        if i == 0:
+            num_ops = self.num_ops_per_switch
+            output_file = self.output_file
+        return map(str, [
+            self.who_to_contact[i], PEER_PORT, num_ops,
+            self.collect_stats_period_ms, output_file] + self.extra_arguments)
+
+    def controller_endpoints(self):
+        return self.endpoints
+
+    def run(self, fabric=None):
+        '''
+        Start the other controllers, each once the controllers it
+        connects to are listening, then run the head as a normal
+        Experiment.  When the head is done, other controllers are
+        killed, the namespaces destroyed and the host's forwarding
+        setting restored.  A fabric that outlives the run keeps its
+        bridges; the next run's namespaces have the same addresses, and
+        Fabric.attach reconnects the bridges to them.
+        '''
+        if experiments.CATALOG is not None:
+            if experiments.CATALOG.lookup(self) is not None:
+                return Experiment.run(self, fabric)
+
+        self.ensure_output_dir()
+        previous_forwarding = enable_forwarding()
+        try:
+            for endpoint in self.endpoints:
+                endpoint.create()
+                # the head's profile is applied by Experiment.run
+                if endpoint is not self.endpoint:
+                    endpoint.apply_profile(self.network_profile, [])
+            self.start_peers()
+            Experiment.run(self, fabric)
+        finally:
+            for peer in self.peers:
+                peer.kill()
+            for endpoint in self.endpoints:
+                endpoint.destroy()
+            restore_forwarding(previous_forwarding)
+
+    def start_peers(self):
+        '''
+        @throws {ReadinessTimeout} --- If a controller exits or does not
+        listen within CONTROLLER_LISTEN_TIMEOUT_SECONDS.
+        '''
+        # peers[i - 1] is controller i; the head is started last by run
+        ready = set()
+        while len(ready) != len(self.peers):
+            for i, peer in enumerate(self.peers, 1):
+                if (peer.proc is None) and (self.dependencies[i] <= ready):
+                    peer.start(self.work_dir)
+            for i, peer in enumerate(self.peers, 1):
+                if (peer.proc is None) or (i in ready):
+                    continue
+                wait_until(
+                    peer.listening, CONTROLLER_LISTEN_TIMEOUT_SECONDS,
+                    'controller %i to listen (see %s)' % (i, peer.log_fname),
+                    peer.exited)
+                ready.add(i)
+
+    def catalog_arguments(self):
+        to_return = Experiment.catalog_arguments(self)
+        to_return['topo_type'] = self.topo_type
+        return to_return
+
+
+MULTI_CONTROLLER_THROUGHPUT_JAR = 'multi_controller_throughput.jar'
+MULTI_CONTROLLER_COUNTS = (1, 2, 4, 8)
+MULTI_CONTROLLER_SWITCHES_PER_CONTROLLER = 5
+MULTI_CONTROLLER_NUM_OPS_PER_SWITCH = 10000
+def throughput_scaling(topo_type=LINEAR):
+    '''
+    Throughput as the number of controllers on this host grows.  Each
+    controller count builds its own fabric, since a fabric's
+    controllers are fixed when it is built.
+    '''
+    exps = [
+        MultiControllerExperiment(
+            'multi_controller_throughput_scaling',
+            MULTI_CONTROLLER_THROUGHPUT_JAR, num_controllers,
+            MULTI_CONTROLLER_SWITCHES_PER_CONTROLLER,
+            MULTI_CONTROLLER_NUM_OPS_PER_SWITCH, topo_type)
+        for num_controllers in MULTI_CONTROLLER_COUNTS]
+    for exp in exps:
+        with Fabric() as fabric:
+            print '\nRunning %s\n' % exp.output_file
+            exp.run(fabric)
+
+
+if __name__ == '__main__':
+    throughput_scaling()
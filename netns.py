@@ -0,0 +1,132 @@
+#!/usr/bin/python
+
+'''
+Network namespaces that isolate a controller jvm from the host and from
+other controllers running at the same time.  Each namespace is joined
+to the host by its own veth pair, so the jvm can keep listening on
+CONTROLLER_OF_PORT while switches in the host namespace reach it at a
+namespace-specific address, and network conditions are applied to that
+veth pair only.
+'''
+
+import subprocess
+
+import network_profile
+from experiments import ControllerEndpoint, CONTROLLER_OF_PORT, switch_number
+
+NAMESPACE_PREFIX = 'pgexp'
+HOST_VETH_PREFIX = 'pgh'
+NAMESPACE_VETH_PREFIX = 'pgc'
+# each namespace gets its own /24: host side is .1, namespace side .2
+SUBNET_ADDRESS_FORMAT = '10.254.%i.%i'
+SUBNET_PREFIX_LEN = 24
+MAX_NAMESPACE_INDEX = 254
+
+
+class NamespaceEndpoint(ControllerEndpoint):
+    def __init__(self, index, cpus=None):
+        '''
+        @param {int} index --- Distinguishes this namespace from others
+        on the host.  Between 1 and MAX_NAMESPACE_INDEX.
+
+        @param {list or None} cpus --- Each element is an int.  If
+        non-None, the controller jvm may only run on these cpus.
+        '''
+        if (index < 1) or (index > MAX_NAMESPACE_INDEX):
+            print '\nNamespace index %i out of range\n' % index
+            assert False
+
+        self.index = index
+        self.cpus = cpus
+        self.namespace = '%s%i' % (NAMESPACE_PREFIX, index)
+        self.host_veth = '%s%i' % (HOST_VETH_PREFIX, index)
+        self.namespace_veth = '%s%i' % (NAMESPACE_VETH_PREFIX, index)
+        self.host_ip = SUBNET_ADDRESS_FORMAT % (index, 1)
+        self.ip = SUBNET_ADDRESS_FORMAT % (index, 2)
+        self.port = CONTROLLER_OF_PORT
+        self.switch_prefix = 'p%is' % index
+
+    def create(self):
+        '''
+        Create the namespace and its veth pair, replacing any left over
+        from an earlier run with the same index.
+        '''
+        self.destroy()
+        subprocess.check_call(['ip', 'netns', 'add', self.namespace])
+        subprocess.check_call(
+            ['ip', 'link', 'add', self.host_veth, 'type', 'veth',
+             'peer', 'name', self.namespace_veth])
+        subprocess.check_call(
+            ['ip', 'link', 'set', self.namespace_veth,
+             'netns', self.namespace])
+        subprocess.check_call(
+            ['ip', 'addr', 'add',
+             '%s/%i' % (self.host_ip, SUBNET_PREFIX_LEN),
+             'dev', self.host_veth])
+        subprocess.check_call(['ip', 'link', 'set', self.host_veth, 'up'])
+        self.ns_call(
+            ['ip', 'addr', 'add', '%s/%i' % (self.ip, SUBNET_PREFIX_LEN),
+             'dev', self.namespace_veth])
+        self.ns_call(['ip', 'link', 'set', self.namespace_veth, 'up'])
+        self.ns_call(['ip', 'link', 'set', 'lo', 'up'])
+        # lets controllers in different namespaces reach each other
+        # through the host (see multi_controller)
+        self.ns_call(['ip', 'route', 'add', 'default', 'via', self.host_ip])
+
+    def destroy(self):
+        # deleting the namespace also deletes both ends of the veth
+        # pair.  Ignore failure in case it does not exist.
+        with open('/dev/null', 'w') as devnull:
+            subprocess.call(
+                ['ip', 'netns', 'del', self.namespace], stderr=devnull)
+
+    def ns_call(self, cmd):
+        subprocess.check_call(['ip', 'netns', 'exec', self.namespace] + cmd)
+
+    def switch_ip(self, switch_name):
+        return self.ip
+
+    def apply_profile(self, profile, switch_names):
+        '''
+        Apply profile's conditions to each direction of the veth pair.
+        Uses replace, so can be called any number of times.  All of the
+        namespace's switches share the pair, so profile must give every
+        link the same conditions.
+        '''
+        if not profile.is_uniform():
+            print '\nNamespace endpoints need the same conditions on every link\n'
+            assert False
+        netem_args = profile.default.netem_args()
+        subprocess.check_call(
+            ['tc', 'qdisc', 'replace', 'dev', self.host_veth, 'root',
+             'netem'] + netem_args)
+        self.ns_call(
+            ['tc', 'qdisc', 'replace', 'dev', self.namespace_veth, 'root',
+             'netem'] + netem_args)
+
+    def verify_profile(self, profile, switch_names, fname=None):
+        # every link crosses the same veth pair, so measure it once
+        rtt = network_profile.measure_rtt(self.ip)
+        network_profile.verify(
+            profile, lambda num: rtt,
+            [switch_number(name) for name in switch_names], fname)
+
+    def clear_profile(self):
+        # ignore failure in case the namespace is already gone
+        with open('/dev/null', 'w') as devnull:
+            subprocess.call(
+                ['tc', 'qdisc', 'del', 'dev', self.host_veth, 'root'],
+                stderr=devnull)
+            subprocess.call(
+                ['ip', 'netns', 'exec', self.namespace, 'tc', 'qdisc', 'del',
+                 'dev', self.namespace_veth, 'root'], stderr=devnull)
+
+    def wrap_command(self, task):
+        wrapped = ['ip', 'netns', 'exec', self.namespace]
+        if self.cpus is not None:
+            wrapped.extend(
+                ['taskset', '-c', ','.join(str(cpu) for cpu in self.cpus)])
+        return wrapped + task
+
+    def owns_bridge(self, bridge_name):
+        return bridge_name.startswith(self.switch_prefix)
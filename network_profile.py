@@ -0,0 +1,287 @@
+#!/usr/bin/python
+
+'''
+Network conditions between switches and their controller.  A
+NetworkProfile gives each switch-controller link its own delay, jitter,
+loss and bandwidth cap.  On the host's own network stack each switch
+reaches the controller at its own loopback address (link_address), so
+LoopbackShaper can give every link its own netem qdisc on lo:
+
+    root htb 1: (unclassified traffic goes to 1:ffff, unshaped)
+      class 1:<n> -> netem <n+1>:, for switch n, both directions
+
+All tc changes for a profile go to one tc -batch process, and moving
+between profiles only changes the netem parameters of existing links.
+'''
+
+import errno
+import socket
+import subprocess
+import time
+
+# unclassified traffic on lo; never shaped
+DEFAULT_CLASS = 0xffff
+# htb only classifies; netem does all shaping, including rate caps
+UNSHAPED_RATE = '10gbit'
+# bytes per round; htb's default, derived from the rate, is too large
+HTB_QUANTUM = 200000
+SHAPED_DEVICE = 'lo'
+# switch n reaches a controller on the host at a distinct loopback
+# address, so that tc can tell links apart
+LINK_ADDRESS_FORMAT = '127.0.%i.%i'
+LINKS_PER_SUBNET = 254
+# netem qdiscs' handles are one more than their switch's number, which
+# keeps them clear of the root's 1: and the reserved ffff:
+MAX_SWITCH_NUMBER = 0xff00
+
+# Delays are measured with tcp connects to a closed port: the refusal
+# comes back after one round trip over the link.
+VERIFY_PORT = 1
+VERIFY_SAMPLES = 3
+VERIFY_TIMEOUT_SECONDS = 2
+VERIFY_ABSOLUTE_TOLERANCE_MS = 1.
+VERIFY_RELATIVE_TOLERANCE = .1
+
+
+class NetworkProfileError(Exception):
+    pass
+
+
+def link_address(switch_num):
+    '''
+    @returns {String} --- Loopback address that switch number
+    switch_num connects to its controller at.
+    '''
+    if (switch_num < 1) or (switch_num > MAX_SWITCH_NUMBER):
+        raise NetworkProfileError('No link address for switch %i' % switch_num)
+    return LINK_ADDRESS_FORMAT % (
+        1 + (switch_num - 1) / LINKS_PER_SUBNET,
+        1 + (switch_num - 1) % LINKS_PER_SUBNET)
+
+
+class LinkCondition(object):
+    def __init__(self, rtt_ms=0, jitter_ms=0, jitter_distribution=None,
+                 loss_percent=0, rate_mbit=None):
+        '''
+        @param {float} rtt_ms --- Round trip delay added to the link.
+        Half is added in each direction.
+
+        @param {float} jitter_ms --- Round trip jitter; half in each
+        direction.
+
+        @param {String or None} jitter_distribution --- One of netem's
+        distributions (normal, pareto, paretonormal), or None for
+        uniform jitter.
+
+        @param {float} loss_percent --- Chance of dropping a packet, in
+        each direction.
+
+        @param {float or None} rate_mbit --- If non-None, cap on each
+        direction's bandwidth.
+        '''
+        self.rtt_ms = rtt_ms
+        self.jitter_ms = jitter_ms
+        self.jitter_distribution = jitter_distribution
+        self.loss_percent = loss_percent
+        self.rate_mbit = rate_mbit
+
+    def __eq__(self, other):
+        return isinstance(other, LinkCondition) and vars(self) == vars(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def netem_args(self):
+        '''
+        @returns {list} --- netem arguments for one direction.
+        '''
+        args = ['delay', '%.3fms' % (self.rtt_ms / 2.)]
+        if self.jitter_ms != 0:
+            args.append('%.3fms' % (self.jitter_ms / 2.))
+            if self.jitter_distribution is not None:
+                args.extend(['distribution', self.jitter_distribution])
+        if self.loss_percent != 0:
+            args.extend(['loss', '%f%%' % self.loss_percent])
+        if self.rate_mbit is not None:
+            args.extend(['rate', '%fmbit' % self.rate_mbit])
+        return args
+
+    def within_tolerance(self, measured_ms):
+        allowed = max(
+            VERIFY_ABSOLUTE_TOLERANCE_MS,
+            VERIFY_RELATIVE_TOLERANCE * self.rtt_ms) + self.jitter_ms
+        return abs(measured_ms - self.rtt_ms) <= allowed
+
+
+class NetworkProfile(object):
+    def __init__(self, default=None, links=None):
+        '''
+        @param {LinkCondition or None} default --- Conditions on every
+        link that links does not name.  None for an unshaped network.
+
+        @param {dict or None} links --- Switch number -> LinkCondition
+        for links that differ from default.
+        '''
+        if default is None:
+            default = LinkCondition()
+        self.default = default
+        self.links = {}
+        if links is not None:
+            self.links = links
+
+    @classmethod
+    def uniform(cls, rtt_ms):
+        return cls(LinkCondition(rtt_ms))
+
+    def condition(self, switch_num):
+        return self.links.get(switch_num, self.default)
+
+    def is_uniform(self):
+        return all(
+            condition == self.default for condition in self.links.values())
+
+    def describe(self):
+        '''
+        @returns {dict} --- Plain data describing the profile, eg. for
+        the catalog.
+        '''
+        return {
+            'default': vars(self.default),
+            'links': dict(
+                (str(num), vars(condition))
+                for num, condition in sorted(self.links.items())),
+        }
+
+
+def run_tc_batch(lines, device=SHAPED_DEVICE):
+    '''
+    Run tc commands (without the leading tc) in a single tc process.
+    '''
+    if len(lines) == 0:
+        return
+    proc = subprocess.Popen(
+        ['tc', '-batch', '-'], stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = proc.communicate('\n'.join(lines) + '\n')[0]
+    if proc.returncode != 0:
+        raise NetworkProfileError('tc failed on %s:\n%s' % (device, output))
+
+
+class LoopbackShaper(object):
+    '''
+    Owns the qdiscs on lo.  Remembers what it installed, so applying a
+    new profile only adds links it has not seen and changes the netem
+    parameters of links whose conditions differ.
+    '''
+    def __init__(self, device=SHAPED_DEVICE):
+        self.device = device
+        # switch number -> LinkCondition currently installed
+        self.installed = None
+
+    def apply(self, profile, switch_nums):
+        lines = []
+        if self.installed is None:
+            # replace whatever was there (eg., from a crashed run)
+            self.reset()
+            lines.extend([
+                'qdisc add dev %s root handle 1: htb default %x' % (
+                    self.device, DEFAULT_CLASS),
+                'class add dev %s parent 1: classid 1:%x htb rate %s quantum %i' % (
+                    self.device, DEFAULT_CLASS, UNSHAPED_RATE, HTB_QUANTUM)])
+            self.installed = {}
+
+        for num in sorted(set(switch_nums)):
+            condition = profile.condition(num)
+            netem = ' '.join(condition.netem_args())
+            if num not in self.installed:
+                address = link_address(num)
+                lines.extend([
+                    'class add dev %s parent 1: classid 1:%x htb rate %s quantum %i' % (
+                        self.device, num, UNSHAPED_RATE, HTB_QUANTUM),
+                    'qdisc add dev %s parent 1:%x handle %x: netem %s' % (
+                        self.device, num, num + 1, netem),
+                    # toward the controller
+                    ('filter add dev %s parent 1: protocol ip prio 1 u32 '
+                     'match ip dst %s/32 flowid 1:%x') % (
+                        self.device, address, num),
+                    # and back
+                    ('filter add dev %s parent 1: protocol ip prio 1 u32 '
+                     'match ip src %s/32 flowid 1:%x') % (
+                        self.device, address, num)])
+            elif self.installed[num] != condition:
+                lines.append(
+                    'qdisc change dev %s parent 1:%x handle %x: netem %s' % (
+                        self.device, num, num + 1, netem))
+            self.installed[num] = condition
+        run_tc_batch(lines, self.device)
+
+    def reset(self):
+        # ignore failure in case there is nothing to delete
+        with open('/dev/null', 'w') as devnull:
+            subprocess.call(
+                ['tc', 'qdisc', 'del', 'dev', self.device, 'root'],
+                stderr=devnull)
+        self.installed = None
+
+
+LOOPBACK_SHAPER = LoopbackShaper()
+
+
+def measure_rtt(address, port=VERIFY_PORT, samples=VERIFY_SAMPLES):
+    '''
+    @returns {float or None} --- Median time in ms for a tcp connect to
+    a closed port at address to be refused, or None if every attempt
+    was lost.
+    '''
+    times = []
+    for i in range(samples):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(VERIFY_TIMEOUT_SECONDS)
+        start = time.time()
+        try:
+            sock.connect((address, port))
+        except socket.timeout:
+            continue
+        except socket.error as ex:
+            if ex.errno != errno.ECONNREFUSED:
+                raise
+        finally:
+            sock.close()
+        times.append((time.time() - start) * 1000.)
+    if len(times) == 0:
+        return None
+    return sorted(times)[len(times) / 2]
+
+
+def verify(profile, measure, switch_nums, fname=None):
+    '''
+    Measure each link and check it against the profile.
+
+    @param {function} measure --- Takes a switch number and returns its
+    link's measured rtt in ms, or None.
+
+    @param {String or None} fname --- If non-None, write a csv of
+    expected and measured rtts here.
+
+    @throws {NetworkProfileError} --- If any measured rtt is off by
+    more than the tolerance plus the link's jitter.
+    '''
+    rows = []
+    bad = []
+    for num in sorted(set(switch_nums)):
+        condition = profile.condition(num)
+        measured = measure(num)
+        rows.append((num, condition.rtt_ms, measured))
+        if (measured is not None) and (not condition.within_tolerance(measured)):
+            bad.append('switch %i: expected %.3fms, measured %.3fms' % (
+                num, condition.rtt_ms, measured))
+
+    if fname is not None:
+        with open(fname, 'w') as fd:
+            fd.write('switch,expected_rtt_ms,measured_rtt_ms\n')
+            for num, expected, measured in rows:
+                measured_str = '' if measured is None else '%f' % measured
+                fd.write('%i,%f,%s\n' % (num, expected, measured_str))
+    if len(bad) != 0:
+        raise NetworkProfileError(
+            'Applied delays do not match profile:\n' + '\n'.join(bad))
@@ -0,0 +1,285 @@
+#!/usr/bin/python
+
+'''
+Minimal OVSDB JSON-RPC client (RFC 7047) for the Open_vSwitch database.
+
+Talks to ovsdb-server directly instead of forking one ovs-vsctl per
+bridge, so that creating, reconfiguring or deleting any number of
+bridges costs a single transaction.  The same client works against the
+local db socket (connect_local) and against a remote host, by relaying
+the JSON-RPC stream over ssh (connect_remote).
+'''
+
+import json
+import os
+import socket
+import subprocess
+
+DEFAULT_DB_SOCKET = '/var/run/openvswitch/db.sock'
+DATABASE = 'Open_vSwitch'
+OPENFLOW_13 = 'OpenFlow13'
+DEFAULT_FAIL_MODE = 'secure'
+RECV_SIZE = 65536
+
+# Run on a remote host to copy between ssh's stdin/stdout and the db
+# socket.  Uses only the standard library and works with python 2 and 3.
+REMOTE_RELAY_SCRIPT = '''
+import os, select, socket, sys
+s = socket.socket(socket.AF_UNIX)
+s.connect("%s")
+i = sys.stdin.fileno()
+o = sys.stdout.fileno()
+while True:
+    r = select.select([i, s], [], [])[0]
+    if i in r:
+        d = os.read(i, %i)
+        if not d:
+            break
+        s.sendall(d)
+    if s in r:
+        d = s.recv(%i)
+        if not d:
+            break
+        os.write(o, d)
+''' % (DEFAULT_DB_SOCKET, RECV_SIZE, RECV_SIZE)
+
+
+class OvsdbError(Exception):
+    pass
+
+
+class PipeTransport(object):
+    '''
+    Socket-like wrapper around a process's stdin/stdout.
+    '''
+    def __init__(self, proc):
+        self.proc = proc
+
+    def sendall(self, data):
+        self.proc.stdin.write(data)
+        self.proc.stdin.flush()
+
+    def recv(self, size):
+        return os.read(self.proc.stdout.fileno(), size)
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+
+def connect_local(socket_path=DEFAULT_DB_SOCKET):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path)
+    return OvsdbClient(sock)
+
+
+def connect_remote(ssh_cmd_vec):
+    '''
+    @param {list} ssh_cmd_vec --- Command vector that opens an ssh
+    session to the remote host, not including the remote command (see
+    dist_util.HostEntry.ovsdb).
+    '''
+    relay_cmd = (
+        'sudo $(command -v python3 || command -v python) -c \'%s\'' %
+        REMOTE_RELAY_SCRIPT)
+    proc = subprocess.Popen(
+        ssh_cmd_vec + [relay_cmd],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    return OvsdbClient(PipeTransport(proc))
+
+
+def uuid_set(uuids):
+    return ['set', [['uuid', uuid] for uuid in uuids]]
+
+
+def set_elements(ovsdb_value):
+    '''
+    OVSDB encodes a set with exactly one element as the element itself.
+
+    @returns {list} --- The elements of ovsdb_value.
+    '''
+    if isinstance(ovsdb_value, list) and (len(ovsdb_value) == 2) and \
+       (ovsdb_value[0] == 'set'):
+        return ovsdb_value[1]
+    return [ovsdb_value]
+
+
+class OvsdbClient(object):
+    def __init__(self, transport):
+        self.transport = transport
+        self.next_id = 0
+        self.buffer = ''
+        self.decoder = json.JSONDecoder()
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def send(self, msg):
+        self.transport.sendall(json.dumps(msg))
+
+    def receive(self):
+        '''
+        @returns {dict} --- The next complete JSON-RPC message.
+        '''
+        while True:
+            stripped = self.buffer.lstrip()
+            if len(stripped) != 0:
+                try:
+                    msg, end = self.decoder.raw_decode(stripped)
+                    self.buffer = stripped[end:]
+                    return msg
+                except ValueError:
+                    # incomplete message; read more
+                    pass
+            data = self.transport.recv(RECV_SIZE)
+            if not data:
+                raise OvsdbError('Connection to ovsdb-server closed')
+            self.buffer += data
+
+    def call(self, method, params):
+        request_id = self.next_id
+        self.next_id += 1
+        self.send({'method': method, 'params': params, 'id': request_id})
+        while True:
+            msg = self.receive()
+            if msg.get('method') == 'echo':
+                # keepalive from the server
+                self.send(
+                    {'result': msg['params'], 'error': None,
+                     'id': msg['id']})
+                continue
+            if msg.get('id') != request_id:
+                # notification or stale reply
+                continue
+            if msg.get('error') is not None:
+                raise OvsdbError(str(msg['error']))
+            return msg['result']
+
+    def transact(self, operations):
+        '''
+        Runs operations as one atomic transaction.
+
+        @returns {list} --- One result per operation.
+        '''
+        if len(operations) == 0:
+            return []
+        results = self.call('transact', [DATABASE] + operations)
+        for result in results:
+            if (result is not None) and ('error' in result):
+                raise OvsdbError(
+                    '%s: %s' % (result['error'], result.get('details', '')))
+        return results
+
+    def select(self, table, columns):
+        return self.transact([
+            {'op': 'select', 'table': table, 'where': [],
+             'columns': columns}])[0]['rows']
+
+    def bridges(self):
+        '''
+        @returns {dict} --- Bridge name -> uuid for every bridge.
+        '''
+        return dict(
+            (row['name'], row['_uuid'][1])
+            for row in self.select('Bridge', ['name', '_uuid']))
+
+    def connected_bridges(self):
+        '''
+        @returns {set} --- Names of bridges that have at least one
+        controller whose is_connected column is true.
+        '''
+        rows = self.transact([
+            {'op': 'select', 'table': 'Bridge', 'where': [],
+             'columns': ['name', 'controller']},
+            {'op': 'select', 'table': 'Controller', 'where': [],
+             'columns': ['_uuid', 'is_connected']}])
+        connected = set(
+            row['_uuid'][1] for row in rows[1]['rows']
+            if row['is_connected'] is True)
+        to_return = set()
+        for row in rows[0]['rows']:
+            for controller in set_elements(row['controller']):
+                if controller[1] in connected:
+                    to_return.add(row['name'])
+        return to_return
+
+    def add_bridges(self, bridge_specs, protocols=(OPENFLOW_13,),
+                    fail_mode=DEFAULT_FAIL_MODE):
+        '''
+        Create bridges, each with its internal port and one controller,
+        in a single transaction.
+
+        @param {list} bridge_specs --- Each element is a (name, dpid,
+        controller target) tuple, eg. ('s1', '0000000000000001',
+        'tcp:127.0.0.1:6633').
+        '''
+        operations = []
+        bridge_refs = []
+        for i, (name, dpid, target) in enumerate(bridge_specs):
+            operations.extend([
+                {'op': 'insert', 'table': 'Interface',
+                 'uuid-name': 'iface%i' % i,
+                 'row': {'name': name, 'type': 'internal'}},
+                {'op': 'insert', 'table': 'Port', 'uuid-name': 'port%i' % i,
+                 'row': {'name': name,
+                         'interfaces': ['named-uuid', 'iface%i' % i]}},
+                {'op': 'insert', 'table': 'Controller',
+                 'uuid-name': 'ctrl%i' % i, 'row': {'target': target}},
+                {'op': 'insert', 'table': 'Bridge',
+                 'uuid-name': 'bridge%i' % i,
+                 'row': {'name': name,
+                         'ports': ['named-uuid', 'port%i' % i],
+                         'controller': ['named-uuid', 'ctrl%i' % i],
+                         'fail_mode': fail_mode,
+                         'protocols': ['set', list(protocols)],
+                         'other_config':
+                             ['map', [['datapath-id', dpid]]]}}])
+            bridge_refs.append(['named-uuid', 'bridge%i' % i])
+
+        operations.append(
+            {'op': 'mutate', 'table': 'Open_vSwitch', 'where': [],
+             'mutations': [['bridges', 'insert', ['set', bridge_refs]]]})
+        self.transact(operations)
+
+    def del_bridges(self, names):
+        '''
+        Delete the named bridges (ignoring ones that do not exist) in a
+        single transaction.  Their ports, interfaces and controllers are
+        garbage collected by ovsdb-server.
+        '''
+        existing = self.bridges()
+        uuids = [existing[name] for name in names if name in existing]
+        if len(uuids) == 0:
+            return
+        self.transact([
+            {'op': 'mutate', 'table': 'Open_vSwitch', 'where': [],
+             'mutations': [['bridges', 'delete', uuid_set(uuids)]]}])
+
+    def set_protocols(self, names, protocols=(OPENFLOW_13,)):
+        self.transact([
+            {'op': 'update', 'table': 'Bridge',
+             'where': [['name', '==', name]],
+             'row': {'protocols': ['set', list(protocols)]}}
+            for name in names])
+
+    def set_controller(self, names, target):
+        '''
+        Give each named bridge a fresh Controller row pointing at
+        target.  A fresh row makes the switch connect right away
+        instead of waiting out its reconnect backoff.
+        '''
+        operations = []
+        for i, name in enumerate(names):
+            operations.extend([
+                {'op': 'insert', 'table': 'Controller',
+                 'uuid-name': 'ctrl%i' % i, 'row': {'target': target}},
+                {'op': 'update', 'table': 'Bridge',
+                 'where': [['name', '==', name]],
+                 'row': {'controller': ['named-uuid', 'ctrl%i' % i]}}])
+        self.transact(operations)
@@ -0,0 +1,176 @@
+#!/usr/bin/python
+
+'''
+Runs independent Experiments at the same time.  Each run happens in its
+own process and gets its own network namespace, controller address,
+bridge name prefix, netem qdisc, working directory and set of cpus (see
+netns.NamespaceEndpoint).  An AdmissionPolicy decides which runs may
+share the host so that concurrent runs do not skew each other.
+
+    failed = run_parallel(experiments, AdmissionPolicy(cpus_per_run=4))
+'''
+
+import multiprocessing
+import os
+import time
+
+from experiments import FlatTopo, LatencyExperiment, destroy_bridges
+from experiments import ReadOnlyLatencyExperiment, sidecar_fname
+from netns import NamespaceEndpoint, MAX_NAMESPACE_INDEX
+
+# cpus kept free for ovs-vswitchd, mininet and this scheduler.  These
+# are the lowest-numbered cpus.
+DEFAULT_RESERVED_CPUS = 2
+DEFAULT_CPUS_PER_RUN = 4
+# all runs share one ovs-vswitchd, so bound the total number of
+# switches it serves at once.
+DEFAULT_MAX_TOTAL_SWITCHES = 40
+SCHEDULER_POLL_PERIOD_SECONDS = .1
+
+
+def is_latency_sensitive(exp):
+    '''
+    Latency runs measure per-operation delay, which load from other
+    runs on the shared ovs-vswitchd and memory bus would inflate.
+    '''
+    return isinstance(exp, (LatencyExperiment, ReadOnlyLatencyExperiment))
+
+
+def num_switches(exp):
+    return len(exp.topology.switches())
+
+
+class AdmissionPolicy(object):
+    def __init__(self, cpus_per_run=DEFAULT_CPUS_PER_RUN,
+                 max_concurrent=None,
+                 max_total_switches=DEFAULT_MAX_TOTAL_SWITCHES,
+                 exclusive=is_latency_sensitive):
+        '''
+        @param {int} cpus_per_run --- Number of dedicated cpus each
+        run's controller gets.
+
+        @param {int or None} max_concurrent --- If non-None, never run
+        more than this many experiments at once.
+
+        @param {int} max_total_switches --- Do not start a run if it
+        would push the number of switches across all running
+        experiments over this.  A single run is always admitted on an
+        otherwise idle host, however large.
+
+        @param {function} exclusive --- Takes an experiment and returns
+        True if it must have the host to itself.
+        '''
+        self.cpus_per_run = cpus_per_run
+        self.max_concurrent = max_concurrent
+        self.max_total_switches = max_total_switches
+        self.exclusive = exclusive
+
+    def admits(self, exp, running, num_free_cpus):
+        '''
+        @param {list} running --- Experiments currently running.
+        @returns {boolean} --- True if exp may start now.
+        '''
+        if num_free_cpus < self.cpus_per_run:
+            return False
+        if len(running) == 0:
+            return True
+
+        if self.exclusive(exp):
+            return False
+        for other in running:
+            if self.exclusive(other):
+                return False
+
+        if ((self.max_concurrent is not None) and
+            (len(running) >= self.max_concurrent)):
+            return False
+
+        total_switches = num_switches(exp)
+        for other in running:
+            total_switches += num_switches(other)
+        return total_switches <= self.max_total_switches
+
+
+def run_isolated(exp, endpoint):
+    '''
+    Runs in a child process: move exp into endpoint's namespace and run
+    it there.
+    '''
+    endpoint.create()
+    try:
+        exp.endpoint = endpoint
+        exp.topology = FlatTopo(
+            num_switches(exp), prefix=endpoint.switch_prefix)
+        exp.ensure_output_dir()
+        exp.work_dir = sidecar_fname(exp.output_file, 'run')
+        if not os.path.isdir(exp.work_dir):
+            os.mkdir(exp.work_dir)
+        exp.run()
+    finally:
+        endpoint.destroy()
+
+
+def run_parallel(experiments, policy=None,
+                 reserved_cpus=DEFAULT_RESERVED_CPUS):
+    '''
+    Runs experiments, as many at a time as policy allows.  Runs start
+    in the order given, except that a run that does not fit yet may be
+    overtaken by later, smaller ones.  Exclusive runs are never
+    overtaken, so they cannot starve.
+
+    @returns {list} --- Experiments whose process did not exit cleanly.
+    '''
+    if policy is None:
+        policy = AdmissionPolicy()
+
+    free_cpus = range(multiprocessing.cpu_count())[reserved_cpus:]
+    if len(free_cpus) < policy.cpus_per_run:
+        print (
+            '\nCannot run.  Need %i cpus per run but only %i unreserved\n' %
+            (policy.cpus_per_run, len(free_cpus)))
+        assert False
+
+    free_indices = range(1, MAX_NAMESPACE_INDEX + 1)
+    pending = list(experiments)
+    # multiprocessing.Process -> (experiment, endpoint)
+    running = {}
+    failed = []
+    try:
+        while (len(pending) != 0) or (len(running) != 0):
+            for exp in list(pending):
+                running_exps = [entry[0] for entry in running.values()]
+                if not policy.admits(exp, running_exps, len(free_cpus)):
+                    if policy.exclusive(exp):
+                        break
+                    continue
+
+                cpus = free_cpus[:policy.cpus_per_run]
+                del free_cpus[:policy.cpus_per_run]
+                endpoint = NamespaceEndpoint(free_indices.pop(0), cpus)
+                proc = multiprocessing.Process(
+                    target=run_isolated, args=(exp, endpoint))
+                proc.start()
+                running[proc] = (exp, endpoint)
+                pending.remove(exp)
+
+            time.sleep(SCHEDULER_POLL_PERIOD_SECONDS)
+
+            for proc in list(running.keys()):
+                if proc.is_alive():
+                    continue
+                proc.join()
+                exp, endpoint = running.pop(proc)
+                free_cpus = sorted(free_cpus + endpoint.cpus)
+                free_indices.append(endpoint.index)
+                if proc.exitcode != 0:
+                    print '\nRun for %s failed\n' % exp.output_file
+                    failed.append(exp)
+    finally:
+        for proc in running:
+            proc.terminate()
+            proc.join()
+            endpoint = running[proc][1]
+            destroy_bridges(endpoint.owns_bridge)
+            endpoint.destroy()
+
+    return failed
@@ -0,0 +1,14 @@
+#!/usr/bin/python
+
+'''
+Where things are installed on this host.  Kept free of mininet imports
+so that analysis and bookkeeping tools can use it too.
+'''
+
+import os
+
+with open(os.path.dirname(os.path.realpath(__file__)) + "/basedir.txt", 'r') as f:
+    BASE_PATH = f.read().strip()
+    
+EXPERIMENTS_JAR_DIR = os.path.join(BASE_PATH,'experiment_jars')
+PAPER_DATA = os.path.join(BASE_PATH, "data")
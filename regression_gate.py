@@ -0,0 +1,417 @@
+#!/usr/bin/python
+
+'''
+Decides whether new results are slower than a baseline, so that a new
+controller jar can be promoted (or not) without eyeballing csvs.
+
+A result set is a directory tree of results: task data directories
+(<task>-<start time>/<label>.csv, as experiments.py writes them) and
+dist results (raw .csv files, or the .histogram summaries dist_util
+saves next to them).  Points are matched by task and label, ignoring
+start times; where a tree has several runs of a task, the latest one
+counts.  Each point is reduced to a histogram.Summary, and then
+tested:
+
+    throughput       --- Welch's t-test on ops/s per GATE_INTERVAL_MS
+                         interval (while every thread still runs);
+                         effect size as relative change and Hedges' g
+    latency p<n>     --- distribution-free confidence intervals for the
+                         percentile; a regression only if the new
+                         interval lies wholly above the baseline's
+
+Significance is Bonferroni-corrected over every test of the gate, and
+a significant change smaller than min_effect (relative) is reported but
+does not fail the gate.  Successive intervals of one run are not fully
+independent, so treat p-values as approximate.
+
+    # compare two result sets
+    python regression_gate.py compare <baseline dir> <new dir>
+
+    # rerun sweeps and dist experiments, then compare against baseline
+    python regression_gate.py run <baseline dir> \\
+        --sweep throughput_no_contention --sweep latency_contention \\
+        --dist 'dist_latency_run.py --topo linear --num_switches 2'
+
+Exits 0 if nothing regressed, 1 if something did, 2 if there was
+nothing to compare, and 3 if nothing regressed but run could not rerun
+everything it was asked to: a dist command failed, or a baseline point
+of a rerun task or dist command has no new result.
+'''
+
+import glob
+import optparse
+import os
+import re
+import shlex
+import subprocess
+import sys
+
+import convergence
+import histogram
+import stat_util
+
+DEFAULT_ALPHA = .05
+# relative changes smaller than this do not fail the gate
+DEFAULT_MIN_EFFECT = .05
+DEFAULT_PERCENTILES = (50, 99)
+# raw results are summarized with finer intervals than dist nodes use,
+# so that short local runs still give several throughput samples
+GATE_INTERVAL_MS = 10
+DIST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dist')
+DIST_OUT_DIR = 'dist'
+
+PASS, REGRESSED, IMPROVED, INSUFFICIENT = (
+    'pass', 'REGRESSED', 'improved', 'insufficient')
+EXIT_PASS, EXIT_REGRESSED, EXIT_NOTHING, EXIT_INCOMPLETE = 0, 1, 2, 3
+
+# <task>-<start time>
+TASK_DIR_RE = re.compile(r'^(.*)-(\d+)$')
+
+
+def result_files(root):
+    '''
+    @returns {dict} --- Point key -> result file (a .csv or .histogram)
+    for every point under root.  Keys are relative paths without
+    extension, with start times dropped from task directories.
+    '''
+    # key -> ((start time, is summary), file), so that the latest run
+    # of a task wins
+    found = {}
+    for dirpath, dirnames, fnames in os.walk(root):
+        relative = os.path.relpath(dirpath, root)
+        parts = [] if relative == os.curdir else relative.split(os.sep)
+        start = 0
+        if len(parts) != 0:
+            match = TASK_DIR_RE.match(parts[-1])
+            if match is not None:
+                parts[-1] = match.group(1)
+                start = int(match.group(2))
+        for fname in fnames:
+            base, ext = os.path.splitext(fname)
+            if ext not in ('.csv', '.histogram'):
+                continue
+            key = '/'.join(parts + [base])
+            previous = found.get(key)
+            # prefer newer runs, then summaries over raw files
+            rank = (start, ext == '.histogram')
+            if (previous is None) or (rank > previous[0]):
+                found[key] = (rank, os.path.join(dirpath, fname))
+    return dict((key, fname) for key, (rank, fname) in found.items())
+
+
+def load_summary(fname, interval_ms=GATE_INTERVAL_MS):
+    if fname.endswith('.histogram'):
+        return histogram.read(fname)
+    return histogram.summarize(
+        fname, interval_ms=interval_ms,
+        row_warmup=convergence.read_row_warmup(fname))
+
+
+class Finding(object):
+    def __init__(self, key, metric, status, baseline, new, relative,
+                 detail=''):
+        '''
+        @param {float} relative --- (new - baseline) / baseline.
+        '''
+        self.key = key
+        self.metric = metric
+        self.status = status
+        self.baseline = baseline
+        self.new = new
+        self.relative = relative
+        self.detail = detail
+
+    def describe(self):
+        return '%-11s %-40s %-12s %14.1f -> %14.1f  %+7.1f%%  %s' % (
+            self.status, self.key, self.metric, self.baseline, self.new,
+            100 * self.relative, self.detail)
+
+
+def relative_change(baseline, new):
+    if baseline == 0:
+        return float('inf') if new != baseline else 0.
+    return (new - baseline) / float(baseline)
+
+
+def test_throughput(key, baseline, new, alpha, min_effect):
+    '''
+    @param {Summary} baseline, new
+
+    @returns {Finding}
+    '''
+    a = baseline.full_series_throughput()
+    b = new.full_series_throughput()
+    if (len(a) < 2) or (len(b) < 2):
+        return Finding(
+            key, 'throughput', INSUFFICIENT, baseline.throughput(),
+            new.throughput(), relative_change(
+                baseline.throughput(), new.throughput()),
+            '%i and %i intervals' % (len(a), len(b)))
+    t, df, p = stat_util.welch_t_test(a, b)
+    relative = relative_change(stat_util.mean(a), stat_util.mean(b))
+    status = PASS
+    if (p < alpha) and (abs(relative) >= min_effect):
+        status = REGRESSED if relative < 0 else IMPROVED
+    return Finding(
+        key, 'throughput', status, stat_util.mean(a), stat_util.mean(b),
+        relative, 'p=%.2g g=%+.2f' % (p, stat_util.hedges_g(a, b)))
+
+
+def test_percentile(key, percentile, baseline, new, alpha, min_effect):
+    '''
+    @returns {Finding} --- Latency going up is a regression.
+    '''
+    metric = 'latency p%g' % percentile
+    q = percentile / 100.
+    if (baseline.histogram.count == 0) or (new.histogram.count == 0):
+        return Finding(
+            key, metric, INSUFFICIENT, float('nan'), float('nan'),
+            float('nan'), 'no samples')
+    # each interval at 1 - alpha / 2, so that disjoint intervals are
+    # significant at alpha
+    z = stat_util.normal_quantile(1 - alpha / 4.)
+    base_value = baseline.histogram.quantile(q)
+    new_value = new.histogram.quantile(q)
+    base_low, base_high = baseline.histogram.quantile_ci(q, z)
+    new_low, new_high = new.histogram.quantile_ci(q, z)
+    relative = relative_change(base_value, new_value)
+    status = PASS
+    if abs(relative) >= min_effect:
+        if new_low > base_high:
+            status = REGRESSED
+        elif new_high < base_low:
+            status = IMPROVED
+    return Finding(
+        key, metric, status, base_value, new_value, relative,
+        '[%.0f, %.0f] -> [%.0f, %.0f]' % (
+            base_low, base_high, new_low, new_high))
+
+
+def compare(baseline_files, new_files, alpha=DEFAULT_ALPHA,
+            min_effect=DEFAULT_MIN_EFFECT, percentiles=DEFAULT_PERCENTILES):
+    '''
+    @param {dict} baseline_files, new_files --- @see result_files
+
+    @returns {list} --- A Finding for every test of every point both
+    have.
+    '''
+    keys = sorted(set(baseline_files) & set(new_files))
+    num_tests = len(keys) * (1 + len(percentiles))
+    # Bonferroni: the gate as a whole fails wrongly with at most alpha
+    per_test_alpha = alpha / max(num_tests, 1)
+    findings = []
+    for key in keys:
+        try:
+            baseline = load_summary(baseline_files[key])
+            new = load_summary(new_files[key])
+        except (IOError, histogram.SummaryError) as ex:
+            print 'Skipping %s: %s' % (key, ex)
+            continue
+        if baseline.interval_ms != new.interval_ms:
+            print 'Skipping %s: summarized with different intervals' % key
+            continue
+        findings.append(
+            test_throughput(key, baseline, new, per_test_alpha, min_effect))
+        for percentile in percentiles:
+            findings.append(test_percentile(
+                key, percentile, baseline, new, per_test_alpha, min_effect))
+    return findings
+
+
+def report(findings, baseline_files, new_files, requested=(), failed=()):
+    '''
+    Print findings, regressions last.
+
+    @param {iterable} requested --- Baseline keys that were meant to be
+    rerun; any without a new result make the gate incomplete.
+
+    @param {iterable} failed --- Commands that failed.
+
+    @returns {int} --- Exit code.
+    '''
+    missing = sorted(set(baseline_files) - set(new_files))
+    if len(missing) != 0:
+        print '%i baseline points not rerun' % len(missing)
+    missing_requested = sorted(set(requested) - set(new_files))
+    for key in missing_requested:
+        print 'No new result for %s' % key
+    for command in failed:
+        print 'Failed: %s' % command
+    incomplete = (len(missing_requested) != 0) or (len(failed) != 0)
+    unmatched = sorted(set(new_files) - set(baseline_files))
+    for key in unmatched:
+        print 'No baseline for %s' % key
+
+    if len(findings) == 0:
+        print '\nNothing to compare\n'
+        if incomplete:
+            return EXIT_INCOMPLETE
+        return EXIT_NOTHING
+    order = {IMPROVED: 0, PASS: 1, INSUFFICIENT: 2, REGRESSED: 3}
+    print
+    for finding in sorted(findings, key=lambda f: (order[f.status], f.key)):
+        print finding.describe()
+    regressed = [f for f in findings if f.status == REGRESSED]
+    print '\n%i tests, %i regressions\n' % (len(findings), len(regressed))
+    if len(regressed) != 0:
+        return EXIT_REGRESSED
+    if incomplete:
+        print '%i points not rerun or commands failed\n' % (
+            len(missing_requested) + len(failed))
+        return EXIT_INCOMPLETE
+    return EXIT_PASS
+
+
+def dist_out_name(dist_command):
+    '''
+    @returns {String} --- Name of a dist command's results: its script
+    and arguments, eg. dist_latency_run-topo_linear-num_switches_2.
+    '''
+    words = shlex.split(dist_command)
+    name = os.path.splitext(os.path.basename(words[0]))[0]
+    for word in words[1:]:
+        name += '-' + re.sub(r'[^A-Za-z0-9.]+', '_', word.lstrip('-'))
+    return name
+
+
+def run_dist(dist_command, out_dir):
+    '''
+    Run one of the dist scripts, saving its results in out_dir.
+
+    @returns {boolean} --- True if the script succeeded.
+    '''
+    words = shlex.split(dist_command)
+    script = os.path.join(DIST_DIR, os.path.basename(words[0]))
+    out = os.path.join(out_dir, dist_out_name(dist_command) + '.csv')
+    print '\nRunning %s\n' % dist_command
+    sys.stdout.flush()
+    # dist scripts read distributed.cfg from the working directory
+    return subprocess.call(
+        [sys.executable, script] + words[1:] + ['--out', out]) == 0
+
+
+def run_sweeps(sweep_names, plan_cpus=False):
+    '''
+    Run experiments.py sweeps (without the catalog, so every point
+    reruns).
+
+    @returns {tuple} --- (data directory every sweep wrote under, start
+    time their task directories end in).
+    '''
+    # needs mininet; comparing result sets does not
+    import experiments
+    # check every name before spending time on any sweep
+    unknown = [
+        name for name in sweep_names if getattr(experiments, name, None) is None]
+    if len(unknown) != 0:
+        print 'No sweep %s in experiments.py' % ', '.join(unknown)
+        sys.exit(EXIT_NOTHING)
+    if plan_cpus:
+        experiments.use_cpu_plan()
+    for name in sweep_names:
+        getattr(experiments, name)()
+    return experiments.PAPER_DATA, experiments.START
+
+
+def new_result_files(data_root, start, dist_out_dir):
+    '''
+    @param {String or None} data_root --- None if no sweeps ran.
+
+    @returns {dict} --- @see result_files, for this gate's runs only.
+    Dist results are keyed as if under DIST_OUT_DIR, where a baseline
+    keeps them.
+    '''
+    files = {}
+    if data_root is not None:
+        for dirname in glob.glob(os.path.join(data_root, '*-%d' % start)):
+            task = TASK_DIR_RE.match(os.path.basename(dirname)).group(1)
+            for key, fname in result_files(dirname).items():
+                files[task + '/' + key] = fname
+    if os.path.isdir(dist_out_dir):
+        for key, fname in result_files(dist_out_dir).items():
+            files[DIST_OUT_DIR + '/' + key] = fname
+    return files
+
+
+def requested_files(baseline_files, data_root, start, dist_commands):
+    '''
+    @returns {list} --- Baseline keys this gate's runs should have
+    rerun: every point of a task the sweeps wrote, and each dist
+    command's result.
+    '''
+    tasks = set()
+    if data_root is not None:
+        for dirname in glob.glob(os.path.join(data_root, '*-%d' % start)):
+            tasks.add(TASK_DIR_RE.match(os.path.basename(dirname)).group(1))
+    requested = [
+        key for key in baseline_files if key.split('/')[0] in tasks]
+    for dist_command in dist_commands:
+        key = DIST_OUT_DIR + '/' + dist_out_name(dist_command)
+        if key in baseline_files:
+            requested.append(key)
+    return requested
+
+
+def print_usage():
+    print ('''
+
+  python regression_gate.py compare <baseline dir> <new dir> [options]
+  python regression_gate.py run <baseline dir> [--sweep name]...
+      [--dist 'script args']... [options]
+
+run reruns the named experiments.py sweeps and dist commands (their
+results under <baseline dir>/%s/<script-args>) and compares them to
+the baseline.  @see the module docstring for the tests.
+
+''' % DIST_OUT_DIR)
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.print_help = print_usage
+    parser.add_option('--alpha', type='float', default=DEFAULT_ALPHA)
+    parser.add_option(
+        '--min-effect', type='float', default=DEFAULT_MIN_EFFECT,
+        help='smallest relative change that fails the gate')
+    parser.add_option(
+        '--percentile', type='float', action='append', default=[],
+        help='latency percentiles to test (default %s)' % (
+            DEFAULT_PERCENTILES,))
+    parser.add_option('--sweep', action='append', default=[])
+    parser.add_option('--dist', action='append', default=[])
+    parser.add_option(
+        '--dist-out', default=DIST_OUT_DIR,
+        help='where run saves dist results')
+    parser.add_option(
+        '--cpu-plan', action='store_true', default=False,
+        help='pin sweep runs to cpus (see cpu_plan.py)')
+    options, args = parser.parse_args()
+    percentiles = tuple(options.percentile) or DEFAULT_PERCENTILES
+
+    requested, failed = [], []
+    if (len(args) == 3) and (args[0] == 'compare'):
+        baseline_files = result_files(args[1])
+        new_files = result_files(args[2])
+    elif (len(args) == 2) and (args[0] == 'run'):
+        baseline_files = result_files(args[1])
+        data_root, start = None, None
+        if len(options.sweep) != 0:
+            data_root, start = run_sweeps(
+                options.sweep, options.cpu_plan)
+        if (len(options.dist) != 0) and (not os.path.isdir(options.dist_out)):
+            os.makedirs(options.dist_out)
+        for dist_command in options.dist:
+            if not run_dist(dist_command, options.dist_out):
+                print '\n%s failed\n' % dist_command
+                failed.append(dist_command)
+        new_files = new_result_files(data_root, start, options.dist_out)
+        requested = requested_files(
+            baseline_files, data_root, start, options.dist)
+    else:
+        print_usage()
+        sys.exit(EXIT_NOTHING)
+
+    findings = compare(
+        baseline_files, new_files, options.alpha, options.min_effect,
+        percentiles)
+    sys.exit(report(findings, baseline_files, new_files, requested, failed))
@@ -1,6 +1,28 @@
 #!/usr/bin/env python
 
+import os
+import sys
+
 from experiments import *
+import tracing
+
+# Points that already have results in the catalog are skipped, so
+# rerunning this after a crash resumes where the campaign stopped.
+# Pass --force to rerun everything.
+if '--force' not in sys.argv:
+    use_catalog()
+
+# Pass --cpu-plan to pin the controller, ovs and mininet to their own
+# cores and hold the cpu governor for every run.  Machines with too few
+# cores to split are warned about and left to the kernel.
+if '--cpu-plan' in sys.argv:
+    use_cpu_plan()
+
+# Pass --trace to record where the campaign's time goes, as a trace
+# (and a summary ranking phases) next to its data directories.
+if '--trace' in sys.argv:
+    tracing.use_tracing(
+        os.path.join(PAPER_DATA, 'campaign-%d.trace.json' % START))
 
 throughput_contention()
 throughput_no_contention()
@@ -0,0 +1,271 @@
+#!/usr/bin/python
+
+'''
+Small statistics helpers shared by the harness.  Standard library only,
+so that dist/ scripts and remote nodes can use them too.
+'''
+
+import math
+
+# two-sided 95% normal critical value
+DEFAULT_Z = 1.96
+# batch size for the MSER-5 warmup truncation rule
+MSER_BATCH_SIZE = 5
+
+
+def parse_samples(row, column=None):
+    '''
+    @param {String} row --- One comma-separated row of an experiment's
+    output.
+
+    @param {int or None} column --- If None, every numeric field of row
+    is a sample.  Otherwise, only the field at this index is.
+
+    @returns {list} --- Each element is a float.
+    '''
+    fields = row.split(',')
+    if column is not None:
+        if column >= len(fields):
+            return []
+        fields = [fields[column]]
+
+    samples = []
+    for field in fields:
+        try:
+            samples.append(float(field))
+        except ValueError:
+            # header or label
+            pass
+    return samples
+
+
+def quantile(sorted_samples, q):
+    '''
+    @param {list} sorted_samples --- Non-empty, ascending.
+    @returns {float} --- The q-th quantile (0 <= q <= 1), nearest rank.
+    '''
+    index = int(math.ceil(q * len(sorted_samples))) - 1
+    return sorted_samples[min(max(index, 0), len(sorted_samples) - 1)]
+
+
+def quantile_ci(sorted_samples, q, z=DEFAULT_Z):
+    '''
+    Distribution-free confidence interval for the q-th quantile, from
+    the normal approximation to the binomial distribution of ranks.
+
+    @returns {tuple} --- (low, high) sample values.
+    '''
+    n = len(sorted_samples)
+    half_width = z * math.sqrt(n * q * (1 - q))
+    low_rank = int(math.floor(n * q - half_width))
+    high_rank = int(math.ceil(n * q + half_width))
+    return (sorted_samples[max(low_rank, 0)],
+            sorted_samples[min(high_rank, n - 1)])
+
+
+def relative_half_width(low, high, estimate):
+    if estimate == 0:
+        return float('inf')
+    return (high - low) / (2. * abs(estimate))
+
+
+def mser_truncation(series, batch_size=MSER_BATCH_SIZE):
+    '''
+    Finds the end of the warmup period with the MSER-5 rule: average
+    the series in batches, then pick the truncation point that
+    minimizes the standard error of the remaining batch means.  Only
+    truncation points in the first half of the series are considered.
+
+    @returns {int} --- Number of leading samples of series to discard.
+    '''
+    num_batches = len(series) // batch_size
+    if num_batches < 2:
+        return 0
+    batch_means = [
+        sum(series[i * batch_size:(i + 1) * batch_size]) / float(batch_size)
+        for i in range(num_batches)]
+
+    # suffix sums let us evaluate every truncation point in one pass
+    suffix_sum = 0.
+    suffix_sum_sq = 0.
+    best_d = 0
+    best_mser = None
+    for d in range(num_batches - 1, -1, -1):
+        suffix_sum += batch_means[d]
+        suffix_sum_sq += batch_means[d] ** 2
+        if d > num_batches // 2:
+            continue
+        remaining = num_batches - d
+        sum_sq_dev = suffix_sum_sq - (suffix_sum ** 2) / remaining
+        mser = sum_sq_dev / (remaining ** 2)
+        if (best_mser is None) or (mser <= best_mser):
+            best_mser = mser
+            best_d = d
+    return best_d * batch_size
+
+
+def mean(values):
+    return sum(values) / float(len(values))
+
+
+def sample_variance(values):
+    '''
+    @returns {float} --- Unbiased variance; values needs at least two
+    elements.
+    '''
+    m = mean(values)
+    return sum((value - m) ** 2 for value in values) / (len(values) - 1.)
+
+
+# continued fraction evaluation of the incomplete beta function
+BETACF_MAX_ITERATIONS = 200
+BETACF_EPSILON = 3e-14
+BETACF_FPMIN = 1e-300
+# bisection steps for t_quantile; each halves the bracket
+T_QUANTILE_ITERATIONS = 100
+T_QUANTILE_BRACKET = 1e3
+
+
+def _betacf(a, b, x):
+    qab = a + b
+    qap = a + 1.
+    qam = a - 1.
+    c = 1.
+    d = 1. - qab * x / qap
+    if abs(d) < BETACF_FPMIN:
+        d = BETACF_FPMIN
+    d = 1. / d
+    h = d
+    for m in range(1, BETACF_MAX_ITERATIONS + 1):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1. + aa * d
+        if abs(d) < BETACF_FPMIN:
+            d = BETACF_FPMIN
+        c = 1. + aa / c
+        if abs(c) < BETACF_FPMIN:
+            c = BETACF_FPMIN
+        d = 1. / d
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1. + aa * d
+        if abs(d) < BETACF_FPMIN:
+            d = BETACF_FPMIN
+        c = 1. + aa / c
+        if abs(c) < BETACF_FPMIN:
+            c = BETACF_FPMIN
+        d = 1. / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.) < BETACF_EPSILON:
+            break
+    return h
+
+
+def incomplete_beta(a, b, x):
+    '''
+    @returns {float} --- The regularized incomplete beta function
+    I_x(a, b).
+    '''
+    if x <= 0.:
+        return 0.
+    if x >= 1.:
+        return 1.
+    front = math.exp(
+        math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) +
+        a * math.log(x) + b * math.log(1. - x))
+    if x < (a + 1.) / (a + b + 2.):
+        return front * _betacf(a, b, x) / a
+    return 1. - front * _betacf(b, a, 1. - x) / b
+
+
+def t_cdf(t, df):
+    '''
+    @returns {float} --- P(T <= t) for Student's t with df degrees of
+    freedom (df need not be an integer).
+    '''
+    tail = .5 * incomplete_beta(df / 2., .5, df / (df + t * t))
+    if t >= 0:
+        return 1. - tail
+    return tail
+
+
+def t_quantile(p, df):
+    '''
+    @returns {float} --- t such that t_cdf(t, df) == p.
+    '''
+    low, high = -T_QUANTILE_BRACKET, T_QUANTILE_BRACKET
+    for i in range(T_QUANTILE_ITERATIONS):
+        middle = (low + high) / 2.
+        if t_cdf(middle, df) < p:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2.
+
+
+def paired_t_interval(differences, confidence=.95):
+    '''
+    Confidence interval for the mean of paired differences.
+
+    @param {list} differences --- At least two elements.
+
+    @returns {tuple} --- (mean, low, high).
+    '''
+    n = len(differences)
+    m = mean(differences)
+    standard_error = math.sqrt(sample_variance(differences) / n)
+    half_width = t_quantile(1 - (1 - confidence) / 2., n - 1) * standard_error
+    return m, m - half_width, m + half_width
+
+
+def welch_t_test(a, b):
+    '''
+    Welch's t-test for a difference in means, without assuming equal
+    variances.
+
+    @param {list} a, b --- At least two elements each.
+
+    @returns {tuple} --- (t, degrees of freedom, two-sided p-value) of
+    mean(b) - mean(a).
+    '''
+    va = sample_variance(a) / len(a)
+    vb = sample_variance(b) / len(b)
+    if va + vb == 0:
+        if mean(a) == mean(b):
+            return 0., float('inf'), 1.
+        return float('inf') * (mean(b) - mean(a)), float('inf'), 0.
+    t = (mean(b) - mean(a)) / math.sqrt(va + vb)
+    df = (va + vb) ** 2 / (
+        va ** 2 / (len(a) - 1) + vb ** 2 / (len(b) - 1))
+    return t, df, 2 * t_cdf(-abs(t), df)
+
+
+def hedges_g(a, b):
+    '''
+    @returns {float} --- Standardized difference of means (b - a) over
+    the pooled standard deviation, corrected for small samples.
+    '''
+    na, nb = len(a), len(b)
+    pooled = math.sqrt(
+        ((na - 1) * sample_variance(a) + (nb - 1) * sample_variance(b)) /
+        (na + nb - 2.))
+    if pooled == 0:
+        return 0.
+    correction = 1 - 3. / (4 * (na + nb) - 9)
+    return correction * (mean(b) - mean(a)) / pooled
+
+
+def normal_quantile(p):
+    '''
+    @returns {float} --- z such that a standard normal is below z with
+    probability p.
+    '''
+    low, high = -T_QUANTILE_BRACKET, T_QUANTILE_BRACKET
+    for i in range(T_QUANTILE_ITERATIONS):
+        middle = (low + high) / 2.
+        if .5 * (1 + math.erf(middle / math.sqrt(2))) < p:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2.
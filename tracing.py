@@ -0,0 +1,178 @@
+#!/usr/bin/python
+
+'''
+Spans over the phases of a campaign, to show where its wall-clock time
+goes: network setup, jvm launch, the measurement itself, teardown, and
+on dist runs each host's ssh, mininet and copy steps.
+
+Tracing is off until use_tracing is called; span and record are then
+cheap no-ops.  Once on, every span of the process is kept, and at exit
+(or on finish_tracing) the campaign is written as
+
+    <fname>          --- Chrome trace json (open in chrome://tracing or
+                         https://ui.perfetto.dev); the harness is one
+                         process, each remote host another, and each
+                         thread its own track
+    <fname>.summary  --- phases ranked by total time
+
+    with tracing.span('create_bridges', num_switches=10):
+        ...
+
+Standard library only, so that dist/ scripts can trace too.
+'''
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_TRACE_FNAME = 'campaign.trace.json'
+# process the harness's own spans are on
+LOCAL_PROCESS = 'harness'
+MICROSECONDS_PER_SECOND = 1e6
+# how many phases finish_tracing prints
+TOP_PHASES = 15
+
+# If non-None, the Tracer every span is recorded on.
+TRACER = None
+
+
+class Tracer(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.begin = time.time()
+        # each element is a (name, begin, end, process, thread, args)
+        # tuple; times in seconds since the epoch
+        self.spans = []
+
+    def record(self, name, begin, end, process=LOCAL_PROCESS, args=None):
+        span = (name, begin, end, process, threading.current_thread().name,
+                args or {})
+        with self.lock:
+            self.spans.append(span)
+
+    def origin(self):
+        '''
+        @returns {float} --- When tracing began, or the earliest span
+        began if one was recorded after the fact.
+        '''
+        with self.lock:
+            return min([self.begin] + [span[1] for span in self.spans])
+
+    def trace_events(self):
+        '''
+        @returns {list} --- Chrome trace events: metadata naming each
+        process and thread, then a complete ("X") event per span.
+        '''
+        origin = self.origin()
+        with self.lock:
+            spans = list(self.spans)
+        pids = {}
+        tids = {}
+        events = []
+        for name, begin, end, process, thread, args in spans:
+            if process not in pids:
+                pids[process] = len(pids)
+                events.append({
+                    'name': 'process_name', 'ph': 'M', 'pid': pids[process],
+                    'tid': 0, 'args': {'name': process}})
+            if (process, thread) not in tids:
+                tids[(process, thread)] = len(tids)
+                events.append({
+                    'name': 'thread_name', 'ph': 'M', 'pid': pids[process],
+                    'tid': tids[(process, thread)], 'args': {'name': thread}})
+        for name, begin, end, process, thread, args in spans:
+            events.append({
+                'name': name, 'ph': 'X', 'cat': process,
+                'ts': int((begin - origin) * MICROSECONDS_PER_SECOND),
+                'dur': int((end - begin) * MICROSECONDS_PER_SECOND),
+                'pid': pids[process], 'tid': tids[(process, thread)],
+                'args': dict((key, str(value)) for key, value in args.items())})
+        return events
+
+    def summary(self):
+        '''
+        @returns {list} --- (name, count, total seconds, max seconds)
+        per span name, largest total first.  Nested spans each count,
+        so totals add up to more than the campaign's wall-clock time.
+        '''
+        by_name = {}
+        with self.lock:
+            for name, begin, end, process, thread, args in self.spans:
+                count, total, longest = by_name.get(name, (0, 0., 0.))
+                by_name[name] = (
+                    count + 1, total + end - begin, max(longest, end - begin))
+        return sorted(
+            ((name, count, total, longest)
+             for name, (count, total, longest) in by_name.items()),
+            key=lambda row: -row[2])
+
+    def write(self, fname):
+        with open(fname, 'w') as fd:
+            json.dump(
+                {'traceEvents': self.trace_events(),
+                 'displayTimeUnit': 'ms'}, fd)
+        wall = time.time() - self.origin()
+        with open(fname + '.summary', 'w') as fd:
+            fd.write('phase,count,total_seconds,max_seconds,percent_of_wall\n')
+            for name, count, total, longest in self.summary():
+                fd.write('%s,%i,%f,%f,%.1f\n' % (
+                    name, count, total, longest, 100 * total / wall))
+
+
+def use_tracing(fname=DEFAULT_TRACE_FNAME):
+    '''
+    Start recording spans, and write them to fname when the process
+    exits.
+    '''
+    global TRACER
+    TRACER = Tracer()
+    atexit.register(finish_tracing, fname)
+
+
+def finish_tracing(fname=DEFAULT_TRACE_FNAME):
+    '''
+    Write the trace and summary, print the summary's top phases, and
+    stop tracing.
+    '''
+    global TRACER
+    if TRACER is None:
+        return
+    tracer = TRACER
+    TRACER = None
+    tracer.write(fname)
+    print '\nTrace written to %s; phases by total time:' % os.path.abspath(fname)
+    for name, count, total, longest in tracer.summary()[:TOP_PHASES]:
+        print '%-28s %6i %12.3fs' % (name, count, total)
+
+
+def record(name, begin, end=None, host=None, **args):
+    '''
+    Record a span that has already happened, for phases that do not
+    fit in one with block.
+
+    @param {String or None} host --- Remote host the phase ran on;
+    None for this process.
+    '''
+    if TRACER is None:
+        return
+    if end is None:
+        end = time.time()
+    TRACER.record(name, begin, end, host or LOCAL_PROCESS, args)
+
+
+@contextmanager
+def span(name, host=None, **args):
+    '''
+    Record the with block as a span.  @see record
+    '''
+    if TRACER is None:
+        yield
+        return
+    begin = time.time()
+    try:
+        yield
+    finally:
+        record(name, begin, None, host, **args)